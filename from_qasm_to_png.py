@@ -2,15 +2,63 @@
 """
 Load one or more QASM files (from a file or an entire folder), build the corresponding Qiskit circuits,
  draw them with Matplotlib, and save to <qasm_base_name>.png inside a specified output directory.
+
+Folders are rendered in a pool of worker processes. A small manifest in the output directory records
+the hash of the QASM content and drawing options of every drawing: a file is only rendered again if
+its hash changed since the last run. A drawing the manifest does not know (e.g. drawn by an older
+version of this script) is only rendered again if it is older than its QASM file. Large circuits can
+be drawn as text (--format txt, much faster than Matplotlib) and are cut after --max-width layers,
+with a notice.
 """
 
 import os
+import json
+import hashlib
 import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from qiskit import QuantumCircuit
-import matplotlib.pyplot as plt
+
+FORMATS = ('png', 'svg', 'txt')
+MANIFEST = '.qasm_drawings.json'    # output file name -> hash of the QASM content and drawing options
+
+
+def truncate(qc: QuantumCircuit, max_width: int) -> QuantumCircuit:
+    """
+    Keep the gates of the first max_width layers of the circuit (layers as in QuantumCircuit.depth).
+
+    Returns
+    -------
+    qc : QuantumCircuit
+        The circuit itself if it is not deeper than max_width, otherwise a truncated copy.
+    """
+    if qc.depth() <= max_width:
+        return qc
+    truncated = qc.copy_empty_like()
+    level = {}  # qubit or clbit -> layers already filled on it
+    for instruction in qc.data:
+        bits = instruction.qubits + instruction.clbits
+        layer = max((level.get(bit, 0) for bit in bits), default=0)
+        if layer >= max_width:
+            continue
+        for bit in bits:
+            level[bit] = layer + 1
+        truncated.append(instruction)
+    return truncated
+
+
+def drawing_hash(qasm_path: str, scale: float, fmt: str, max_width: int) -> str:
+    with open(qasm_path, 'rb') as f:
+        digest = hashlib.sha256(f.read())
+    digest.update(json.dumps([scale, fmt, max_width]).encode())
+    return digest.hexdigest()
+
+
+def output_path_for(qasm_path: str, output_dir: str, fmt: str = 'png') -> str:
+    base = os.path.splitext(os.path.basename(qasm_path))[0]
+    return os.path.join(output_dir, f"{base}.{fmt}")
 
 
-def qasm_to_png(qasm_path: str, output_dir: str, scale: float = 1.0) -> str:
+def qasm_to_png(qasm_path: str, output_dir: str, scale: float = 1.0, fmt: str = 'png', max_width: int = None) -> str:
     """
     Load a QASM file, draw the circuit, and save as a PNG in the output directory.
 
@@ -22,6 +70,10 @@ def qasm_to_png(qasm_path: str, output_dir: str, scale: float = 1.0) -> str:
         Directory where the PNG will be saved.
     scale : float
         Scale factor for the matplotlib drawing.
+    fmt : str
+        'png' or 'svg' (Matplotlib drawings), or 'txt' (text drawing, fast).
+    max_width : int
+        If set, only the first max_width layers of the circuit are drawn.
 
     Returns
     -------
@@ -30,24 +82,104 @@ def qasm_to_png(qasm_path: str, output_dir: str, scale: float = 1.0) -> str:
     """
     # Load the circuit
     qc = QuantumCircuit.from_qasm_file(qasm_path)
-
-    # Draw with Matplotlib
-    fig = qc.draw(output='mpl', scale=scale)
+    if max_width is not None:
+        truncated = truncate(qc, max_width)
+        if truncated is not qc:
+            print(f"[{qasm_path}] only the first {max_width} of {qc.depth()} layers are drawn (see --max-width)", flush=True)
+        qc = truncated
 
     # Ensure output directory exists
     os.makedirs(output_dir, exist_ok=True)
     
     # Determine output filename
-    base = os.path.splitext(os.path.basename(qasm_path))[0]
-    output_path = os.path.join(output_dir, f"{base}.png")
-    
+    output_path = output_path_for(qasm_path, output_dir, fmt)
+
+    if fmt == 'txt':
+        with open(output_path, 'w') as out:
+            out.write(str(qc.draw(output='text', fold=-1)) + "\n")
+        return output_path
+
+    # imported here: the text mode does not need Matplotlib
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    # Draw with Matplotlib
+    fig = qc.draw(output='mpl', scale=scale)
+
     # Save and close
-    fig.savefig(output_path, bbox_inches='tight')
+    fig.savefig(output_path, bbox_inches='tight', format=fmt)
     plt.close(fig)
     
     return output_path
 
 
+def up_to_date(qasm_path: str, output_path: str, digest: str, manifest: dict) -> bool:
+    """
+    A drawing is up to date if it was drawn from the same content and options, or, when the manifest does not
+    know it (drawn by an older version of this script), if it is newer than its QASM file.
+    """
+    if not os.path.exists(output_path):
+        return False
+    recorded = manifest.get(os.path.basename(output_path))
+    if recorded is not None:
+        return recorded == digest
+    return os.path.getmtime(output_path) >= os.path.getmtime(qasm_path)
+
+
+def load_manifest(output_dir: str) -> dict:
+    try:
+        with open(os.path.join(output_dir, MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(output_dir: str, manifest: dict):
+    os.makedirs(output_dir, exist_ok=True)
+    with open(os.path.join(output_dir, MANIFEST), 'w') as out:
+        json.dump(manifest, out, indent=1, sort_keys=True)
+
+
+def render_all(qasm_files, output_dir: str, scale: float = 1.0, fmt: str = 'png', max_width: int = None,
+               jobs: int = None, force: bool = False):
+    """
+    Draw the QASM files whose drawing is not up to date, in a pool of jobs processes (default: one per core).
+
+    Returns
+    -------
+    results : list
+        (qasm_path, output_path or None if skipped, error message or None) per file, in the order of qasm_files.
+    """
+    manifest = load_manifest(output_dir)
+    results = {}
+    pending = {}
+    for qasm_file in qasm_files:
+        output_path = output_path_for(qasm_file, output_dir, fmt)
+        digest = drawing_hash(qasm_file, scale, fmt, max_width)
+        if not force and up_to_date(qasm_file, output_path, digest, manifest):
+            manifest[os.path.basename(output_path)] = digest
+            results[qasm_file] = (qasm_file, None, None)
+        else:
+            pending[qasm_file] = digest
+
+    if pending:
+        with ProcessPoolExecutor(max_workers=min(jobs or os.cpu_count(), len(pending))) as pool:
+            futures = {pool.submit(qasm_to_png, qasm_file, output_dir, scale, fmt, max_width): qasm_file
+                       for qasm_file in pending}
+            for future in as_completed(futures):
+                qasm_file = futures[future]
+                try:
+                    out = future.result()
+                    manifest[os.path.basename(out)] = pending[qasm_file]
+                    results[qasm_file] = (qasm_file, out, None)
+                except Exception as e:
+                    results[qasm_file] = (qasm_file, None, str(e))
+    save_manifest(output_dir, manifest)
+
+    return [results[qasm_file] for qasm_file in qasm_files]
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="Convert a QASM file or all QASM files in a directory to Matplotlib circuit diagrams (PNG)."
@@ -67,6 +199,29 @@ def main():
         default=1.0,
         help="Scaling factor for the circuit drawing (default: 1.0)"
     )
+    parser.add_argument(
+        '--format',
+        choices=FORMATS,
+        default='png',
+        help="Output format: png or svg (Matplotlib), or txt (text drawing, fast for large circuits) (default: png)"
+    )
+    parser.add_argument(
+        '--max-width',
+        type=int,
+        default=500,
+        help="Only draw the first MAX_WIDTH layers of deeper circuits, 0 for no limit (default: 500)"
+    )
+    parser.add_argument(
+        '-j', '--jobs',
+        type=int,
+        default=None,
+        help="Number of worker processes for a directory (default: one per core)"
+    )
+    parser.add_argument(
+        '--force',
+        action='store_true',
+        help="Draw again the circuits whose drawing is up to date"
+    )
     parser.add_argument(
         '--recursive',
         action='store_true',
@@ -76,6 +231,7 @@ def main():
 
     path = args.input_path
     processed = []
+    max_width = args.max_width or None
 
     if os.path.isdir(path):
         # Gather .qasm files
@@ -93,12 +249,16 @@ def main():
             print(f"No .qasm files found in directory: {path}")
             return
 
-        for qasm_file in processed:
-            try:
-                out = qasm_to_png(qasm_file, args.output_dir, scale=args.scale)
+        processed.sort()
+        results = render_all(processed, args.output_dir, scale=args.scale, fmt=args.format, max_width=max_width,
+                             jobs=args.jobs, force=args.force)
+        for qasm_file, out, error in results:
+            if error is not None:
+                print(f"Error processing '{qasm_file}': {error}")
+            elif out is None:
+                print(f"[{qasm_file}] up to date")
+            else:
                 print(f"[{qasm_file}] → {out}")
-            except Exception as e:
-                print(f"Error processing '{qasm_file}': {e}")
 
     else:
         # Single file
@@ -106,7 +266,7 @@ def main():
             print(f"Provided file is not a .qasm file: {path}")
             return
         try:
-            out = qasm_to_png(path, args.output_dir, scale=args.scale)
+            out = qasm_to_png(path, args.output_dir, scale=args.scale, fmt=args.format, max_width=max_width)
             print(f"Circuit diagram saved as: {out}")
         except Exception as e:
             print(f"Error processing '{path}': {e}")
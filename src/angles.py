@@ -0,0 +1,110 @@
+"""
+Pool of the constants the passes create for the angles of new gates.
+
+Without it every rewrite inserts fresh py.Constant statements (three per fused
+U), and the duplicates and dead ones pile up until the CLEANUP fixpoint, so
+every const.Propagate and Walk in between traverses them. A ConstantPool
+keeps one constant per value and block: it reuses the constants already in
+the block and hoists the ones it hands out to the top of the block, where
+they dominate every use. Floats within atol share a constant, and an angle
+given with its period is first reduced as Simplify2PiConst reduces it, so
+2π-equivalent angles share one too. The IR then grows with the number of
+distinct angles, not with the number of rewrites.
+"""
+import math
+
+from kirin import ir
+from kirin.analysis import const
+from kirin.dialects import py
+
+EPS = 1e-11             # not all constants are 100% accurate on 2π, see Simplify2PiConst
+DEFAULT_ATOL = 1e-12    # floats closer than this share a constant (su2.DEFAULT_ATOL)
+
+U_THETA_PERIOD = 4 * math.pi    # U(θ + 2π, φ, λ) = -U(θ, φ, λ): only 4π is a period of θ
+ANGLE_PERIOD = 2 * math.pi
+
+
+def reduce(value: float, period: float, eps = EPS) -> float:
+    """
+    @returns value in [0, period) if |value| >= period (up to eps), else value unchanged
+    """
+    if abs(value) < period - eps:
+        return value
+    b = period - eps if value < period else period
+    value = value - (value // b) * b
+    return 0.0 if value < 1e-10 else value
+
+
+class ConstantPool:
+    def __init__(self, block: ir.Block, atol = DEFAULT_ATOL):
+        self.block = block
+        self.atol = atol
+        self.constants: dict[tuple, py.Constant] = {}   # key → constant, see key()
+        self.hoisted: set[py.Constant] = set()          # the constants known to be at the top of block
+        for stmt in block.stmts:
+            if isinstance(stmt, py.Constant):
+                self.constants.setdefault(self.key(stmt.value.unwrap()), stmt)
+
+    def key(self, value) -> tuple:
+        # floats by bucket of width atol, the neighbour buckets are searched as well
+        if type(value) is float and self.atol > 0 and math.isfinite(value):
+            return (float, round(value / self.atol))
+        return (type(value), value)
+
+    def find(self, value) -> py.Constant | None:
+        key = self.key(value)
+        candidates = [key]
+        if key[0] is float and type(key[1]) is int:
+            candidates += [(float, key[1] - 1), (float, key[1] + 1)]
+        for candidate in candidates:
+            stmt = self.constants.get(candidate)
+            if stmt is None:
+                continue
+            if stmt.parent_block is not self.block:
+                del self.constants[candidate]   # deleted since
+                continue
+            found = stmt.value.unwrap()
+            if type(found) is not type(value):
+                continue
+            if type(value) is not float:
+                if found == value:
+                    return stmt
+            # 0.0 and -0.0 print differently
+            elif abs(found - value) <= self.atol and math.copysign(1, found) == math.copysign(1, value):
+                return stmt
+        return None
+
+    def hoist(self, stmt: py.Constant):
+        first = self.block.first_stmt
+        if stmt is not first:
+            stmt.detach()
+            if first is None:
+                self.block.stmts.append(stmt)
+            else:
+                stmt.insert_before(first)
+        self.hoisted.add(stmt)
+
+    def get(self, value) -> ir.SSAValue:
+        """
+        @returns a constant of value (or within atol of it) defined at the top of the block
+        """
+        stmt = self.find(value)
+        if stmt is None:
+            stmt = py.Constant(value)
+            self.constants[self.key(value)] = stmt
+        if stmt not in self.hoisted:
+            self.hoist(stmt)
+        stmt.result.hints["const"] = const.Value(stmt.value.unwrap())
+        return stmt.result
+
+    def angle(self, value: float, period = ANGLE_PERIOD) -> ir.SSAValue:
+        """
+        @returns a constant of value reduced by period (see reduce), None for no reduction
+        """
+        return self.get(value if period is None else reduce(float(value), period))
+
+    def u_angles(self, theta: float, phi: float, lam: float) -> tuple[ir.SSAValue, ...]:
+        """
+        @returns the constants of the angles of U(theta, phi, lam)
+        """
+        return (self.angle(theta, U_THETA_PERIOD), self.angle(phi), self.angle(lam))
@@ -0,0 +1,280 @@
+"""
+Autotuning mode: searches pass pipelines per circuit instead of the do* flags.
+
+The variants are the product of the dimensions of a search space, each a list
+of alternative pipeline segments (text as in pipeline.PassManager.parse, ""
+to skip): pass subsets, their order and their options (e.g. the fusion
+tolerance of merge). The variants form a tree, since they share prefixes:
+every segment runs once per node, in a pool of worker processes, and the
+method is handed from a node to its children as a gate_table.GateTable (a few
+NumPy arrays), so rydberg runs once per circuit, not once per variant. A
+method the table cannot hold is lowered again and its prefix replayed.
+
+Each variant is scored by a cost model on the metrics of its output file, the
+sequential QASM lowered again (see COST_WEIGHTS, lower is better). The variants are then checked against the input circuit in
+score order (equivalence.check, exact), until one reaches MIN_FIDELITY: it is
+written to the output folder, and every variant goes to the leaderboard. After
+maxChecks rejections the circuit is given up (the variants usually share the
+pass that breaks it).
+The configured pipeline is always a candidate, so the winner is never worse
+than what compiler.py would have emitted.
+"""
+import io
+import json
+import math
+import os
+import time
+import traceback
+from contextlib import redirect_stdout
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import metrics
+import utils
+import workers
+from pipeline import PassManager
+
+# dimension → alternative segments, the variants are their product (the default pipeline is one of them)
+SEARCH_SPACE = (
+    ("rydberg",),
+    ("", "kak"),
+    ("", "merge", "peephole,merge", "remove2pi,peephole,merge", "merge,peephole", "peephole,merge:atol=1e-9"),
+    ("", "parallelise", "schedule", "schedule,global"),
+)
+
+# cost model: weighted sum of the output metrics (see metrics.CircuitMetrics.flat). Two-qubit gates dominate
+# the error of a neutral-atom circuit, moments its duration; statements (a parallel or global gate is one)
+# and single-qubit pulses come last
+COST_WEIGHTS = {"two_qubit_gates": 10.0, "depth": 2.0, "gates": 1.0, "pulses": 0.5}
+MIN_FIDELITY = 1 - 1e-6     # below this state fidelity a variant is rejected
+maxChecks = 10              # variants checked per circuit before giving up (None: all)
+
+
+def load_space(path) -> tuple:
+    """
+    Reads a search space from a JSON file: a list of dimensions (or an object with it under "space"),
+    each a list of pipeline texts
+    """
+    with open(path) as f:
+        spec = json.load(f)
+    if isinstance(spec, dict):
+        spec = spec["space"]
+    return tuple(tuple(dimension) for dimension in spec)
+
+def score(circuit_metrics: dict) -> float:
+    """
+    @returns the cost of a circuit from its metrics (see metrics.CircuitMetrics.to_dict), lower is better
+    """
+    row = metrics.CircuitMetrics.from_dict(circuit_metrics).flat()
+    return sum(weight * row[key] for key, weight in COST_WEIGHTS.items())
+
+
+# -- workers ------------------------------------------------------------------
+
+def run_segment(source: str, name: str, before: list, table, segment: list, evaluate = False) -> dict:
+    """
+    Worker: runs the pipeline steps segment on the circuit after the steps before
+    @param table: the circuit after before, as a GateTable, None to lower source and replay before
+    @param evaluate: also return the QASM output and its metrics
+    @returns a dict with table (None if it cannot hold the result), seconds, metrics, qasm and error
+    """
+    import gate_table
+    import qasm_writer
+    from ir_to_qiskit import UnsupportedStatement
+
+    result = {"table": None, "seconds": 0.0, "metrics": None, "qasm": None, "error": None}
+    try:
+        with redirect_stdout(io.StringIO()):
+            if table is None:
+                method = utils.loadQASMString(source, name)
+                PassManager(before).run(method)
+            else:
+                method = gate_table.to_method(table, name)
+            start = time.perf_counter()
+            PassManager(segment).run(method)
+            result["seconds"] = time.perf_counter() - start
+        if evaluate:
+            # scored on what is written: the sequential QASM, lowered again (the parallel and
+            # global statements of method are one gate per qubit there)
+            result["qasm"] = qasm_writer.emit_str(method)
+            with redirect_stdout(io.StringIO()):
+                written = utils.loadQASMString(result["qasm"], name)
+            result["metrics"] = metrics.circuit_metrics(written).to_dict()
+        else:
+            try:
+                result["table"] = gate_table.from_method(method)
+            except UnsupportedStatement:
+                pass
+    except Exception:
+        result["error"] = traceback.format_exc()
+    return result
+
+def check_variant(source: str, name: str, qasm: str) -> dict:
+    """
+    Worker: the state fidelity of the output qasm against the input circuit (see equivalence.check)
+    @returns the result of equivalence.check, or a dict with the error
+    """
+    import equivalence
+    from qiskit import QuantumCircuit
+
+    try:
+        with redirect_stdout(io.StringIO()):
+            initial = utils.circuit_to_qiskit(utils.loadQASMString(source, name))
+        return equivalence.check(initial, QuantumCircuit.from_qasm_str(qasm))
+    except Exception as e:
+        return {"fidelity": None, "error": f"{type(e).__name__}: {e}"}
+
+
+# -- search -------------------------------------------------------------------
+
+@dataclass
+class _Node:
+    circuit: str
+    depth: int                  # dimensions done
+    steps: list                 # (name, options) steps so far
+    table: object = None        # the circuit after steps, see run_segment
+    seconds: float = 0.0        # pass time of steps
+
+@dataclass
+class _Circuit:
+    name: str
+    source: str
+    variants: list = field(default_factory=list)    # leaderboard entries
+    checking: int = 0           # index, in score order, of the variant being checked
+    best: dict | None = None
+
+
+def _entry(pipeline: PassManager, node_seconds: float, result: dict, baseline = False) -> dict:
+    entry = {
+        "pipeline": str(pipeline),
+        "baseline": baseline,
+        "status": "scored" if result["error"] is None else "error",
+        "score": None,
+        "seconds": node_seconds + result["seconds"],
+        "metrics": result["metrics"],
+        "fidelity": None,
+        "qasm": result["qasm"],
+        "error": result["error"],
+    }
+    if result["metrics"] is not None:
+        entry["score"] = score(result["metrics"])
+    return entry
+
+def autotune(paths, output_folder, jobs: int | None = None, space = SEARCH_SPACE, baseline: PassManager = None) -> list[dict]:
+    """
+    Searches the pipeline variants of space (and baseline, if given) for every .qasm file of paths
+    in a pool of `jobs` processes (None = one per core), and writes the best verified output of each
+    to output_folder. A segment or check that kills its worker process is recorded as an error
+    (see workers.WorkerPool), the search goes on
+    @returns per circuit: name, best (its leaderboard entry, None if no variant was verified)
+    and leaderboard (the variants by score, the unchecked and failed ones last)
+    """
+    segments = [[PassManager.parse(text).steps for text in dimension] for dimension in space]
+    circuits = {Path(path).stem: _Circuit(Path(path).stem, Path(path).read_text()) for path in paths}
+    os.makedirs(output_folder, exist_ok=True)
+
+    with workers.WorkerPool(jobs) as pool:
+        def expand(node: _Node):
+            circuit = circuits[node.circuit]
+            last = node.depth + 1 == len(segments)
+            for segment in segments[node.depth]:
+                if not segment and not last:
+                    # nothing to run: the child is the node itself
+                    expand(_Node(node.circuit, node.depth + 1, node.steps, node.table, node.seconds))
+                    continue
+                pool.submit((node, segment), run_segment, circuit.source, circuit.name, node.steps, node.table, segment, last)
+
+        for name, circuit in circuits.items():
+            expand(_Node(name, 0, []))
+            if baseline is not None:
+                pool.submit((_Node(name, len(segments), []), None), run_segment, circuit.source, name, [], None, baseline.steps, True)
+
+        seen = {}   # (circuit, pipeline) → entry, different paths may give the same pipeline
+        for (node, segment), result, error in pool.completed():
+            if error is not None:
+                # the worker died (run_segment catches the exceptions of the passes)
+                result = {"table": None, "seconds": 0.0, "metrics": None, "qasm": None, "error": error}
+            circuit = circuits[node.circuit]
+            if segment is None:
+                pipeline = baseline
+                entry = _entry(pipeline, 0.0, result, baseline=True)
+            elif node.depth + 1 == len(segments):
+                pipeline = PassManager(node.steps + segment)
+                entry = _entry(pipeline, node.seconds, result)
+            elif result["error"] is not None:
+                # the whole subtree fails
+                circuit.variants.append(_entry(PassManager(node.steps + segment), node.seconds, result))
+                continue
+            else:
+                expand(_Node(node.circuit, node.depth + 1, node.steps + segment, result["table"],
+                             node.seconds + result["seconds"]))
+                continue
+            key = (circuit.name, entry["pipeline"])
+            if key in seen:
+                seen[key]["baseline"] |= entry["baseline"]
+                continue
+            seen[key] = entry
+            circuit.variants.append(entry)
+
+        # verification, best score first, until a variant passes
+        def ranked(circuit: _Circuit) -> list[dict]:
+            return sorted((v for v in circuit.variants if v["score"] is not None),
+                          key=lambda v: (v["score"], not v["baseline"], v["seconds"]))
+
+        def check_next(circuit: _Circuit):
+            candidates = ranked(circuit)
+            if circuit.checking < len(candidates) and (maxChecks is None or circuit.checking < maxChecks):
+                entry = candidates[circuit.checking]
+                pool.submit((circuit, entry), check_variant, circuit.source, circuit.name, entry["qasm"])
+
+        for circuit in circuits.values():
+            check_next(circuit)
+        for (circuit, entry), check, error in pool.completed():
+            if error is not None:
+                check = {"fidelity": None, "error": error}
+            entry["fidelity"] = check["fidelity"]
+            if check["fidelity"] is not None and check["fidelity"] >= MIN_FIDELITY:
+                entry["status"] = "verified"
+                circuit.best = entry
+                continue
+            entry["status"] = "rejected" if check["fidelity"] is not None else "unverifiable"
+            entry["error"] = check.get("error")
+            circuit.checking += 1
+            check_next(circuit)
+
+    results = []
+    order = {"verified": 0, "scored": 1, "rejected": 2, "unverifiable": 2, "error": 3}
+    for circuit in circuits.values():
+        if circuit.best is not None:
+            with open(Path(output_folder) / f"{circuit.name}.qasm", "w") as out:
+                out.write(circuit.best["qasm"])
+        leaderboard = sorted(circuit.variants, key=lambda v: (order[v["status"]], v["score"] if v["score"] is not None else math.inf))
+        results.append({"name": circuit.name, "best": circuit.best, "leaderboard": leaderboard})
+    return sorted(results, key=lambda r: r["name"])
+
+
+def print_leaderboard(results: list[dict], top = 5):
+    """
+    Prints the top variants of each circuit
+    """
+    for result in results:
+        utils.sep_print(f"{result['name']}: {len(result['leaderboard'])} variants")
+        print(f"  {'score':>9} {'2q':>5} {'depth':>6} {'gates':>6} {'pulses':>7} {'time':>7}  {'status':<12} pipeline")
+        for entry in result["leaderboard"][:top]:
+            m = metrics.CircuitMetrics.from_dict(entry["metrics"]).flat() if entry["metrics"] else {}
+            score_text = "-" if entry["score"] is None else f"{entry['score']:.1f}"
+            print(f"  {score_text:>9} {m.get('two_qubit_gates', '-'):>5} {m.get('depth', '-'):>6} "
+                  f"{m.get('gates', '-'):>6} {m.get('pulses', '-'):>7} {entry['seconds']:>6.2f}s  {entry['status']:<12} "
+                  f"{entry['pipeline']}{' (configured)' if entry['baseline'] else ''}")
+        if result["best"] is None:
+            print("  no variant could be verified, nothing written")
+
+def write_leaderboard(results: list[dict], path):
+    """
+    Writes the leaderboards as JSON, without the QASM outputs
+    """
+    data = [{**result, "best": result["best"] and result["best"]["pipeline"],
+             "leaderboard": [{k: v for k, v in entry.items() if k != "qasm"} for entry in result["leaderboard"]]}
+            for result in results]
+    with open(path, "w") as out:
+        json.dump(data, out, indent=2)
@@ -0,0 +1,126 @@
+"""
+Batch compilation mode: spreads the per-file work of compiler.optimize_qasm
+(lowering, passes, validation, emission) over a pool of worker processes.
+"""
+import io
+import os
+import time
+import traceback
+from contextlib import redirect_stdout
+from pathlib import Path
+
+import utils
+import tracing
+import workers
+from qiskit import QuantumCircuit
+
+
+def compile_file(path, output_folder, use_cache = True, trace = False, trace_memory = False, pipeline = None) -> dict:
+    """
+    Worker: lowers, optimizes, validates and emits a single .qasm file (see compiler.compile_qasm).
+    Never raises, failures are reported in the returned summary.
+    @param pipeline: the pipeline.PassManager to run (default: compiler.default_pipeline())
+    @param trace: if true the pipeline steps are traced (see tracing.Tracer), the events are returned under "trace"
+    @returns a dict with name, status, cached, timings (seconds), gate counts, metrics, fidelity, error and the captured log
+    """
+    import compiler # imported here, compiler imports this module
+
+    name = Path(path).stem
+    summary = {
+        "name": name,
+        "status": "ok",
+        "cached": False,
+        "parse_s": 0.0,
+        "compile_s": 0.0,
+        "validate_s": 0.0,
+        "total_s": 0.0,
+        "counts_before": None,
+        "counts_after": None,
+        "metrics": None,
+        "fidelity": None,
+        "fidelity_original": None,
+        "error": None,
+        "log": "",
+        "trace": None,
+    }
+    tracer = tracing.Tracer(memory=trace_memory) if trace else None
+
+    log = io.StringIO()
+    start = time.perf_counter()
+    try:
+        with redirect_stdout(log), tracing.active(tracer):
+            with tracing.span("compile_qasm", circuit=name):
+                record = compiler.compile_qasm(path, output_folder, use_cache=use_cache, pipeline=pipeline)
+            qasm = record.pop("qasm")
+            summary.update(record)
+
+            # hand-improved circuits are also checked against their original file
+            orgPath = Path(path).with_name(name.split("_")[0] + ".qasm")
+            if name.endswith("_improved") and orgPath.exists():
+                t = time.perf_counter()
+                with tracing.span("validate_improved", circuit=name):
+                    qcOrg = utils.circuit_to_qiskit(utils.loadQASM(orgPath))
+                    qcImprov = QuantumCircuit.from_qasm_str(qasm)
+                    summary["fidelity_original"] = compiler.validate_improved(name, qcOrg, qcImprov)
+                summary["validate_s"] = time.perf_counter() - t
+    except Exception:
+        summary["status"] = "error"
+        summary["error"] = traceback.format_exc()
+
+    summary["total_s"] = time.perf_counter() - start
+    summary["log"] = log.getvalue()
+    if tracer is not None:
+        summary["trace"] = tracer.events
+    return summary
+
+
+def compile_batch(input_folder, output_folder, jobs: int | None = None, use_cache = True, select = None, regex = False,
+                  trace = False, trace_memory = False, pipeline = None) -> list[dict]:
+    """
+    Compiles every .qasm file in input_folder (or those matching select, see utils.importQASM)
+    in a pool of `jobs` processes (None = one per core).
+    One failing circuit does not stop the rest of the batch, nor does one that kills its worker
+    process: the pool is restarted and the circuits it was running are retried (see workers.WorkerPool).
+    @returns the per-file summaries (see compile_file), sorted by name
+    """
+    catalog = utils.importQASM(input_folder, select=select, regex=regex)
+    paths = [catalog.path(name) for name in catalog]
+    os.makedirs(output_folder, exist_ok=True)
+
+    summaries = []
+    with workers.WorkerPool(jobs) as pool:
+        for path in paths:
+            pool.submit(path, compile_file, str(path), output_folder, use_cache, trace, trace_memory, pipeline)
+        for path, summary, error in pool.completed():
+            if error is not None:
+                # the worker itself died (e.g. out of memory)
+                summary = {"name": Path(path).stem, "status": "error", "error": error}
+            print(f"[{summary['status']}] {summary['name']}")
+            summaries.append(summary)
+
+    return sorted(summaries, key=lambda s: s["name"])
+
+
+def print_summary(summaries: list[dict]):
+    """
+    Prints one line per file with status, timings and U/CZ counts before → after
+    """
+    def fmt_counts(counts):
+        if counts is None:
+            return "-"
+        return f"U {counts['u'] + counts['parallel_u']}, CZ {counts['cz'] + counts['parallel_cz']}"
+
+    utils.sep_print("Batch summary:")
+    print(f"{'name':<20} {'status':<6} {'parse':>7} {'compile':>8} {'total':>7}  gates before → after")
+    for s in summaries:
+        print(
+            f"{s['name']:<20} {s['status'] + ('*' if s.get('cached') else ''):<6} "
+            f"{s.get('parse_s', 0):>6.2f}s {s.get('compile_s', 0):>7.2f}s {s.get('total_s', 0):>6.2f}s  "
+            f"{fmt_counts(s.get('counts_before'))} → {fmt_counts(s.get('counts_after'))}"
+        )
+
+    failed = [s for s in summaries if s["status"] != "ok"]
+    for s in failed:
+        utils.sep_print(f"{s['name']} failed:")
+        print(s["error"])
+    print(f"{len(summaries) - len(failed)}/{len(summaries)} circuits compiled ({sum(1 for s in summaries if s.get('cached'))} from cache, marked *)")
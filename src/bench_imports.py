@@ -0,0 +1,136 @@
+"""
+Import-time benchmark of the entry points.
+
+Imports each module in a fresh interpreter, keeps the fastest of --repeat
+runs and checks which heavy optional dependencies got loaded: simulation
+(qiskit_aer), plotting (matplotlib), the IBM runtime and cirq (only the native
+gate rewrite needs it) must be imported by the features that use them, not by
+importing the module. Results are written as JSON.
+
+A heavy dependency loaded at import time is always reported as a regression.
+With --compare BASELINE.json the import times are also checked against a
+previous results file, as in bench_passes.py, and the script exits with
+status 1 on any regression.
+
+Usage: py bench_imports.py [-m MODULE] [--repeat N] [-o results.json] [--compare baseline.json]
+"""
+import argparse
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+from cache import toolchain_versions
+
+LAZY = ("cirq", "qiskit_aer", "qiskit_ibm_runtime", "matplotlib")
+# the client side of the daemon must not load the toolchain at all
+THIN = LAZY + ("numpy", "qiskit", "kirin", "bloqade")
+
+# module → the dependencies importing it must not load
+ENTRY_POINTS = {
+    "daemon": THIN,
+    "cache": THIN,
+    "metrics": LAZY,
+    "passes": LAZY,
+    "validate": LAZY,
+    "utils": LAZY,
+    "batch": LAZY,
+    "compiler": LAZY,
+    "gate_table": LAZY,
+    "autotune": LAZY,
+}
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+print(json.dumps({{"seconds": seconds, "loaded": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def measure(module: str, repeat: int) -> dict:
+    """
+    @returns the fastest import time of module over repeat fresh interpreters, and the heavy dependencies it loaded
+    """
+    best = None
+    for _ in range(repeat):
+        run = subprocess.run([sys.executable, "-c", PROBE.format(module=module, heavy=ENTRY_POINTS[module])],
+                             capture_output=True, text=True, check=True, cwd=Path(__file__).parent)
+        # the module may print while imported: the probe's line is the last one
+        result = json.loads(run.stdout.strip().splitlines()[-1])
+        if best is None or result["seconds"] < best["seconds"]:
+            best = result
+    return best
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results: dict, baseline: dict, tolerance: float, min_seconds: float) -> list[str]:
+    """
+    @returns one message per module slower than (1 + tolerance) times the baseline
+    (modules under min_seconds in both runs are ignored)
+    """
+    problems = []
+    for module, timing in results["modules"].items():
+        old = baseline["modules"].get(module)
+        if old is None or max(timing["seconds"], old["seconds"]) < min_seconds:
+            continue
+        ratio = timing["seconds"] / old["seconds"]
+        if ratio > 1 + tolerance:
+            problems.append(f"{module}: {old['seconds']:.3f}s -> {timing['seconds']:.3f}s ({ratio:.2f}x)")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="py bench_imports.py", description=__doc__.split("\n\n")[0])
+    parser.add_argument("-m", "--module", action="append", choices=ENTRY_POINTS,
+                        help="Only measure this module (repeatable), default all")
+    parser.add_argument("--repeat", type=int, default=3, help="Fresh interpreters per module, the fastest counts (default 3)")
+    parser.add_argument("-o", "--output", default="bench_imports.json", help="Results file (default bench_imports.json)")
+    parser.add_argument("--compare", metavar="BASELINE", help="Regression mode: compare with a previous results file")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Relative slowdown reported as a regression (default 0.25)")
+    parser.add_argument("--min-seconds", type=float, default=0.1,
+                        help="Ignore the modules faster than this in both runs (default 0.1)")
+    args = parser.parse_args()
+
+    results = {
+        "commit": git_commit(),
+        "versions": toolchain_versions(),
+        "python": sys.version.split()[0],
+        "modules": {},
+    }
+    problems = []
+
+    print(f"{'module':<10} {'time':>9}  heavy dependencies loaded")
+    for module in args.module or ENTRY_POINTS:
+        timing = measure(module, args.repeat)
+        results["modules"][module] = timing
+        print(f"{module:<10} {timing['seconds']:>8.3f}s  {', '.join(timing['loaded']) or '-'}")
+        if timing["loaded"]:
+            problems.append(f"{module}: imports {', '.join(timing['loaded'])}")
+
+    with open(args.output, "w") as out:
+        json.dump(results, out, indent=2)
+    print("Results written to", args.output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        problems += compare(results, baseline, args.tolerance, args.min_seconds)
+        print(f"Compared with {args.compare} (commit {baseline.get('commit')}):")
+    for problem in problems:
+        print("  REGRESSION", problem)
+    if problems:
+        sys.exit(1)
+    if args.compare:
+        print("  no regression")
+
+
+if __name__ == "__main__":
+    main()
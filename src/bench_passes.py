@@ -0,0 +1,225 @@
+"""
+Scaling benchmark of the pass pipeline on synthetic circuits.
+
+Generates parameterized families at growing sizes (QFT like qft1/qft2, GHZ
+ladders, surface-code syndrome rounds on a grid like 4.qasm), lowers them and
+runs RydbergRewrite, MergeConsecutiveU and NativeParallelisationPass, recording
+time and throughput (input gates/s) per step, optionally peak memory, and the
+output gate counts. Results are written as JSON.
+
+With --compare BASELINE.json the run is checked against a previous results
+file: a step slower by more than --tolerance, or different output gate counts,
+is reported and the script exits with status 1.
+
+Usage: py bench_passes.py [-f FAMILY] [--max-gates N] [--memory] [-o results.json] [--compare baseline.json]
+"""
+import argparse
+import io
+import json
+import math
+import subprocess
+import sys
+from contextlib import redirect_stdout
+
+import utils
+import passes
+import metrics
+import tracing
+from cache import toolchain_versions
+
+HEADER = 'OPENQASM 2.0;\ninclude "qelib1.inc";\n\n'
+
+
+def qft(n: int) -> str:
+    """
+    QFT on n qubits, controlled phases decomposed into rz and cx as in qft2.qasm
+    """
+    lines = [f"qreg q[{n}];"]
+    for j in range(n):
+        lines.append(f"h q[{j}];")
+        for k in range(j + 1, n):
+            half = 1 / 2**(k - j + 1)     # half the controlled phase, in units of pi
+            lines += [
+                f"rz(pi*{half!r}) q[{j}];",
+                f"cx q[{j}],q[{k}];",
+                f"rz(-pi*{half!r}) q[{k}];",
+                f"cx q[{j}],q[{k}];",
+                f"rz(pi*{half!r}) q[{k}];",
+            ]
+    return HEADER + "\n".join(lines) + "\n"
+
+def ghz(n: int) -> str:
+    """
+    GHZ state on n qubits by a CX ladder
+    """
+    lines = [f"qreg q[{n}];", "h q[0];"]
+    lines += [f"cx q[{i}],q[{i + 1}];" for i in range(n - 1)]
+    return HEADER + "\n".join(lines) + "\n"
+
+def surface(d: int, rounds: int | None = None) -> str:
+    """
+    `rounds` (default d) syndrome-extraction rounds on a d x d grid of data qubits,
+    one ancilla per interior plaquette, X and Z plaquettes in a checkerboard
+    """
+    rounds = d if rounds is None else rounds
+    plaquettes = [(i, j) for i in range(d - 1) for j in range(d - 1)]
+    lines = [f"qreg q[{d * d + len(plaquettes)}];"]
+
+    for _ in range(rounds):
+        xs = [d * d + k for k, (i, j) in enumerate(plaquettes) if (i + j) % 2 == 0]
+        lines += [f"h q[{a}];" for a in xs]
+        # one corner per step, as the interleaved CX layers of 4.qasm
+        for di, dj in ((0, 0), (0, 1), (1, 0), (1, 1)):
+            for k, (i, j) in enumerate(plaquettes):
+                anc, data = d * d + k, (i + di) * d + (j + dj)
+                if (i + j) % 2 == 0:
+                    lines.append(f"cx q[{anc}],q[{data}];")
+                else:
+                    lines.append(f"cx q[{data}],q[{anc}];")
+        lines += [f"h q[{a}];" for a in xs]
+    return HEADER + "\n".join(lines) + "\n"
+
+FAMILIES = {
+    "qft": (qft, [4, 8, 16, 32, 64, 128]),
+    "ghz": (ghz, [16, 128, 1024, 8192, 65536]),
+    "surface": (surface, [3, 5, 9, 15, 25, 41]),
+}
+
+STEPS = (
+    ("RydbergRewrite", lambda c: passes.RydbergRewrite(c)),
+    ("MergeConsecutiveU", lambda c: passes.MergeConsecutiveU(c.dialects)(c)),
+    ("NativeParallelisationPass", lambda c: passes.NativeParallelisationPass(c)),
+)
+
+
+def source_gates(source: str) -> int:
+    # the generators write one gate per line
+    return sum(1 for line in source.splitlines() if line and not line.startswith(("qreg", "OPENQASM", "include")))
+
+def run_case(name: str, source: str, memory = False) -> dict:
+    """
+    Lowers source and runs the pipeline steps on it
+    @returns the gate count, per-step timings (and peak memory) and the output metrics
+    """
+    tracer = tracing.Tracer(memory=memory)
+    with redirect_stdout(io.StringIO()), tracing.active(tracer):
+        with tracing.span("lower"):
+            circuit = utils.loadQASMString(source, name)
+        before = metrics.circuit_metrics(circuit)
+        for step, run in STEPS:
+            with tracing.span(step):
+                run(circuit)
+    after = metrics.circuit_metrics(circuit)
+
+    gates = sum(before.gate_counts.values())
+    steps = {}
+    # only the top-level spans, the passes open nested ones
+    for event in tracer.events:
+        if event["name"] == "lower" or event["name"] in dict(STEPS):
+            seconds = event["dur"] / 1e6
+            steps[event["name"]] = {
+                "seconds": seconds,
+                "gates_per_s": gates / seconds if seconds > 0 else math.inf,
+                "peak_bytes": event["args"].get("peak_bytes"),
+            }
+    return {
+        "qubits": before.num_qubits,
+        "gates": gates,
+        "steps": steps,
+        "counts_after": metrics.gate_counts(after),
+        "depth_after": after.depth,
+    }
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results: dict, baseline: dict, tolerance: float, min_seconds: float) -> list[str]:
+    """
+    @returns one message per step slower than (1 + tolerance) times the baseline
+    (steps under min_seconds in both runs are ignored) and per changed output gate count
+    """
+    old_cases = {(c["family"], c["size"]): c for c in baseline["cases"]}
+    problems = []
+    for case in results["cases"]:
+        old = old_cases.get((case["family"], case["size"]))
+        if old is None:
+            continue
+        label = f"{case['family']}({case['size']})"
+        for step, timing in case["steps"].items():
+            old_timing = old["steps"].get(step)
+            if old_timing is None or max(timing["seconds"], old_timing["seconds"]) < min_seconds:
+                continue
+            ratio = timing["seconds"] / old_timing["seconds"]
+            if ratio > 1 + tolerance:
+                problems.append(f"{label} {step}: {old_timing['seconds']:.3f}s -> {timing['seconds']:.3f}s ({ratio:.2f}x)")
+        if case["counts_after"] != old["counts_after"]:
+            problems.append(f"{label} output gate counts: {old['counts_after']} -> {case['counts_after']}")
+    return problems
+
+def main():
+    parser = argparse.ArgumentParser(prog="py bench_passes.py", description=__doc__.split("\n\n")[0])
+    parser.add_argument("-f", "--family", action="append", choices=FAMILIES,
+                        help="Only run this family (repeatable), default all")
+    parser.add_argument("--max-gates", type=int, default=1000,
+                        help="Skip the sizes generating more than this many gates (default 1000)")
+    parser.add_argument("--memory", action="store_true",
+                        help="Also record the peak memory of every step, in a second run (tracemalloc slows the timed one down)")
+    parser.add_argument("-o", "--output", default="bench_passes.json", help="Results file (default bench_passes.json)")
+    parser.add_argument("--compare", metavar="BASELINE", help="Regression mode: compare with a previous results file")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Relative slowdown reported as a regression (default 0.25)")
+    parser.add_argument("--min-seconds", type=float, default=0.05,
+                        help="Ignore the steps faster than this in both runs (default 0.05)")
+    args = parser.parse_args()
+
+    results = {
+        "commit": git_commit(),
+        "versions": toolchain_versions(),
+        "python": sys.version.split()[0],
+        "cases": [],
+    }
+
+    # the first lowering and rewrite of a process pay for kirin's lazy initialization
+    run_case("warmup", ghz(2))
+
+    print(f"{'case':<16} {'qubits':>6} {'gates':>7} {'step':<26} {'time':>9} {'gates/s':>10} {'peak mem':>9}")
+    for family in args.family or FAMILIES:
+        generate, sizes = FAMILIES[family]
+        for size in sizes:
+            source = generate(size)
+            if source_gates(source) > args.max_gates:
+                break
+            case = {"family": family, "size": size, **run_case(f"{family}_{size}", source)}
+            if args.memory:
+                peaks = run_case(f"{family}_{size}", source, memory=True)["steps"]
+                for step, timing in case["steps"].items():
+                    timing["peak_bytes"] = peaks[step]["peak_bytes"]
+            results["cases"].append(case)
+
+            for step, timing in case["steps"].items():
+                peak = "-" if timing["peak_bytes"] is None else f"{timing['peak_bytes'] / 2**20:.1f}MiB"
+                print(f"{family + f'({size})':<16} {case['qubits']:>6} {case['gates']:>7} {step:<26} "
+                      f"{timing['seconds']:>8.3f}s {timing['gates_per_s']:>10.0f} {peak:>9}")
+
+    with open(args.output, "w") as out:
+        json.dump(results, out, indent=2)
+    print("Results written to", args.output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        problems = compare(results, baseline, args.tolerance, args.min_seconds)
+        print(f"Compared with {args.compare} (commit {baseline.get('commit')}):")
+        for problem in problems:
+            print("  REGRESSION", problem)
+        if problems:
+            sys.exit(1)
+        print("  no regression")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Microbenchmark of the su2 fusion kernel against the scalar cmath implementation
+computeProductMatrix used before it (kept below as legacyComputeProductMatrix).
+
+Usage: py bench_su2.py [n_gates]
+"""
+import cmath
+import math
+import sys
+import time
+
+import numpy as np
+
+import su2
+
+
+def legacyComputeProductMatrix(theta1, phi1, lam1, theta2, phi2, lam2):
+    # the former computeProductMatrix, verbatim apart from the duplicated product
+    a00 = math.cos(theta1/2)
+    a01 = -cmath.exp(1j * lam1) * math.sin(theta1/2)
+    a10 =  cmath.exp(1j * phi1) * math.sin(theta1/2)
+    a11 =  cmath.exp(1j * (phi1 + lam1)) * math.cos(theta1/2)
+
+    b00 = math.cos(theta2/2)
+    b01 = -cmath.exp(1j * lam2) * math.sin(theta2/2)
+    b10 =  cmath.exp(1j * phi2) * math.sin(theta2/2)
+    b11 =  cmath.exp(1j * (phi2 + lam2)) * math.cos(theta2/2)
+
+    c00 = a00*b00 + a01*b10
+    c01 = a00*b10 + a01*b11
+    c10 = a10*b00 + a11*b10
+    c11 = a10*b01 + a11*b11
+
+    theta3 = 2*cmath.acos(c00)
+    sinTheta3 = cmath.sin(theta3/2)
+    if sinTheta3 != 0: 
+        phi3 = cmath.phase(c10/sinTheta3)
+        lam3 = cmath.phase(-c01/sinTheta3)
+    else:
+        sum_phi_lam3 = cmath.phase(c11/cmath.cos(theta3/2))
+        phi3 = 0.0
+        lam3 = sum_phi_lam3
+
+    return(theta3, phi3, lam3)
+
+
+def max_error(first, second, fused) -> float:
+    """
+    @returns the largest distance, up to global phase, between U(second)·U(first) and U(fused)
+    """
+    expected = su2.u3_matrices(second) @ su2.u3_matrices(first)
+    got = su2.u3_matrices(fused)
+    # align global phases on the largest entry of each matrix
+    flat_e = expected.reshape(-1, 4)
+    flat_g = got.reshape(-1, 4)
+    idx = np.argmax(np.abs(flat_e), axis=1)
+    rows = np.arange(len(idx))
+    phase = flat_e[rows, idx] / flat_g[rows, idx]
+    phase /= np.abs(phase)
+    return float(np.abs(expected - phase[:, None, None] * got).max())
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    rng = np.random.default_rng(0)
+    first = rng.uniform(-2*np.pi, 2*np.pi, (n, 3))
+    second = rng.uniform(-2*np.pi, 2*np.pi, (n, 3))
+
+    start = time.perf_counter()
+    legacy = [legacyComputeProductMatrix(*a, *b) for a, b in zip(first, second)]
+    legacy_s = time.perf_counter() - start
+    legacy = np.array([(t.real, p, l) for t, p, l in legacy])
+
+    start = time.perf_counter()
+    fused, _ = su2.fuse(first, second)
+    fused_s = time.perf_counter() - start
+
+    runs = [rng.uniform(-np.pi, np.pi, (k, 3)) for k in rng.integers(2, 64, n // 32)]
+    start = time.perf_counter()
+    su2.fuse_runs(runs)
+    runs_s = time.perf_counter() - start
+
+    print(f"{n} pairs")
+    print(f"computeProductMatrix (cmath): {legacy_s:8.4f}s  max error {max_error(first, second, legacy):.2e}")
+    print(f"su2.fuse (numpy):             {fused_s:8.4f}s  max error {max_error(first, second, fused):.2e}")
+    print(f"speedup: {legacy_s / fused_s:.1f}x")
+    print(f"su2.fuse_runs: {len(runs)} runs, {sum(len(r) for r in runs)} gates in {runs_s:.4f}s")
+
+
+if __name__ == "__main__":
+    main()
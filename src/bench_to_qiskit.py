@@ -0,0 +1,92 @@
+"""
+Benchmark of the direct IR → Qiskit converter (ir_to_qiskit) against the
+OpenQASM2 text round-trip, on every circuit of a folder, before and after the
+pass pipeline. Also checks that both paths build the same circuit.
+A speedup below 1 means the text path (utils.circuit_to_qiskit) is faster.
+
+Usage: py bench_to_qiskit.py [input_folder] [repeat]
+"""
+import io
+import sys
+import time
+from contextlib import redirect_stdout
+
+import numpy as np
+from qiskit import QuantumCircuit
+
+import utils
+import passes
+from ir_to_qiskit import method_to_qiskit
+
+
+def instructions(qc: QuantumCircuit) -> list:
+    return [
+        (inst.operation.name,
+         tuple(qc.find_bit(q).index for q in inst.qubits),
+         tuple(qc.find_bit(c).index for c in inst.clbits),
+         tuple(float(p) for p in inst.operation.params))
+        for inst in qc.data
+    ]
+
+def same_circuit(direct: QuantumCircuit, text: QuantumCircuit, atol: float = 1e-12) -> bool:
+    """
+    Same registers and instructions; parameters are compared up to atol since
+    the emitted text only keeps 15 significant digits
+    """
+    if [len(r) for r in direct.qregs] != [len(r) for r in text.qregs]:
+        return False
+    if [len(r) for r in direct.cregs] != [len(r) for r in text.cregs]:
+        return False
+    a, b = instructions(direct), instructions(text)
+    if len(a) != len(b):
+        return False
+    for (name1, q1, c1, p1), (name2, q2, c2, p2) in zip(a, b):
+        if (name1, q1, c1) != (name2, q2, c2) or not np.allclose(p1, p2, rtol=0, atol=atol):
+            return False
+    return True
+
+def best_time(fn, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def main():
+    folder = sys.argv[1] if len(sys.argv) > 1 else "../inputs"
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    with redirect_stdout(io.StringIO()):
+        programs = utils.importQASM(folder)
+
+    print(f"{'circuit':<16} {'stage':<10} {'gates':>6} {'text':>9} {'direct':>9} {'speedup':>8}  equivalent")
+    total_text = total_direct = 0.0
+    all_same = True
+    for name, circuit in programs.stream():
+        for stage in ("lowered", "compiled"):
+            if stage == "compiled":
+                with redirect_stdout(io.StringIO()):
+                    passes.RydbergRewrite(circuit)
+                    passes.MergeConsecutiveU(circuit.dialects)(circuit)
+                    passes.NativeParallelisationPass(circuit)
+
+            text = utils.circuit_to_qiskit_text(circuit)
+            direct = method_to_qiskit(circuit)
+            same = same_circuit(direct, text)
+            all_same &= same
+
+            text_s = best_time(lambda: utils.circuit_to_qiskit_text(circuit), repeat)
+            direct_s = best_time(lambda: method_to_qiskit(circuit), repeat)
+            total_text += text_s
+            total_direct += direct_s
+            print(f"{name:<16} {stage:<10} {len(direct.data):>6} {text_s*1e3:>7.2f}ms {direct_s*1e3:>7.2f}ms {text_s/direct_s:>7.1f}x  {same}")
+
+    print(f"total: text {total_text:.3f}s, direct {total_direct:.3f}s ({total_text/total_direct:.1f}x)")
+    if not all_same:
+        print("MISMATCH between the direct and the text conversion")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+On-disk, content-addressed cache of compiled circuits.
+
+An entry is keyed by the hash of the source QASM, the pass configuration, the
+code of the pipeline and of the validation, and the bloqade/kirin/qiskit
+versions, and stores the emitted QASM with its metrics and fidelity. The cache is bounded in size: least recently used
+entries are evicted first.
+"""
+import hashlib
+import json
+import os
+import tempfile
+from importlib import metadata
+from pathlib import Path
+
+DEFAULT_DIR = Path(__file__).parent / ".compile_cache"
+DEFAULT_MAX_BYTES = 256 * 2**20
+
+# the modules whose code decides the compiled output
+PIPELINE_FILES = ("compiler.py", "passes.py", "pipeline.py", "su2.py", "su4.py", "metrics.py", "schedule.py", "peephole.py", "angles.py", "qasm_writer.py",
+                  # and the stored fidelity: lowering, conversion to Qiskit, validation
+                  "utils.py", "ir_to_qiskit.py", "validate.py", "equivalence.py", "simulation.py")
+
+def toolchain_versions() -> dict[str, str]:
+    versions = {}
+    for dist in ("bloqade", "bloqade-circuit", "kirin-toolchain", "qiskit", "qiskit-aer"):
+        try:
+            versions[dist] = metadata.version(dist)
+        except metadata.PackageNotFoundError:
+            versions[dist] = None
+    return versions
+
+def pipeline_digest() -> str:
+    digest = hashlib.sha256()
+    here = Path(__file__).parent
+    for name in PIPELINE_FILES:
+        digest.update((here / name).read_bytes())
+    return digest.hexdigest()
+
+
+class CompileCache:
+    def __init__(self, directory=DEFAULT_DIR, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self._env = json.dumps({"versions": toolchain_versions(), "pipeline": pipeline_digest()}, sort_keys=True)
+
+    def key(self, source: str, config: dict) -> str:
+        """
+        @returns the hex digest addressing `source` compiled with `config`
+        """
+        digest = hashlib.sha256()
+        digest.update(source.encode())
+        digest.update(json.dumps(config, sort_keys=True).encode())
+        digest.update(self._env.encode())
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.json"
+
+    def get(self, key: str) -> dict | None:
+        """
+        @returns the stored entry, or None on a miss
+        """
+        path = self._path(key)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+            os.utime(path)  # mark as recently used
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        return entry
+
+    def put(self, key: str, entry: dict):
+        """
+        Stores a JSON-serializable entry, then evicts down to max_bytes
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # write + rename, so concurrent batch workers never read half an entry
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(entry, f)
+        os.replace(tmp, self._path(key))
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for path in self.directory.glob("*.json"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+    def clear(self):
+        for path in self.directory.glob("*.json"):
+            path.unlink(missing_ok=True)
@@ -0,0 +1,89 @@
+"""
+Regression checks of the passes: small circuits whose statement order once
+broke a pipeline, each compiled with it and compared with its input by
+equivalence.check. Exits with status 1 if a case loses fidelity.
+
+Usage: py check_passes.py [-k NAME]
+"""
+import argparse
+import io
+import sys
+from contextlib import redirect_stdout
+
+import equivalence
+import utils
+from pipeline import PassManager
+
+HEADER = 'OPENQASM 2.0;\ninclude "qelib1.inc";\nqreg q[3];\n'
+MIN_FIDELITY = 1 - 1e-9
+
+# name → (pipeline, source body); schedule turns the two U gates on q[0] and q[1] into a parallel.U
+CASES = {
+    # the gates around a parallel gate on the same qubit must not cancel through it
+    "peephole_across_parallel": ("schedule,peephole", """
+h q[0];
+cz q[0], q[2];
+U(0.3, 0.2, 0.1) q[0];
+U(0.3, 0.2, 0.1) q[1];
+cz q[0], q[2];
+h q[0];
+"""),
+    # a U/CZ block on (q[0], q[2]) ends at a parallel gate on q[0]
+    "kak_across_parallel": ("schedule,kak", """
+U(0.7, 0.1, 0.4) q[0];
+cz q[0], q[2];
+U(0.3, 0.2, 0.1) q[0];
+U(0.3, 0.2, 0.1) q[1];
+cz q[0], q[2];
+U(1.1, 0.5, 0.2) q[0];
+"""),
+    # the U runs on q[0] end at the global rotation global turns the U layer into
+    "merge_across_global": ("schedule,global,merge", """
+U(0.7, 0.1, 0.4) q[0];
+cz q[1], q[2];
+U(0.3, 0.2, 0.1) q[0];
+U(0.3, 0.2, 0.1) q[1];
+U(0.3, 0.2, 0.1) q[2];
+U(1.1, 0.5, 0.2) q[0];
+"""),
+    # the inverse on q[2] is fused into the next U on it, which is itself a one-gate layer
+    "global_inverse_fold": ("global", """
+cz q[0], q[2];
+U(0.3, 0.2, 0.1) q[0];
+U(0.3, 0.2, 0.1) q[1];
+U(0.7, 0.1, 0.4) q[2];
+cz q[1], q[2];
+"""),
+}
+
+
+def run_case(pipeline: str, body: str) -> float:
+    """
+    @returns the fidelity of the circuit compiled by pipeline against the circuit
+    """
+    with redirect_stdout(io.StringIO()):
+        method = utils.loadQASMString(HEADER + body, "case")
+        before = utils.circuit_to_qiskit(method)
+        PassManager.parse(pipeline).run(method)
+        after = utils.circuit_to_qiskit(method)
+    return equivalence.check(before, after)["fidelity"]
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="py check_passes.py", description=__doc__.split("\n\n")[0])
+    parser.add_argument("-k", "--case", action="append", choices=CASES, help="Only run this case (repeatable)")
+    args = parser.parse_args()
+
+    failed = 0
+    for name in args.case or CASES:
+        pipeline, body = CASES[name]
+        fidelity = run_case(pipeline, body)
+        ok = fidelity >= MIN_FIDELITY
+        failed += not ok
+        print(f"[{'ok' if ok else 'FAIL'}] {name:<32} {pipeline:<24} fidelity {fidelity:.6f}")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
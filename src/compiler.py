@@ -1,11 +1,19 @@
 import utils
 from utils import sep_print
-import sys, os
+import argparse
+import time
+from pathlib import Path
 
-import passes
 import metrics
-from validate import validate
+import qasm_writer
+import batch
+import cache
+import autotune
+import tracing
+from pipeline import PassManager, STEPS as PIPELINE_STEPS
+from validate import validate, SampledValidation, SampledPair
 from kirin.ir.method import Method
+from qiskit import QuantumCircuit
 
 from bloqade.qasm2.emit import QASM2 as QASM2Target # the QASM2 target
 from bloqade.qasm2.parse import pprint # the QASM2 pretty printer
@@ -15,48 +23,329 @@ printSSA = False    # if true prints the raw IR of kirin
 printMetrics = True
 doPause = False     # if true pauses until input at each step
 
+# the default pipeline (see default_pipeline), unless --pipeline/--pipeline-file give another
 doRydberg = True    # if true translates gates to the native set using the native rewrite pass
 doNativeParallelisation = True  # if true applies the parallelisation with native UOpToParallelise
+doScheduleParallel = True       # if true the parallelisation is done by our commutation-aware scheduler instead
+doGlobalRotations = False       # if true U layers on more than half the qubits become a global rotation + local inverses
+                                # (off: the output is sequential QASM, where a global rotation is one U per qubit)
+doTwoQubitResynthesis = True    # if true the U/CZ blocks on a qubit pair are re-synthesized with the fewest CZs
 
 doOurPasses = False         # if true apply our passes also outside the merge
 doOurPasses_merge = True    # if true apply the merge pass
+doPeephole = True           # if true cancel inverse pairs and fuse phase gates before the merge
 
 validateExecute = True
-executeShots = 100000
+executeShots = 100000     # the shots budget of a sampled validation
+executeExact = True # if true the execute validation uses the exact outcome probabilities instead of sampling them
+# a sampled validation starts with executeMinShots shots and doubles them until its fidelity is known within
+# ±executeTolerance or is clearly above or below executeThreshold (see validate.SampledValidation)
+executeMinShots = 2000
+executeThreshold = 0.99
+executeTolerance = 0.005
+executeSeed = 1234  # Aer and bootstrap seed, None for a different sample every run
+
+useCache = True     # if true reuse the output of a previous compilation of the same source and flags
+cacheMaxBytes = cache.DEFAULT_MAX_BYTES
 
 def main():
-    if len(sys.argv) < 3:
-        print("Usage: py compiler.py <input_folder> <output_folder>")
-        print("The program will optimize all circuits in .qasm files in the input folder, then output the optimized version in the output folder.")
-        exit(-1)
-
-    input_folder = sys.argv[1]
-    output_folder = sys.argv[2]
+    parser = argparse.ArgumentParser(
+        prog="py compiler.py",
+        description="The program will optimize all circuits in .qasm files in the input folder, then output the optimized version in the output folder."
+    )
+    parser.add_argument("input_folder", nargs="?")
+    parser.add_argument("output_folder", nargs="?")
+    parser.add_argument(
+        "-j", "--jobs",
+        type=int,
+        default=None,
+        help="Batch mode: compile every file in a pool of JOBS worker processes (0 = one per core)"
+    )
+    parser.add_argument(
+        "-s", "--select",
+        action="append",
+        metavar="PATTERN",
+        help="Only compile the circuits whose name (file stem) matches PATTERN, a glob (e.g. '4*'). Repeatable"
+    )
+    parser.add_argument(
+        "--regex",
+        action="store_true",
+        help="Read the --select patterns as regular expressions"
+    )
+    pipelineArgs = parser.add_mutually_exclusive_group()
+    pipelineArgs.add_argument(
+        "--pipeline",
+        metavar="STEPS",
+        help=f"Pass pipeline to run instead of the default one, e.g. 'rydberg,merge:atol=1e-10,parallelise' (steps: {', '.join(PIPELINE_STEPS)})"
+    )
+    pipelineArgs.add_argument(
+        "--pipeline-file",
+        metavar="FILE",
+        help="Read the pass pipeline from a JSON file (see pipeline.PassManager.load)"
+    )
+    parser.add_argument(
+        "--autotune",
+        action="store_true",
+        help="Autotuning mode: search pipeline variants per circuit in JOBS worker processes and write the best verified one (see autotune.py)"
+    )
+    parser.add_argument(
+        "--space",
+        metavar="FILE",
+        help="With --autotune, read the search space from a JSON file (see autotune.load_space)"
+    )
+    parser.add_argument(
+        "--leaderboard",
+        metavar="FILE",
+        help="With --autotune, write the scored variants of every circuit to FILE (default OUTPUT/leaderboard.json)"
+    )
+    parser.add_argument(
+        "--metrics",
+        metavar="FILE",
+        help="Write the metrics of every compiled circuit to FILE (CSV if it ends in .csv, JSON otherwise)"
+    )
+    parser.add_argument(
+        "--trace",
+        metavar="FILE",
+        help="Time every pipeline step, print a per-step summary and write a Chrome trace-event JSON to FILE"
+    )
+    parser.add_argument(
+        "--trace-memory",
+        action="store_true",
+        help="With --trace, also record the peak Python heap of every step (slower)"
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Neither read nor write the compilation cache"
+    )
+    parser.add_argument(
+        "--clear-cache",
+        action="store_true",
+        help="Empty the compilation cache first (alone: just empty it)"
+    )
+    args = parser.parse_args()
+
+    if args.clear_cache:
+        cache.CompileCache().clear()
+        print("Compilation cache cleared")
+        if args.input_folder is None:
+            return
+    if args.input_folder is None or args.output_folder is None:
+        parser.error("the following arguments are required: input_folder, output_folder")
+    use_cache = useCache and not args.no_cache
+    if args.pipeline is not None:
+        pipeline = PassManager.parse(args.pipeline)
+    elif args.pipeline_file is not None:
+        pipeline = PassManager.load(args.pipeline_file)
+    else:
+        pipeline = default_pipeline()
+    print("Pipeline:", pipeline)
+
+    input_folder = args.input_folder
+    output_folder = args.output_folder
 
     if not output_folder.endswith("/"):
         output_folder += "/"
 
+    if args.autotune:
+        catalog = utils.importQASM(input_folder, select=args.select, regex=args.regex)
+        space = autotune.load_space(args.space) if args.space else autotune.SEARCH_SPACE
+        start = time.perf_counter()
+        results = autotune.autotune([catalog.path(name) for name in catalog], output_folder, jobs=args.jobs or None,
+                                    space=space, baseline=pipeline)
+        autotune.print_leaderboard(results)
+        leaderboard = args.leaderboard or output_folder + "leaderboard.json"
+        autotune.write_leaderboard(results, leaderboard)
+        verified = sum(1 for r in results if r["best"] is not None)
+        print(f"{verified}/{len(results)} circuits tuned in {time.perf_counter() - start:.1f}s, leaderboard written to", leaderboard)
+        return
+
+    if args.jobs is not None:
+        summary = batch.compile_batch(input_folder, output_folder, jobs=args.jobs or None, use_cache=use_cache,
+                                      select=args.select, regex=args.regex, pipeline=pipeline,
+                                      trace=args.trace is not None, trace_memory=args.trace_memory)
+        batch.print_summary(summary)
+        if args.metrics:
+            metrics.write_metrics({s["name"]: metrics.CircuitMetrics.from_dict(s["metrics"])
+                                   for s in summary if s.get("metrics")}, args.metrics)
+        if args.trace:
+            tracer = tracing.Tracer()
+            for s in summary:
+                tracer.extend(s.get("trace") or [])
+            report_trace(tracer, args.trace)
+        return
+
+    tracer = tracing.Tracer(memory=args.trace_memory) if args.trace else None
+
+    # only names are listed here: each circuit is lowered by compile_qasm, if it misses the cache
     programs = utils.importQASM(input_folder)
-    for name, circuit in programs.items():
-        if not "4" in name: continue
-
-        optimize_qasm(circuit, output_folder, name+".qasm")
-        if name.endswith("_improved"):
-            orgName = name.split("_")[0]
-            qcOrg = utils.circuit_to_qiskit(programs[orgName])
-            qcImprov = utils.circuit_to_qiskit(circuit)
-            print(f"Validating {name} against its original version...")
-            if orgName == "1":
-                validate(qcOrg, qcImprov, ancilla=True, execute=validateExecute, shots=executeShots, first=False, n = 1)
-            elif orgName == "qft2":
-                validate(qcOrg, qcImprov, ancilla=True, execute=True, shots = 100000, first=True, n = 3)
-            else: 
-                validate(qcOrg, qcImprov, ancilla=False, execute=validateExecute, shots=executeShots)
-
-        print()
+    records = {}
+    # the sampled validations of all the circuits run together, once they are compiled
+    validation = sampled_validation() if validateExecute and not executeExact else None
+    with tracing.active(tracer):
+        for name in programs.select(args.select, args.regex):
+            with tracing.span("compile_qasm", circuit=name):
+                record = compile_qasm(programs.path(name), output_folder, use_cache=use_cache, pipeline=pipeline,
+                                      validation=validation)
+            records[name] = metrics.CircuitMetrics.from_dict(record["metrics"])
+            if name.endswith("_improved"):
+                with tracing.span("validate_improved", circuit=name):
+                    orgName = name.split("_")[0]
+                    qcOrg = utils.circuit_to_qiskit(programs.load(orgName))
+                    qcImprov = QuantumCircuit.from_qasm_str(record["qasm"])
+                    validate_improved(name, qcOrg, qcImprov)
+
+            print()
+
+        if validation is not None and validation.pairs:
+            sep_print(f"Sampling {len(validation.pairs)} validations together...")
+            with tracing.span("validate_sampled"):
+                validation.run()
+
+    if args.metrics:
+        metrics.write_metrics(records, args.metrics)
+    if tracer is not None:
+        report_trace(tracer, args.trace)
     
 
-def optimize_qasm(circuit: Method, output_folder, output_name):
+def report_trace(tracer: tracing.Tracer, path):
+    """
+    Prints the per-step summary of tracer and writes its Chrome trace to path
+    """
+    sep_print("Time per step:")
+    tracer.print_summary()
+    tracer.write_chrome_trace(path)
+    print("Chrome trace written to", path)
+
+
+def default_pipeline() -> PassManager:
+    """
+    @returns the pipeline selected by the do* flags
+    """
+    steps = []
+    if doRydberg:
+        steps.append("rydberg")
+    if doTwoQubitResynthesis:
+        steps.append("kak")
+    if doOurPasses:
+        steps.append("remove2pi")   # remove 2pi rotations and useless U gates
+    if doPeephole:
+        steps.append("peephole")
+    if doOurPasses_merge:
+        steps.append("merge")       # merge U gates wherever possible to reduce their total count
+    if doNativeParallelisation:
+        steps.append("schedule" if doScheduleParallel else "parallelise")
+    if doGlobalRotations:
+        steps.append("global")      # after the parallelisation, which exposes the layers
+    return PassManager(steps)
+
+
+def pipeline_config(pipeline: PassManager = None) -> dict:
+    """
+    @returns the settings that change the compiled output (part of the cache key)
+    """
+    return {
+        "pipeline": (pipeline or default_pipeline()).spec(),
+        "validateExecute": validateExecute,
+        "executeShots": executeShots,
+        "executeExact": executeExact,
+        **sampling_options(),
+    }
+
+
+def sampling_options() -> dict:
+    """
+    @returns the options of a sampled validation, but its shots budget (see validate.SampledValidation)
+    """
+    return {"min_shots": executeMinShots, "threshold": executeThreshold, "tolerance": executeTolerance, "seed": executeSeed}
+
+
+def sampled_validation() -> SampledValidation:
+    return SampledValidation(max_shots=executeShots, **sampling_options())
+
+
+def compile_qasm(path, output_folder, circuit: Method = None, use_cache = True, pipeline: PassManager = None,
+                 validation: SampledValidation = None) -> dict:
+    """
+    Compiles the .qasm file at path into output_folder, through the compilation cache.
+    On a hit the stored output is written back without lowering or optimizing anything.
+    circuit, if given, is the already lowered content of path.
+    pipeline defaults to default_pipeline().
+    A sampled validation is queued in validation, if given: the fidelity of the returned dict is then
+    None until validation.run(), which also stores the entry in the cache.
+    @returns a dict with name, cached, parse_s, compile_s, counts_before, counts_after, metrics (of the output,
+    see metrics.CircuitMetrics), fidelity and the output qasm
+    """
+    path = Path(path)
+    name = path.stem
+    filepath = output_folder + name + ".qasm"
+    source = path.read_text()
+
+    compileCache = cache.CompileCache(max_bytes=cacheMaxBytes) if use_cache else None
+    if compileCache is not None:
+        key = compileCache.key(source, pipeline_config(pipeline))
+        entry = compileCache.get(key)
+        if entry is not None:
+            print(f"Cache hit for {name}, exporting to QASM... ", filepath)
+            with open(filepath, "w") as out:
+                out.write(entry["qasm"])
+            return {"name": name, "cached": True, "parse_s": 0.0, "compile_s": 0.0, **entry}
+
+    start = time.perf_counter()
+    if circuit is None:
+        with tracing.span("loadQASM"):
+            circuit = utils.loadQASM(path)
+    parse_s = time.perf_counter() - start
+    counts_before = metrics.gate_counts(circuit)
+
+    start = time.perf_counter()
+    fidelity = optimize_qasm(circuit, output_folder, name+".qasm", pipeline, validation)
+    compile_s = time.perf_counter() - start
+
+    metrics_after = metrics.circuit_metrics(circuit)
+    entry = {
+        "qasm": Path(filepath).read_text(),   # as written by optimize_qasm
+        "fidelity": fidelity,
+        "counts_before": counts_before,
+        "counts_after": metrics.gate_counts(metrics_after),
+        "metrics": metrics_after.to_dict(),
+    }
+    record = {"name": name, "cached": False, "parse_s": parse_s, "compile_s": compile_s, **entry}
+    if isinstance(fidelity, SampledPair):
+        entry["fidelity"] = record["fidelity"] = None
+
+        def validated(value):
+            entry["fidelity"] = record["fidelity"] = value
+            if compileCache is not None:
+                compileCache.put(key, entry)
+        fidelity.callbacks.append(validated)
+    elif compileCache is not None:
+        compileCache.put(key, entry)
+    return record
+
+
+def validate_improved(name, qcOrg, qcImprov):
+    """
+    Validates a hand-improved circuit against its original version
+    @returns the fidelity
+    """
+    orgName = name.split("_")[0]
+    print(f"Validating {name} against its original version...")
+    if orgName == "1":
+        return validate(qcOrg, qcImprov, ancilla=True, execute=validateExecute, shots=executeShots, first=False, n = 1, exact=executeExact, **sampling_options())
+    elif orgName == "qft2":
+        return validate(qcOrg, qcImprov, ancilla=True, execute=True, shots = 100000, first=True, n = 3, exact=executeExact, **sampling_options())
+    else: 
+        return validate(qcOrg, qcImprov, ancilla=False, execute=validateExecute, shots=executeShots, exact=executeExact, **sampling_options())
+
+
+def optimize_qasm(circuit: Method, output_folder, output_name, pipeline: PassManager = None,
+                  validation: SampledValidation = None):
+    """
+    Runs the pass pipeline (default: default_pipeline()) in-place on circuit, validates it and writes it to output_folder/output_name
+    @param validation: if given, a sampled validation is queued there instead of being run
+    @returns the fidelity of the optimized circuit against the initial one (the queued validate.SampledPair)
+    """
     # `programs` holds each file’s lowered IR under its filename-stem.
 
     # 1 is good
@@ -69,7 +358,6 @@ def optimize_qasm(circuit: Method, output_folder, output_name):
     # The following flags govern the execution flow.
 
     targetParallel = QASM2Target(allow_parallel=True)
-    targetSequential = QASM2Target(allow_parallel=False)
 
     if prettyDebug:
         sep_print("Non-translated qasm:\n")
@@ -77,79 +365,42 @@ def optimize_qasm(circuit: Method, output_folder, output_name):
 
     ###########################################################################
 
-    qc_initial = utils.circuit_to_qiskit(circuit)
-
-    if doRydberg:
-        passes.RydbergRewrite(circuit)
-        if printMetrics: 
-            sep_print("Metrics after RydbergRewrite: ")
-            metrics.print_gate_counts(targetParallel.emit(circuit))
-
-    if printSSA:
-        print("After Rydberg: ")
-        circuit.print()
-
-    # Our first pass: remove 2pi rotations and useless U gates
-    if doOurPasses:
-        print("Doing Remove2PiGates Pass after RydbergRewrite...")
-        passes.Remove2PiGates(circuit.dialects)(circuit)
-    if printSSA:
-        circuit.print()
-    if doPause:
-        input("Continue...")
-
-    # Our second and bigger pass: merge U gates wherever possible to reduce their total count
-    if doOurPasses_merge:
-        if printMetrics: 
-            sep_print("Metrics before MERGE: ")
-            metrics.print_gate_counts(targetParallel.emit(circuit))
-
-        print("Merging ConsecutiveU")
-        passes.MergeConsecutiveU(circuit.dialects)(circuit)
+    with tracing.span("circuit_to_qiskit"):
+        qc_initial = utils.circuit_to_qiskit(circuit)
 
+    def after_step(name, method):
         if printMetrics: 
-            sep_print("Metrics after MERGE: ")
-            metrics.print_gate_counts(targetParallel.emit(circuit))
-    if printSSA:
-        print("circuit after MERGE: ")
-        circuit.print()
-        print()
-    if doPause:
-        input("Continue...")
-
-
-    if prettyDebug:
-        sep_print("Unparallelized QASMTarget:", sleepTimeSec=1)
-        pprint(targetParallel.emit(circuit))
-
-    # Now apply parallelization with native UOpToParallelise
-    if doNativeParallelisation:
-        passes.NativeParallelisationPass(circuit)
-        if printMetrics: 
-            sep_print("Metrics after nativeParallelise: ")          # gate count (parallel and standard) is output at each pass 
-            metrics.print_gate_counts(targetParallel.emit(circuit))
-
-    if prettyDebug:
-        sep_print("NativeParallelised circuit: ", sleepTimeSec=2)
-        pprint(targetSequential.emit(circuit))
-
-    
-    if printSSA:
-        circuit.print()
-    
-    if printMetrics: 
-        print("Final metrics: ")
-        metrics.print_gate_counts(targetParallel.emit(circuit))
+            sep_print(f"Metrics after {name}: ")          # gate count (parallel and standard) is output at each pass 
+            metrics.print_gate_counts(method)
+        if printSSA:
+            print(f"circuit after {name}: ")
+            method.print()
+            print()
+        if prettyDebug:
+            sep_print(f"{name} circuit: ", sleepTimeSec=1)
+            pprint(targetParallel.emit(method))
+        if doPause:
+            input("Continue...")
+
+    (pipeline or default_pipeline()).run(circuit, after_step)
 
     # Next output validation metrics
-    qc_final = utils.circuit_to_qiskit(circuit)
+    with tracing.span("circuit_to_qiskit"):
+        qc_final = utils.circuit_to_qiskit(circuit)
 
-    validate(qc_initial, qc_final, ancilla=False, execute=validateExecute, shots=executeShots)
+    with tracing.span("validate"):
+        if validation is not None and validateExecute and not executeExact:
+            fidelity = validation.add(qc_initial, qc_final, ancilla=False, name=Path(output_name).stem)
+        else:
+            fidelity = validate(qc_initial, qc_final, ancilla=False, execute=validateExecute, shots=executeShots,
+                                exact=executeExact, **sampling_options())
 
     filepath = output_folder + output_name   # Output file to qasm
     print("Exporting to QASM... ", filepath)
-    with open(filepath, "w") as out:
-        out.write(targetSequential.emit_str(circuit))
+    with tracing.span("emit"):
+        qasm_writer.write_file(circuit, filepath)
+
+    return fidelity
     
 
 if __name__ == "__main__":
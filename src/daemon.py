@@ -0,0 +1,256 @@
+"""
+Resident compile daemon with watch mode.
+
+`serve` imports the toolchain once, warms the pipeline up on a tiny circuit,
+then recompiles every .qasm file of the input folder whose content changes
+(polling, no extra dependency) and answers requests from the thin client on
+a local Unix socket. The client only imports the standard library, so it
+starts in milliseconds.
+
+Requests and replies are single JSON lines: {"command": "compile",
+"select": [...], "regex": false} compiles the selected files now (the
+compilation cache still applies), "status" describes the daemon, "stop"
+shuts it down. When the pipeline code changes on disk (see
+cache.pipeline_digest) the daemon restarts itself, so it never caches output
+of stale code under the new key.
+
+Usage:
+    py daemon.py serve INPUT OUTPUT [--pipeline STEPS] [--interval S] [--no-watch]
+    py daemon.py compile [-s PATTERN] [--regex] [-v]
+    py daemon.py status | stop
+"""
+import argparse
+import json
+import os
+import socket
+import sys
+import tempfile
+import time
+
+DEFAULT_SOCKET = os.path.join(tempfile.gettempdir(), f"qasm-compiler-{os.getuid()}.sock")
+
+
+# -- client -------------------------------------------------------------------
+
+def request(message: dict, socket_path = DEFAULT_SOCKET) -> dict:
+    """
+    Sends one request to the daemon
+    @returns its reply
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+        conn.connect(socket_path)
+        conn.sendall(json.dumps(message).encode() + b"\n")
+        with conn.makefile("r") as reply:
+            return json.loads(reply.readline())
+
+def print_results(results: list[dict], verbose = False):
+    for s in results:
+        fidelity = "-" if s.get("fidelity") is None else f"{s['fidelity']:.6f}"
+        print(f"[{s['status']}{'*' if s.get('cached') else ''}] {s['name']:<20} {s.get('total_s', 0):>6.2f}s  "
+              f"fidelity {fidelity}")
+        if verbose and s.get("log"):
+            print(s["log"])
+        if s.get("error"):
+            print(s["error"])
+
+
+# -- server -------------------------------------------------------------------
+
+class Daemon:
+    def __init__(self, input_folder, output_folder, pipeline, use_cache = True):
+        import batch
+        import cache
+
+        self.batch = batch
+        self.input_folder = input_folder
+        self.output_folder = output_folder if output_folder.endswith("/") else output_folder + "/"
+        self.pipeline = pipeline
+        self.use_cache = use_cache
+        self.digest = cache.pipeline_digest()
+        self.started = time.time()
+        self.compiled = 0
+        self.stamps: dict[str, tuple] = {}     # path → (mtime_ns, size) when last compiled
+        os.makedirs(self.output_folder, exist_ok=True)
+
+    def warm_up(self):
+        # the first lowering and rewrite of a process pay for kirin's lazy initialization
+        import io
+        from contextlib import redirect_stdout
+        import utils
+        import bench_passes
+
+        with redirect_stdout(io.StringIO()):
+            self.pipeline.run(utils.loadQASMString(bench_passes.ghz(2), "warmup"))
+
+    def paths(self, select = None, regex = False) -> list[str]:
+        # scanned directly: utils.listQASM reports the folder it lists, every poll would
+        import utils
+        paths = {entry.name[:-len(".qasm")]: entry.path for entry in os.scandir(self.input_folder)
+                 if entry.name.endswith(".qasm") and entry.is_file()}
+        return [paths[name] for name in sorted(utils.selectNames(paths, select, regex))]
+
+    @staticmethod
+    def stamp(path) -> tuple:
+        info = os.stat(path)
+        return (info.st_mtime_ns, info.st_size)
+
+    def compile(self, paths) -> list[dict]:
+        results = []
+        for path in paths:
+            self.stamps[path] = self.stamp(path)
+            summary = self.batch.compile_file(path, self.output_folder, use_cache=self.use_cache, pipeline=self.pipeline)
+            summary.pop("trace", None)
+            self.compiled += 1
+            results.append(summary)
+        return results
+
+    def changed(self) -> list[str]:
+        changed = []
+        for path in self.paths():
+            try:
+                if self.stamps.get(path) != self.stamp(path):
+                    changed.append(path)
+            except FileNotFoundError:
+                pass    # removed meanwhile
+        return changed
+
+    def code_changed(self) -> bool:
+        import cache
+        return cache.pipeline_digest() != self.digest
+
+    def status(self) -> dict:
+        return {
+            "pid": os.getpid(),
+            "input": self.input_folder,
+            "output": self.output_folder,
+            "pipeline": str(self.pipeline),
+            "uptime_s": time.time() - self.started,
+            "compiled": self.compiled,
+            "watched": len(self.stamps),
+        }
+
+    def handle(self, message: dict) -> dict:
+        command = message.get("command")
+        if command == "compile":
+            return {"results": self.compile(self.paths(message.get("select"), message.get("regex", False)))}
+        if command == "status":
+            return self.status()
+        if command == "stop":
+            return {"stopping": True}
+        return {"error": f"unknown command {command!r}"}
+
+
+def serve(daemon: Daemon, socket_path = DEFAULT_SOCKET, interval = 0.2, watch = True):
+    """
+    Runs the daemon until a stop request: polls the input folder every interval seconds
+    and serves one request at a time in between, so compilations never overlap
+    """
+    if os.path.exists(socket_path):
+        try:
+            request({"command": "status"}, socket_path)
+            sys.exit(f"a daemon is already listening on {socket_path}")
+        except OSError:
+            os.unlink(socket_path)     # left over by a daemon that died
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(socket_path)
+    server.listen()
+    server.settimeout(interval)
+    print(f"Listening on {socket_path}, watching {daemon.input_folder}" if watch else f"Listening on {socket_path}")
+
+    restart = False
+    try:
+        if watch:
+            # the first round compiles everything (mostly cache hits)
+            print_results(daemon.compile(daemon.changed()))
+        while True:
+            try:
+                conn, _ = server.accept()
+            except socket.timeout:
+                conn = None
+            if conn is not None:
+                with conn, conn.makefile("rw") as stream:
+                    try:
+                        reply = daemon.handle(json.loads(stream.readline()))
+                    except Exception as e:
+                        reply = {"error": repr(e)}
+                    stream.write(json.dumps(reply) + "\n")
+                    stream.flush()
+                if reply.get("stopping"):
+                    break
+            if daemon.code_changed():
+                print("Pipeline code changed, restarting")
+                restart = True
+                break
+            if watch:
+                changed = daemon.changed()
+                if changed:
+                    print_results(daemon.compile(changed))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        os.unlink(socket_path)
+    if restart:
+        os.execv(sys.executable, [sys.executable] + sys.argv)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="py daemon.py", description=__doc__.split("\n\n")[0])
+    parser.add_argument("--socket", default=DEFAULT_SOCKET, help=f"Unix socket path (default {DEFAULT_SOCKET})")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve_args = commands.add_parser("serve", help="Start the daemon")
+    serve_args.add_argument("input_folder")
+    serve_args.add_argument("output_folder")
+    pipeline_args = serve_args.add_mutually_exclusive_group()
+    pipeline_args.add_argument("--pipeline", metavar="STEPS", help="Pass pipeline (see compiler.py --pipeline)")
+    pipeline_args.add_argument("--pipeline-file", metavar="FILE", help="Read the pass pipeline from a JSON file")
+    serve_args.add_argument("--interval", type=float, default=0.2, help="Polling interval in seconds (default 0.2)")
+    serve_args.add_argument("--no-watch", action="store_true", help="Only compile on request")
+    serve_args.add_argument("--no-cache", action="store_true", help="Neither read nor write the compilation cache")
+
+    compile_args = commands.add_parser("compile", help="Compile now, through the running daemon")
+    compile_args.add_argument("-s", "--select", action="append", metavar="PATTERN",
+                              help="Only compile the circuits matching PATTERN (see compiler.py --select)")
+    compile_args.add_argument("--regex", action="store_true", help="Read the --select patterns as regular expressions")
+    compile_args.add_argument("-v", "--verbose", action="store_true", help="Also print the compilation logs")
+
+    commands.add_parser("status", help="Describe the running daemon")
+    commands.add_parser("stop", help="Stop the running daemon")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        import compiler
+        from pipeline import PassManager
+
+        if args.pipeline is not None:
+            pipeline = PassManager.parse(args.pipeline)
+        elif args.pipeline_file is not None:
+            pipeline = PassManager.load(args.pipeline_file)
+        else:
+            pipeline = compiler.default_pipeline()
+        print("Pipeline:", pipeline)
+        daemon = Daemon(args.input_folder, args.output_folder, pipeline, use_cache=compiler.useCache and not args.no_cache)
+        daemon.warm_up()
+        serve(daemon, args.socket, args.interval, watch=not args.no_watch)
+        return
+
+    try:
+        if args.command == "compile":
+            reply = request({"command": "compile", "select": args.select, "regex": args.regex}, args.socket)
+        else:
+            reply = request({"command": args.command}, args.socket)
+    except OSError as e:
+        sys.exit(f"no daemon on {args.socket} ({e}), start one with: py daemon.py serve INPUT OUTPUT")
+
+    if "error" in reply:
+        sys.exit(reply["error"])
+    if "results" in reply:
+        print_results(reply["results"], args.verbose)
+    else:
+        print(json.dumps(reply, indent=2))
+
+
+if __name__ == "__main__":
+    main()
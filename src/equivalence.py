@@ -0,0 +1,148 @@
+"""
+Equivalence checking of two circuits acting on |0...0>, cheapest method first.
+
+Everything is computed on the miter qc1† · qc2 (qc2 followed by the inverse of
+qc1 on qc1's qubits): the fidelity |<psi1|psi2>|^2 is the probability that the
+miter leaves qc1's qubits in |0...0>, and any extra (ancilla) qubit of qc2 is
+traced out for free.
+
+  1. clifford:    both circuits are Clifford, the miter is a stabilizer state
+  2. miter:       the miter reduced by gate cancellation is empty (or Clifford)
+  3. statevector or matrix_product_state: simulation of the qubits the reduced
+     miter still acts on, by the method simulation.choose picks within the
+     memory limit (an MPS keeps wide, weakly entangled miters tractable)
+"""
+import time
+
+import numpy as np
+from qiskit import QuantumCircuit
+from qiskit.circuit.equivalence_library import SessionEquivalenceLibrary
+from qiskit.exceptions import QiskitError
+from qiskit.quantum_info import StabilizerState, Statevector
+from qiskit.transpiler import PassManager
+from qiskit.transpiler.passes import (
+    BasisTranslator,
+    CommutativeCancellation,
+    Optimize1qGatesDecomposition,
+    RemoveBarriers,
+    RemoveIdentityEquivalent,
+)
+
+import simulation
+
+maxDenseQubits = 28     # above this the simulation is never dense
+maxMpsAncillas = 6      # the MPS fidelity runs one simulation per value of the active ancillas
+maxReductionRounds = 10
+
+MITER_BASIS = ["u", "cz"]
+
+
+def miter(qc1: QuantumCircuit, qc2: QuantumCircuit, ancilla = False) -> QuantumCircuit:
+    """
+    @param ancilla: if true qc2 may have more qubits than qc1, the extra (last) ones are ancillas
+    @returns qc2 followed by qc1† on qc1's qubits, without final measurements
+    """
+    qc1 = qc1.remove_final_measurements(inplace=False)
+    qc2 = qc2.remove_final_measurements(inplace=False)
+    if qc2.num_qubits < qc1.num_qubits or (qc2.num_qubits > qc1.num_qubits and not ancilla):
+        raise ValueError(f"cannot compare a {qc1.num_qubits}-qubit circuit with a {qc2.num_qubits}-qubit one"
+                         + ("" if ancilla else " without ancilla"))
+
+    out = QuantumCircuit(qc2.num_qubits)
+    out.compose(qc2, range(qc2.num_qubits), inplace=True)
+    out.compose(qc1.inverse(), range(qc1.num_qubits), inplace=True)
+    return out
+
+def reduce_miter(circuit: QuantumCircuit) -> QuantumCircuit:
+    """
+    Translates to U + CZ and cancels gates (1q fusion, commutative cancellation,
+    identity removal) until the gate count stops decreasing
+    """
+    translate = PassManager([RemoveBarriers(), BasisTranslator(SessionEquivalenceLibrary, MITER_BASIS)])
+    cancel = PassManager([
+        Optimize1qGatesDecomposition(basis=["u"]),
+        CommutativeCancellation(basis_gates=MITER_BASIS),
+        RemoveIdentityEquivalent(),
+    ])
+
+    circuit = translate.run(circuit)
+    for _ in range(maxReductionRounds):
+        size = circuit.size()
+        circuit = cancel.run(circuit)
+        if circuit.size() >= size:
+            break
+    return circuit
+
+def _stabilizer_fidelity(circuit: QuantumCircuit, qubits: list[int]):
+    # None if the circuit is not Clifford
+    try:
+        state = StabilizerState(circuit)
+    except QiskitError:
+        return None
+    return state.probabilities_dict_from_bitstring("0" * len(qubits), qargs=qubits)["0" * len(qubits)]
+
+def _simulated_fidelity(circuit: QuantumCircuit, qubits: list[int]) -> tuple[float, str]:
+    # simulates only the qubits the circuit acts on, the others stay in |0>
+    # @returns the fidelity and the method used
+    active = sorted({circuit.find_bit(q).index for inst in circuit.data for q in inst.qubits})
+    measured = [active.index(q) for q in qubits if q in active]
+    if not measured:
+        return 1.0, "miter"
+
+    sub = QuantumCircuit(len(active))
+    for inst in circuit.data:
+        sub.append(inst.operation, [active.index(circuit.find_bit(q).index) for q in inst.qubits])
+
+    methods = (simulation.STATEVECTOR, simulation.MPS) if len(active) <= maxDenseQubits else (simulation.MPS,)
+    if simulation.choose(sub, methods=methods).method == simulation.MPS:
+        return _mps_fidelity(sub, measured), simulation.MPS
+    return float(Statevector(sub).probabilities(measured)[0]), simulation.STATEVECTOR
+
+def _mps_fidelity(circuit: QuantumCircuit, measured: list[int]) -> float:
+    # probability of |0> on the measured qubits: the sum, over the values of the other (ancilla)
+    # qubits, of the squared amplitude of that basis state. Aer's MPS only reports the amplitude
+    # of |0...0> reliably (the others come out permuted), so each value is flipped to |0> by X gates
+    from qiskit_aer import AerSimulator     # imported here: only this fallback needs Aer
+    import qiskit_aer.library               # adds QuantumCircuit.save_amplitudes_squared
+
+    free = [q for q in range(circuit.num_qubits) if q not in measured]
+    if len(free) > maxMpsAncillas:
+        raise MemoryError(f"the MPS fidelity would simulate 2**{len(free)} ancilla values (more than 2**maxMpsAncillas)")
+
+    experiments = []
+    for value in range(2**len(free)):
+        flipped = circuit.copy()
+        for i, q in enumerate(free):
+            if (value >> i) & 1:
+                flipped.x(q)
+        flipped.save_amplitudes_squared([0])
+        experiments.append(flipped)
+    result = AerSimulator(method=simulation.MPS).run(experiments).result()
+    return float(sum(result.data(i)["amplitudes_squared"][0] for i in range(len(experiments))))
+
+def check(qc1: QuantumCircuit, qc2: QuantumCircuit, ancilla = False) -> dict:
+    """
+    Fidelity between the states qc1 and qc2 prepare from |0...0>
+    (qc2's ancillas, if any, traced out), by the cheapest method that applies.
+    @returns a dict with fidelity, method (clifford, miter, statevector or matrix_product_state) and seconds
+    """
+    start = time.perf_counter()
+    qubits = list(range(qc1.num_qubits))
+    circuit = miter(qc1, qc2, ancilla=ancilla)
+
+    def result(fidelity, method):
+        return {"fidelity": float(np.clip(fidelity, 0.0, 1.0)), "method": method,
+                "seconds": time.perf_counter() - start}
+
+    fidelity = _stabilizer_fidelity(circuit, qubits)
+    if fidelity is not None:
+        return result(fidelity, "clifford")
+
+    circuit = reduce_miter(circuit)
+    if circuit.size() == 0:
+        return result(1.0, "miter")
+    fidelity = _stabilizer_fidelity(circuit, qubits)
+    if fidelity is not None:
+        return result(fidelity, "miter")
+
+    return result(*_simulated_fidelity(circuit, qubits))
@@ -0,0 +1,375 @@
+"""
+Columnar gate tables: a lowered circuit as NumPy arrays, one row per gate.
+
+A row is a gate on up to three qubits, numbered across the quantum registers
+in declaration order (classical bits likewise), with up to four angles. The
+statements acting on many qubits (parallel.U, parallel.RZ, parallel.CZ,
+glob.U, barriers and the gates broadcast over a whole register) give one row
+per qubit (per pair for parallel.CZ); the rows of a statement share its
+`group` id. `register` has bit j set when operand j was a whole register (bit
+3: the classical operand of a measure), so the conversion back to a method
+(to_method) rebuilds the same statements.
+
+Tables are saved as .npz (save) or as a directory of .npy files (save_dir),
+which load() can memory-map: a million-gate circuit reloads in milliseconds,
+without parsing QASM.
+"""
+import inspect
+import os
+from dataclasses import dataclass, fields
+from pathlib import Path
+
+import numpy as np
+
+from kirin import ir, types
+from kirin.analysis import const
+from kirin.dialects import func, ilist, py
+from bloqade import qasm2
+from bloqade.qasm2.dialects import core, uop, parallel, glob
+
+from ir_to_qiskit import UnsupportedStatement
+from metrics import KIND_NAMES, constant
+from qasm_writer import PARAMS, VALUE_STMTS
+
+MAX_QUBITS = 3
+MAX_PARAMS = 4
+CLASSICAL_OPERAND = 3   # bit of the classical operand in `register`
+
+# statement → names of its angle arguments
+ANGLES = {
+    **PARAMS,
+    uop.UGate: ("theta", "phi", "lam"), uop.CX: (),
+    uop.Barrier: (), core.Measure: (), core.Reset: (),
+    parallel.UGate: ("theta", "phi", "lam"), parallel.RZ: ("theta",), parallel.CZ: (),
+    glob.UGate: ("theta", "phi", "lam"),
+}
+OPCODES = tuple(ANGLES)
+OPCODE = {stmt: i for i, stmt in enumerate(OPCODES)}
+# statement → names of its qubit arguments, in constructor order
+OPERANDS = {
+    stmt: tuple(p for p in list(inspect.signature(stmt.__init__).parameters)[1:] if p not in angles and p != "carg")
+    for stmt, angles in ANGLES.items()
+}
+
+
+def opcode_name(stmt) -> str:
+    return KIND_NAMES.get(stmt, stmt.name.lower())
+
+
+@dataclass
+class GateTable:
+    op: np.ndarray          # uint8 (n,): index in OPCODES
+    qubits: np.ndarray      # int32 (n, MAX_QUBITS): operands, -1 if unused
+    params: np.ndarray      # float64 (n, MAX_PARAMS): angles, NaN if unused
+    group: np.ndarray       # int32 (n,): the statement the row comes from, non-decreasing
+    clbit: np.ndarray       # int32 (n,): measured bit, -1 if none
+    register: np.ndarray    # uint8 (n,): bit j set if operand j was a whole register
+    qregs: np.ndarray       # int32: quantum register sizes, in declaration order
+    cregs: np.ndarray       # int32: classical register sizes
+
+    def __len__(self):
+        return len(self.op)
+
+    @property
+    def num_qubits(self) -> int:
+        return int(self.qregs.sum())
+
+    @property
+    def num_statements(self) -> int:
+        return int(self.group[-1]) + 1 if len(self) else 0
+
+    def statement_rows(self) -> np.ndarray:
+        """
+        @returns the index of the first row of each statement
+        """
+        return np.flatnonzero(np.diff(self.group, prepend=-1))
+
+    def counts(self) -> dict[str, int]:
+        """
+        @returns statements per gate kind, as metrics.CircuitMetrics.gate_counts (barriers excluded)
+        """
+        ops = np.bincount(self.op[self.statement_rows()], minlength=len(OPCODES))
+        return {opcode_name(OPCODES[i]): int(n) for i, n in enumerate(ops) if n and OPCODES[i] is not uop.Barrier}
+
+    def qubit_gate_counts(self) -> np.ndarray:
+        """
+        @returns the gates (rows, barriers excluded) acting on each qubit
+        """
+        qubits = self.qubits[self.op != OPCODE[uop.Barrier]]
+        return np.bincount(qubits[qubits >= 0], minlength=self.num_qubits)
+
+    # -- storage ------------------------------------------------------------
+
+    def arrays(self) -> dict[str, np.ndarray]:
+        arrays = {f.name: getattr(self, f.name) for f in fields(self)}
+        # stored by name, so files stay readable if OPCODES changes
+        arrays["opcodes"] = np.array([opcode_name(stmt) for stmt in OPCODES])
+        return arrays
+
+    def save(self, path):
+        """
+        Writes the table to the .npz file path
+        """
+        np.savez(path, **self.arrays())
+
+    def save_dir(self, path):
+        """
+        Writes the table as one .npy file per column in the directory path (see load(mmap=True))
+        """
+        os.makedirs(path, exist_ok=True)
+        for name, array in self.arrays().items():
+            np.save(Path(path) / f"{name}.npy", array)
+
+    @classmethod
+    def load(cls, path, mmap = False) -> "GateTable":
+        """
+        Reads a table written by save (.npz) or save_dir (directory)
+        @param mmap: memory-map the columns of a directory instead of reading them
+        """
+        path = Path(path)
+        if path.is_dir():
+            data = {f.stem: np.load(f, mmap_mode="r" if mmap else None) for f in path.glob("*.npy")}
+        else:
+            with np.load(path) as npz:
+                data = {name: npz[name] for name in npz.files}
+        names = {opcode_name(stmt): i for i, stmt in enumerate(OPCODES)}
+        remap = np.array([names[str(name)] for name in data.pop("opcodes")], dtype=np.uint8)
+        if not np.array_equal(remap, np.arange(len(remap))):
+            data["op"] = remap[data["op"]]
+        return cls(**data)
+
+
+# -- method → table -----------------------------------------------------------
+
+class _Builder:
+    def __init__(self, method: ir.Method):
+        self.method = method
+        self.frame = None       # constant propagation, only run if a value is not a literal
+        self.offsets: dict[ir.SSAValue, int] = {}   # register → its first (qu)bit
+        self.sizes: dict[ir.SSAValue, int] = {}
+        self.qregs, self.cregs = [], []
+        self.rows = []          # (op, qubits, params, group, clbit, register)
+        self.group = 0
+
+    def value(self, ssa: ir.SSAValue):
+        value = constant(ssa)
+        if value is None:
+            if self.frame is None:
+                self.frame, _ = const.Propagate(self.method.dialects).run_analysis(self.method)
+            result = self.frame.entries.get(ssa)
+            if not isinstance(result, const.Value):
+                raise UnsupportedStatement(f"non-constant value {ssa}")
+            value = result.data
+        return value
+
+    def operand(self, ssa: ir.SSAValue) -> tuple[list[int], bool]:
+        # the (qu)bits of a (qu)bit or a whole register, and whether it is a register
+        stmt = ssa.owner
+        if isinstance(stmt, (core.QRegGet, core.CRegGet)) and stmt.reg in self.offsets:
+            idx = self.value(stmt.idx)
+            if isinstance(idx, int):
+                return [self.offsets[stmt.reg] + idx], False
+        if isinstance(stmt, (core.QRegNew, core.CRegNew)) and ssa in self.offsets:
+            return list(range(self.offsets[ssa], self.offsets[ssa] + self.sizes[ssa])), True
+        raise UnsupportedStatement(f"cannot resolve the (qu)bit {ssa}")
+
+    def elements(self, ssa: ir.SSAValue) -> list[int]:
+        # the qubits of an IList of qubits
+        stmt = ssa.owner
+        if isinstance(stmt, ilist.New):
+            return [q for value in stmt.values for q in self.single(value)]
+        raise UnsupportedStatement(f"cannot resolve the qubit list {ssa}")
+
+    def single(self, ssa: ir.SSAValue) -> list[int]:
+        qubits, is_register = self.operand(ssa)
+        if is_register:
+            raise UnsupportedStatement(f"register {ssa} in a qubit list")
+        return qubits
+
+    def add(self, stmt, qubits = (), params = (), clbit = -1, register = 0):
+        self.rows.append((OPCODE[type(stmt)], tuple(qubits), params, self.group, clbit, register))
+
+    def run(self) -> GateTable:
+        for block in self.method.callable_region.blocks:
+            for stmt in block.stmts:
+                self.visit(stmt)
+        n = len(self.rows)
+        qubits = np.full((n, MAX_QUBITS), -1, dtype=np.int32)
+        params = np.full((n, MAX_PARAMS), np.nan)
+        for i, (_, qs, ps, _, _, _) in enumerate(self.rows):
+            qubits[i, :len(qs)] = qs
+            params[i, :len(ps)] = ps
+        return GateTable(
+            op=np.array([r[0] for r in self.rows], dtype=np.uint8),
+            qubits=qubits,
+            params=params,
+            group=np.array([r[3] for r in self.rows], dtype=np.int32),
+            clbit=np.array([r[4] for r in self.rows], dtype=np.int32),
+            register=np.array([r[5] for r in self.rows], dtype=np.uint8),
+            qregs=np.array(self.qregs, dtype=np.int32),
+            cregs=np.array(self.cregs, dtype=np.int32),
+        )
+
+    def visit(self, stmt: ir.Statement):
+        if isinstance(stmt, (core.QRegNew, core.CRegNew)):
+            size = self.value(stmt.args[0])
+            sizes = self.qregs if isinstance(stmt, core.QRegNew) else self.cregs
+            self.offsets[stmt.result] = sum(sizes)
+            self.sizes[stmt.result] = size
+            sizes.append(size)
+            return
+        if type(stmt) not in ANGLES:
+            if isinstance(stmt, VALUE_STMTS) or not stmt.regions and stmt.has_trait(ir.Pure) \
+                    or stmt.has_trait(ir.IsTerminator):
+                return
+            raise UnsupportedStatement(f"{stmt.name} is not supported")
+
+        params = tuple(float(self.value(getattr(stmt, name))) for name in ANGLES[type(stmt)])
+        if isinstance(stmt, (parallel.UGate, parallel.RZ)):
+            for q in self.elements(stmt.qargs):
+                self.add(stmt, (q,), params)
+        elif isinstance(stmt, parallel.CZ):
+            for pair in zip(self.elements(stmt.ctrls), self.elements(stmt.qargs)):
+                self.add(stmt, pair)
+        elif isinstance(stmt, glob.UGate):
+            regs = stmt.registers.owner
+            if not isinstance(regs, ilist.New):
+                raise UnsupportedStatement(f"cannot resolve the register list {stmt.registers}")
+            for reg in regs.values:
+                for q in self.operand(reg)[0]:
+                    self.add(stmt, (q,), params)
+        elif isinstance(stmt, uop.Barrier):
+            for arg in stmt.qargs:
+                qubits, is_register = self.operand(arg)
+                for q in qubits:
+                    self.add(stmt, (q,), register=int(is_register))
+        else:
+            # a gate, measure or reset, broadcast over its register operands
+            operands = [self.operand(getattr(stmt, name)) for name in OPERANDS[type(stmt)]]
+            if isinstance(stmt, core.Measure):
+                operands.append(self.operand(stmt.carg))
+            width = max(len(qubits) for qubits, _ in operands)
+            register = sum(1 << (j if j < len(OPERANDS[type(stmt)]) else CLASSICAL_OPERAND)
+                           for j, (_, is_register) in enumerate(operands) if is_register)
+            for i in range(width):
+                bits = [qubits[i] if is_register else qubits[0] for qubits, is_register in operands]
+                if isinstance(stmt, core.Measure):
+                    self.add(stmt, bits[:1], params, clbit=bits[1], register=register)
+                else:
+                    self.add(stmt, bits, params, register=register)
+        self.group += 1
+
+def from_method(method: ir.Method) -> GateTable:
+    """
+    @returns the gate table of a lowered method
+    @raises UnsupportedStatement for methods with control flow, custom gates or non-constant operands
+    """
+    return _Builder(method).run()
+
+
+# -- table → method -----------------------------------------------------------
+
+class _Emitter:
+    def __init__(self, table: GateTable):
+        self.table = table
+        self.stmts: list[ir.Statement] = []
+        self.qregs = []     # (SSA value, offset, size)
+        self.cregs = []
+
+    def emit(self, stmt: ir.Statement) -> ir.Statement:
+        self.stmts.append(stmt)
+        return stmt
+
+    def constant(self, value) -> ir.SSAValue:
+        return self.emit(py.Constant(value)).result
+
+    def declare(self, sizes, new, registers):
+        offset = 0
+        for size in sizes.tolist():
+            registers.append((self.emit(new(self.constant(size))).result, offset, size))
+            offset += size
+
+    @staticmethod
+    def find(registers, bit: int):
+        for reg, offset, size in registers:
+            if offset <= bit < offset + size:
+                return reg, offset, size
+        raise ValueError(f"(qu)bit {bit} is not in any register")
+
+    def bit(self, registers, bit: int, get) -> ir.SSAValue:
+        reg, offset, _ = self.find(registers, bit)
+        return self.emit(get(reg, self.constant(bit - offset))).result
+
+    def register(self, registers, first: int) -> ir.SSAValue:
+        return self.find(registers, first)[0]
+
+    def qubit_list(self, qubits) -> ir.SSAValue:
+        values = [self.bit(self.qregs, q, core.QRegGet) for q in qubits]
+        return self.emit(ilist.New(values=values)).result
+
+    def run(self, name: str) -> ir.Method:
+        t = self.table
+        self.declare(t.qregs, core.QRegNew, self.qregs)
+        self.declare(t.cregs, core.CRegNew, self.cregs)
+
+        starts = t.statement_rows().tolist() + [len(t)]
+        for start, end in zip(starts, starts[1:]):
+            self.statement(OPCODES[int(t.op[start])], start, end)
+
+        none = self.emit(func.ConstantNone())
+        self.emit(func.Return(none.result))
+        block = ir.Block(self.stmts)
+        code = func.Function(sym_name=name, signature=func.Signature(inputs=(), output=types.NoneType),
+                             body=ir.Region(block))
+        return ir.Method(mod=None, py_func=None, sym_name=name, arg_names=[], dialects=qasm2.extended, code=code)
+
+    def angles(self, stmt, row: int) -> list[ir.SSAValue]:
+        return [self.constant(float(p)) for p in self.table.params[row, :len(ANGLES[stmt])]]
+
+    def statement(self, stmt, start: int, end: int):
+        t = self.table
+        qubits = t.qubits[start:end]
+        if stmt in (parallel.UGate, parallel.RZ):
+            qargs = self.qubit_list(qubits[:, 0].tolist())
+            self.emit(stmt(qargs, *self.angles(stmt, start)))
+        elif stmt is parallel.CZ:
+            ctrls = self.qubit_list(qubits[:, 0].tolist())
+            qargs = self.qubit_list(qubits[:, 1].tolist())
+            self.emit(stmt(ctrls, qargs))
+        elif stmt is glob.UGate:
+            regs = []
+            for q in qubits[:, 0].tolist():
+                reg, offset, _ = self.find(self.qregs, q)
+                if q == offset:
+                    regs.append(reg)
+            self.emit(stmt(self.emit(ilist.New(values=regs)).result, *self.angles(stmt, start)))
+        elif stmt is uop.Barrier:
+            qargs, row = [], start
+            while row < end:
+                q = int(qubits[row - start, 0])
+                if t.register[row]:
+                    reg, offset, size = self.find(self.qregs, q)
+                    qargs.append(reg)
+                    row += size
+                else:
+                    qargs.append(self.bit(self.qregs, q, core.QRegGet))
+                    row += 1
+            self.emit(stmt(qargs=tuple(qargs)))
+        else:
+            register = int(t.register[start])
+            args = []
+            for j in range(len(OPERANDS[stmt])):
+                q = int(qubits[0, j])
+                args.append(self.register(self.qregs, q) if register >> j & 1 else self.bit(self.qregs, q, core.QRegGet))
+            if stmt is core.Measure:
+                c = int(t.clbit[start])
+                args.append(self.register(self.cregs, c) if register >> CLASSICAL_OPERAND & 1
+                            else self.bit(self.cregs, c, core.CRegGet))
+            self.emit(stmt(*args, *self.angles(stmt, start)))
+
+def to_method(table: GateTable, name = "circuit") -> ir.Method:
+    """
+    @returns a method in bloqade's extended dialect group with the statements of table
+    (as utils.loadQASM lowers them, with the registers declared first)
+    """
+    return _Emitter(table).run(name)
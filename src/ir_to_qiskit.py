@@ -0,0 +1,163 @@
+"""
+Direct conversion of a lowered Kirin method to a Qiskit QuantumCircuit.
+
+Walks the core/uop/parallel/glob statements and appends the matching Qiskit
+instructions, expanding parallel and global gates in the order the QASM2
+emitter would, without going through OpenQASM text.
+(bloqade's ParallelToUOp inserts each single-qubit gate right after the
+parallel one, i.e. in reverse order, and each CZ before it, in order.)
+
+Since qasm_writer streams the text, the round-trip through OpenQASM2 is the
+faster path on most circuits (see bench_to_qiskit), and utils.circuit_to_qiskit
+takes it: appending the instructions one by one from Python costs more than
+Qiskit's (native) QASM parser.
+"""
+from kirin import ir
+from kirin.analysis import const
+from kirin.dialects import ilist
+from bloqade.qasm2.dialects import core, uop, parallel, glob
+
+from qiskit import QuantumCircuit, QuantumRegister, ClassicalRegister
+from qiskit.circuit import library as lib
+
+
+class UnsupportedStatement(NotImplementedError):
+    """The method contains a statement the direct converter does not handle (e.g. if, custom gates)"""
+
+
+# uop statement → (Qiskit gate class, names of its angle arguments)
+GATES = {
+    uop.UGate: (lib.UGate, ("theta", "phi", "lam")),
+    uop.Id: (lib.IGate, ()),
+    uop.H: (lib.HGate, ()),
+    uop.X: (lib.XGate, ()),
+    uop.Y: (lib.YGate, ()),
+    uop.Z: (lib.ZGate, ()),
+    uop.S: (lib.SGate, ()),
+    uop.Sdag: (lib.SdgGate, ()),
+    uop.SX: (lib.SXGate, ()),
+    uop.SXdag: (lib.SXdgGate, ()),
+    uop.T: (lib.TGate, ()),
+    uop.Tdag: (lib.TdgGate, ()),
+    uop.RX: (lib.RXGate, ("theta",)),
+    uop.RY: (lib.RYGate, ("theta",)),
+    uop.RZ: (lib.RZGate, ("theta",)),
+    uop.U1: (lib.U1Gate, ("lam",)),
+    uop.U2: (lib.U2Gate, ("phi", "lam")),
+    uop.CX: (lib.CXGate, ()),
+    uop.CZ: (lib.CZGate, ()),
+    uop.CY: (lib.CYGate, ()),
+    uop.CH: (lib.CHGate, ()),
+    uop.CSX: (lib.CSXGate, ()),
+    uop.Swap: (lib.SwapGate, ()),
+    uop.CRX: (lib.CRXGate, ("lam",)),
+    uop.CRY: (lib.CRYGate, ("lam",)),
+    uop.CRZ: (lib.CRZGate, ("lam",)),
+    uop.CU1: (lib.CU1Gate, ("lam",)),
+    uop.CU3: (lib.CU3Gate, ("theta", "phi", "lam")),
+    uop.CU: (lib.CUGate, ("theta", "phi", "lam", "gamma")),
+    uop.RXX: (lib.RXXGate, ("theta",)),
+    uop.RZZ: (lib.RZZGate, ("theta",)),
+    uop.CCX: (lib.CCXGate, ()),
+    uop.CSwap: (lib.CSwapGate, ()),
+}
+
+# statements that only compute values read by the gates
+VALUE_STMTS = (core.QRegNew, core.CRegNew, core.QRegGet, core.CRegGet, ilist.New)
+
+
+class _Converter:
+    def __init__(self, method: ir.Method):
+        self.method = method
+        self.frame, _ = const.Propagate(method.dialects).run_analysis(method)
+        self.qc = QuantumCircuit()
+        self.registers: dict[ir.SSAValue, QuantumRegister | ClassicalRegister] = {}
+
+    def value(self, ssa: ir.SSAValue):
+        result = self.frame.entries.get(ssa)
+        if not isinstance(result, const.Value):
+            raise UnsupportedStatement(f"non-constant value {ssa}")
+        return result.data
+
+    def register(self, ssa: ir.SSAValue):
+        reg = self.registers.get(ssa)
+        if reg is None:
+            raise UnsupportedStatement(f"unknown register {ssa}")
+        return reg
+
+    def bit(self, ssa: ir.SSAValue):
+        # a qubit or a classical bit
+        stmt = ssa.owner
+        if isinstance(stmt, (core.QRegGet, core.CRegGet)):
+            return self.register(stmt.reg)[self.value(stmt.idx)]
+        raise UnsupportedStatement(f"cannot resolve the (qu)bit {ssa}")
+
+    def bits(self, ssa: ir.SSAValue) -> list:
+        # an IList of qubits
+        stmt = ssa.owner
+        if isinstance(stmt, ilist.New):
+            return [self.bit(value) for value in stmt.values]
+        raise UnsupportedStatement(f"cannot resolve the qubit list {ssa}")
+
+    def run(self) -> QuantumCircuit:
+        for block in self.method.callable_region.blocks:
+            for stmt in block.stmts:
+                self.convert(stmt)
+        return self.qc
+
+    def convert(self, stmt: ir.Statement):
+        qc = self.qc
+
+        if isinstance(stmt, (core.QRegNew, core.CRegNew)):
+            # registers are named as the QASM2 emitter names them
+            cls = QuantumRegister if isinstance(stmt, core.QRegNew) else ClassicalRegister
+            reg = cls(self.value(stmt.args[0]), f"var_{len(self.registers)}")
+            qc.add_register(reg)
+            self.registers[stmt.result] = reg
+        elif type(stmt) in GATES:
+            gate, params = GATES[type(stmt)]
+            # the qubit arguments are declared before the angles
+            qargs = stmt.args[:len(stmt.args) - len(params)]
+            qc.append(gate(*(self.value(getattr(stmt, p)) for p in params)), [self.bit(q) for q in qargs])
+        elif isinstance(stmt, uop.Barrier):
+            qc.barrier([self.bit(q) for q in stmt.qargs])
+        elif isinstance(stmt, parallel.UGate):
+            angles = (self.value(stmt.theta), self.value(stmt.phi), self.value(stmt.lam))
+            for q in reversed(self.bits(stmt.qargs)):
+                qc.append(lib.UGate(*angles), [q])
+        elif isinstance(stmt, parallel.RZ):
+            theta = self.value(stmt.theta)
+            for q in reversed(self.bits(stmt.qargs)):
+                qc.append(lib.RZGate(theta), [q])
+        elif isinstance(stmt, parallel.CZ):
+            for ctrl, qarg in zip(self.bits(stmt.ctrls), self.bits(stmt.qargs)):
+                qc.append(lib.CZGate(), [ctrl, qarg])
+        elif isinstance(stmt, glob.UGate):
+            angles = (self.value(stmt.theta), self.value(stmt.phi), self.value(stmt.lam))
+            regs = stmt.registers.owner
+            if not isinstance(regs, ilist.New):
+                raise UnsupportedStatement(f"cannot resolve the registers of {stmt}")
+            qubits = [q for reg in regs.values for q in self.register(reg)]
+            for q in reversed(qubits):
+                qc.append(lib.UGate(*angles), [q])
+        elif isinstance(stmt, core.Measure):
+            if isinstance(stmt.qarg.owner, core.QRegNew):
+                qc.measure(list(self.register(stmt.qarg)), list(self.register(stmt.carg)))
+            else:
+                qc.measure(self.bit(stmt.qarg), self.bit(stmt.carg))
+        elif isinstance(stmt, core.Reset):
+            qc.reset(self.bit(stmt.qarg))
+        elif isinstance(stmt, VALUE_STMTS) or not stmt.regions and stmt.has_trait(ir.Pure):
+            pass
+        elif stmt.has_trait(ir.IsTerminator):
+            pass
+        else:
+            raise UnsupportedStatement(f"{stmt.name} is not supported")
+
+
+def method_to_qiskit(method: ir.Method) -> QuantumCircuit:
+    """
+    Builds the QuantumCircuit of a lowered method, parallel and global gates expanded.
+    @raises UnsupportedStatement for methods using statements without a direct translation
+    """
+    return _Converter(method).run()
@@ -1,18 +1,217 @@
-from bloqade import qasm2
+"""
+Gate metrics of a lowered circuit, computed by a single walk over its IR.
 
-def print_gate_counts(ast): 
+Gate kinds are named after the QASM keyword, lowercase ("u", "cz", "cx", ...),
+with the dialect as prefix for the non-standard ones ("parallel.u",
+"parallel.cz", "parallel.rz", "glob.u"). Qubits are numbered across registers
+in declaration order.
+"""
+import csv
+import json
+from dataclasses import asdict, dataclass, field
+
+from kirin import ir
+from kirin.dialects import ilist, py
+from bloqade.qasm2.dialects import core, uop, parallel, glob
+
+# the statement names that are not the QASM keyword
+KIND_NAMES = {
+    uop.CSwap: "cswap",
+    parallel.UGate: "parallel.u",
+    parallel.CZ: "parallel.cz",
+    parallel.RZ: "parallel.rz",
+    glob.UGate: "glob.u",
+}
+
+
+@dataclass
+class CircuitMetrics:
+    num_qubits: int = 0
+    depth: int = 0                  # number of moments, a parallel or global gate is one moment
+    two_qubit_gates: int = 0        # a parallel.cz counts once per pair
+    gate_counts: dict[str, int] = field(default_factory=dict)           # statements per gate kind
+    parallel_sizes: dict[str, list[int]] = field(default_factory=dict)  # gates in each parallel/global group, per kind
+    qubit_gate_counts: list[int] = field(default_factory=list)          # gates acting on each qubit
+    pulses: int = 0                 # estimated single-qubit pulses: one per addressed qubit, one per global rotation
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict())
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "CircuitMetrics":
+        return cls(**data)
+
+    def flat(self) -> dict:
+        """
+        @returns the scalar metrics, one key per CSV column
+        """
+        row = {
+            "num_qubits": self.num_qubits,
+            "depth": self.depth,
+            "two_qubit_gates": self.two_qubit_gates,
+            "gates": sum(self.gate_counts.values()),
+            "pulses": self.pulses,
+        }
+        for kind, count in sorted(self.gate_counts.items()):
+            row[f"count_{kind}"] = count
+        for kind, sizes in sorted(self.parallel_sizes.items()):
+            row[f"max_size_{kind}"] = max(sizes)
+            row[f"mean_size_{kind}"] = sum(sizes) / len(sizes)
+        if self.qubit_gate_counts:
+            row["max_qubit_gates"] = max(self.qubit_gate_counts)
+        return row
+
+
+class _Walker:
+    def __init__(self):
+        self.metrics = CircuitMetrics()
+        self.offsets: dict[ir.SSAValue, int] = {}   # qreg → index of its first qubit
+        self.sizes: dict[ir.SSAValue, int] = {}
+        self.levels: list[int] = []                 # moments already used on each qubit
+
+    def qubit(self, ssa: ir.SSAValue) -> int | None:
+        stmt = ssa.owner
+        if isinstance(stmt, core.QRegGet) and stmt.reg in self.offsets:
+            idx = constant(stmt.idx)
+            if isinstance(idx, int):
+                return self.offsets[stmt.reg] + idx
+        return None
+
+    def qubits(self, ssa: ir.SSAValue) -> list[int]:
+        stmt = ssa.owner
+        if isinstance(stmt, ilist.New):
+            return [q for q in map(self.qubit, stmt.values) if q is not None]
+        return []
+
+    def moment(self, qubits: list[int], count = True):
+        if not qubits:
+            return
+        level = max(self.levels[q] for q in qubits) + (1 if count else 0)
+        for q in qubits:
+            self.levels[q] = level
+            if count:
+                self.metrics.qubit_gate_counts[q] += 1
+
+    def visit(self, stmt: ir.Statement):
+        m = self.metrics
+
+        if isinstance(stmt, core.QRegNew):
+            size = constant(stmt.n_qubits)
+            if isinstance(size, int):
+                self.offsets[stmt.result] = m.num_qubits
+                self.sizes[stmt.result] = size
+                m.num_qubits += size
+                self.levels += [0] * size
+                m.qubit_gate_counts += [0] * size
+            return
+        if isinstance(stmt, uop.Barrier):
+            # synchronizes its qubits without taking a moment
+            self.moment([q for q in map(self.qubit, stmt.qargs) if q is not None], count=False)
+            return
+
+        if isinstance(stmt, (parallel.UGate, parallel.RZ)):
+            qubits = self.qubits(stmt.qargs)
+            size = len(qubits)
+            m.pulses += size
+        elif isinstance(stmt, parallel.CZ):
+            qubits = self.qubits(stmt.ctrls) + self.qubits(stmt.qargs)
+            size = len(qubits) // 2
+            m.two_qubit_gates += size
+        elif isinstance(stmt, glob.UGate):
+            regs = stmt.registers.owner
+            regs = regs.values if isinstance(regs, ilist.New) else ()
+            qubits = [self.offsets[r] + i for r in regs if r in self.offsets for i in range(self.sizes[r])]
+            size = len(qubits)
+            m.pulses += 1
+        elif stmt.dialect is uop.dialect or isinstance(stmt, (core.Measure, core.Reset)):
+            qubits = [q for q in map(self.qubit, stmt.args) if q is not None]
+            size = None
+            if len(qubits) == 2:
+                m.two_qubit_gates += 1
+            elif len(qubits) == 1 and stmt.dialect is uop.dialect:
+                m.pulses += 1
+        else:
+            return
+
+        kind = KIND_NAMES.get(type(stmt), stmt.name.lower())
+        if isinstance(stmt, core.Measure) and isinstance(stmt.qarg.owner, core.QRegNew):
+            # measure of a whole register
+            qubits = list(range(self.offsets[stmt.qarg], self.offsets[stmt.qarg] + self.sizes[stmt.qarg])) \
+                if stmt.qarg in self.offsets else []
+        m.gate_counts[kind] = m.gate_counts.get(kind, 0) + 1
+        if size is not None:
+            m.parallel_sizes.setdefault(kind, []).append(size)
+        self.moment(qubits)
+
+    def run(self, method: ir.Method) -> CircuitMetrics:
+        for block in method.callable_region.blocks:
+            for stmt in block.stmts:
+                self.visit(stmt)
+        self.metrics.depth = max(self.levels, default=0)
+        return self.metrics
+
+
+def constant(ssa: ir.SSAValue):
+    """
+    @returns the value of a constant SSA value (None if unknown)
+    """
+    if isinstance(ssa.owner, py.Constant):
+        return ssa.owner.value.unwrap()
+    hint = ssa.hints.get("const")
+    return getattr(hint, "data", None)
+
+def circuit_metrics(method: ir.Method) -> CircuitMetrics:
+    """
+    Walks the lowered method once
+    @returns its CircuitMetrics
     """
-    Print the counts of parallel and non parallel in the given AST,
+    return _Walker().run(method)
+
+def gate_counts(method: ir.Method | CircuitMetrics) -> dict[str, int]:
+    """
+    Count parallel and non parallel U and CZ gates in the given method (or metrics),
+    @returns a dict with keys parallel_cz, parallel_u, u, cz
+    """
+    counts = method.gate_counts if isinstance(method, CircuitMetrics) else circuit_metrics(method).gate_counts
+
+    return {
+        "parallel_cz": counts.get("parallel.cz", 0),
+        "parallel_u": counts.get("parallel.u", 0),
+        "u": counts.get("u", 0),
+        "cz": counts.get("cz", 0),
+    }
+
+def print_gate_counts(method: ir.Method | CircuitMetrics):
+    """
+    Print the counts of parallel and non parallel in the given method,
     Distinguishing between single U and CZ gates and their parallelized versions.
     """
-    test_string = qasm2.parse.spprint(ast)
+    if not isinstance(method, CircuitMetrics):
+        method = circuit_metrics(method)
+    counts = gate_counts(method)
 
-    parallel_cz_count = test_string.count("parallel.CZ")
-    parallel_u_count = test_string.count("parallel.U")
-    u_count = test_string.count("U")  # To avoid counting "parallel.U"
-    cz_count = test_string.count("cz")
+    print(f"parallel CZ: {counts['parallel_cz']}")
+    print(f"parallel U: {counts['parallel_u']}")
+    print(f"other U: {counts['u']}")
+    print(f"other CZ: {counts['cz']}")
+    print(f"depth: {method.depth}")
+    print(f"single-qubit pulses: {method.pulses}")
 
-    print(f"parallel CZ: {parallel_cz_count}")
-    print(f"parallel U: {parallel_u_count}")
-    print(f"other U: {u_count - parallel_u_count}")
-    print(f"other CZ: {cz_count}")
\ No newline at end of file
+def write_metrics(records: dict[str, CircuitMetrics], path):
+    """
+    Writes the metrics of several circuits, by name, as JSON or (if path ends in .csv)
+    as CSV with one row per circuit and the columns of CircuitMetrics.flat
+    """
+    path = str(path)
+    with open(path, "w", newline="") as out:
+        if path.endswith(".csv"):
+            rows = [{"name": name, **record.flat()} for name, record in records.items()]
+            columns = list(dict.fromkeys(key for row in rows for key in row))
+            writer = csv.DictWriter(out, fieldnames=columns, restval=0)
+            writer.writeheader()
+            writer.writerows(rows)
+        else:
+            json.dump({name: record.to_dict() for name, record in records.items()}, out, indent=2)
@@ -4,22 +4,23 @@ from bloqade.qasm2.passes import UOpToParallel
 import warnings
 warnings.filterwarnings("ignore")
 
-from bloqade.qasm2.rewrite.native_gates import RydbergGateSetRewriteRule
 from kirin.rewrite import Walk
 
 def RydbergRewrite(circuit):
     """
     Applies rewrites in-place on the circuit
-    @returns nothing
+    @returns the RewriteResult
     """
-    Walk(RydbergGateSetRewriteRule(circuit.dialects)).rewrite(circuit.code)
+    # imported here: the native gate rewrite pulls in cirq, seconds of import time
+    from bloqade.qasm2.rewrite.native_gates import RydbergGateSetRewriteRule
+    return Walk(RydbergGateSetRewriteRule(circuit.dialects)).rewrite(circuit.code)
 
 def NativeParallelisationPass(circuit):
     """
     Applies rewrites in-place on the circuit
-    @returns nothing
+    @returns the RewriteResult
     """
-    UOpToParallel(circuit.dialects)(circuit)
+    return UOpToParallel(circuit.dialects)(circuit)
 
 # LynxFoudnation ; BIP ; E4 ; CRS4
 
@@ -28,58 +29,135 @@ def NativeParallelisationPass(circuit):
 # TODO: Many Analysis passes (find parallelisable structures: one pass per structure)
 #       Rewrite pass to substitute the structure with the parallel version
 
-# TODO: Pass that substitutes localGate on > 1/2 qubits with 1 global + 1 local inverse on < 1/2 qubits 
-
 # TODO: CNOT Ladder to log (use ancilla qubits => HARD)
 
 from dataclasses import field, dataclass
 import math
 
-from kirin.passes import Pass, Fold
+from kirin.passes import Pass
 
 from kirin.rewrite.abc import RewriteRule, RewriteResult
 from kirin.rewrite import (
     WrapConst, Walk, 
     Chain, ConstantFold, 
-    Fixpoint, DeadCodeElimination, 
-    CommonSubexpressionElimination
+    DeadCodeElimination
 )
 from bloqade.qasm2.rewrite import RaiseRegisterRule
 
 from kirin import ir
 from kirin.analysis import const
-from bloqade.qasm2.dialects import core, uop, parallel
-from kirin.dialects import py as pyDialect
+from bloqade.qasm2.dialects import core, uop, parallel, glob
+from kirin.dialects import py as pyDialect, ilist
+
+import su2
+import su4
+import angles
+from angles import ConstantPool
+import peephole
+import schedule
+from metrics import constant
+import tracing
+from tracing import TracedFixpoint
+
+@dataclass
+class EliminateCommonSubexpressions(RewriteRule):
+    """
+    Common subexpression elimination in a single sweep per block.
+    (kirin's CommonSubexpressionElimination removes one duplicate per block and
+    call, so its fixpoint takes as many walks as there are duplicates.)
+    """
+
+    def rewrite_Block(self, node: ir.Block) -> RewriteResult:
+        seen: dict[tuple, ir.Statement] = {}
+        has_done_something = False
+
+        stmt = node.first_stmt
+        while stmt is not None:
+            next_stmt = stmt.next_stmt
+            if stmt.has_trait(ir.Pure) and not stmt.regions:
+                # the arguments of later statements are already rewired to the kept results
+                key = (type(stmt), tuple(stmt.args), tuple(stmt.attributes.items()), tuple(stmt.successors))
+                old_stmt = seen.get(key)
+                if old_stmt is None:
+                    seen[key] = stmt
+                else:
+                    for result, old_result in zip(stmt.results, old_stmt.results):
+                        result.replace_by(old_result)
+                    stmt.delete()
+                    has_done_something = True
+            stmt = next_stmt
+        return RewriteResult(has_done_something=has_done_something)
+
+    def rewrite_Statement(self, node: ir.Statement) -> RewriteResult:
+        result = RewriteResult()
+        for region in node.regions:
+            for block in region.blocks:
+                result = self.rewrite_Block(block).join(result)
+        return result
+
+CLEANUP = Chain(
+    ConstantFold(),
+    DeadCodeElimination(),
+    EliminateCommonSubexpressions(),
+)
+
+@dataclass
+class Analyses:
+    """
+    Analysis results of one method, shared by the passes run on it (see pipeline.PassManager).
+    A pass reports its changes with changed(), which drops what they invalidate.
+    """
+    dialects: ir.DialectGroup
+    frame: const.Frame | None = None    # constant propagation
+    clean: bool = False                 # the CLEANUP fixpoint has converged since the last change
+
+    def changed(self, result: RewriteResult) -> RewriteResult:
+        if result.has_done_something:
+            self.frame = None
+            self.clean = False
+        return result
+
+    def const_frame(self, method: ir.Method) -> const.Frame:
+        if self.frame is None:
+            with tracing.span("const.Propagate"):
+                self.frame, _ = const.Propagate(self.dialects).run_analysis(method)
+        return self.frame
 
-from computeProductMatrix import computeProductMatrix
+    def cse(self, method: ir.Method, name = "CSE") -> RewriteResult:
+        if self.clean:
+            return RewriteResult()
+        return self.changed(TracedFixpoint(Walk(EliminateCommonSubexpressions()), name=name).rewrite(method.code))
+
+    def cleanup(self, method: ir.Method, name = "cleanup") -> RewriteResult:
+        """
+        Runs the CLEANUP fixpoint, unless it already converged and nothing changed since
+        """
+        if self.clean:
+            return RewriteResult()
+        result = self.changed(TracedFixpoint(Walk(CLEANUP), name=name).rewrite(method.code))
+        self.clean = not result.exceeded_max_iter
+        return result
 
 @dataclass
 class Remove2PiGates(Pass):
+    analyses: Analyses | None = None    # shared analysis results, if run by a PassManager
 
     def unsafe_run(self, method: ir.Method):
-        result = Walk(Simplify2PiConst()).rewrite(method.code)
+        analyses = self.analyses or Analyses(self.dialects)
+        result = analyses.changed(Walk(Simplify2PiConst()).rewrite(method.code))
 
-        frame, _ = const.Propagate(self.dialects).run_analysis(method)
-        result = Walk(WrapConst(frame)).rewrite(method.code).join(result)
-        result = Walk(FindAndSimplifyUGates()).rewrite(method.code).join(result)
+        Walk(WrapConst(analyses.const_frame(method))).rewrite(method.code)
+        result = analyses.changed(Walk(FindAndSimplifyUGates()).rewrite(method.code)).join(result)
         
-        rule = Chain(
-            ConstantFold(),
-            DeadCodeElimination(),
-            CommonSubexpressionElimination(),
-        )
-        result = Fixpoint(Walk(rule)).rewrite(method.code).join(result)
+        result = analyses.cleanup(method, "Remove2PiGates cleanup").join(result)
         
         return result
 
 @dataclass
 class Simplify2PiConst(RewriteRule):
-    eps: float = 1e-11 # IMPORTANT! Not all constants are 100% accurate on 2pi
-    def mod(self, a, b):
-        if a < b:
-            b -= self.eps
-        return (a // b) * b
-    
+    eps: float = angles.EPS # IMPORTANT! Not all constants are 100% accurate on 2pi
+    pools: dict = field(default_factory=dict)   # block → its ConstantPool
+
     def rewrite_Statement(self, node: ir.Statement) -> RewriteResult:
         if not isinstance(node, pyDialect.Constant):
             return RewriteResult()
@@ -103,13 +181,13 @@ class Simplify2PiConst(RewriteRule):
                 break
 
         if used_in_U:        
-            newVal = node.value.unwrap() - self.mod(node.value.unwrap(), periodicity)
-            if newVal < 1e-10:
-                newVal = 0.0
+            newVal = angles.reduce(node.value.unwrap(), periodicity, self.eps)
             # print(f"From {node.value.unwrap()} to {newVal}")
-            newStmt = pyDialect.Constant(newVal)
-            # print(newStmt.print_str())
-            node.replace_by(newStmt)
+            block = node.parent_block
+            if block not in self.pools:
+                self.pools[block] = ConstantPool(block)
+            node.result.replace_by(self.pools[block].get(newVal))
+            node.delete()
             return RewriteResult(has_done_something=True)
         
         return RewriteResult()
@@ -133,75 +211,582 @@ class FindAndSimplifyUGates(RewriteRule):
 
 @dataclass
 class MergeConsecutiveU(Pass):
+    atol: float = su2.DEFAULT_ATOL   # tolerance of the fusion kernel, see su2.zyz_angles
+    analyses: Analyses | None = None    # shared analysis results, if run by a PassManager
+
     def unsafe_run(self, method: ir.Method):
         print("Running unsafe run MergeConsecutiveU")
+        analyses = self.analyses or Analyses(self.dialects)
 
-        result = Fixpoint(Walk(CommonSubexpressionElimination())).rewrite(method.code)
+        result = analyses.cse(method, "MergeConsecutiveU CSE")
 
-        loop_res = RewriteResult(has_done_something=True)
-        while loop_res.has_done_something:
-            frame, _ = const.Propagate(self.dialects).run_analysis(method)
-            Walk(WrapConst(frame)).rewrite(method.code)#.join(result)
-            loop_res = Walk(UniteU3()).rewrite(method.code)
+        # a single constant propagation: FuseConsecutiveU and Simplify2PiConst
+        # attach the "const" hint to every constant they create
+        Walk(WrapConst(analyses.const_frame(method))).rewrite(method.code)
+        with tracing.span("FuseConsecutiveU", method):
+            result = analyses.changed(FuseConsecutiveU(atol=self.atol).rewrite(method.code)).join(result)
             
-        result = Walk(Simplify2PiConst()).rewrite(method.code)#.join(result)
-        frame, _ = const.Propagate(self.dialects).run_analysis(method)
-        result = Walk(WrapConst(frame)).rewrite(method.code)# .join(result)
-        result = Walk(FindAndSimplifyUGates()).rewrite(method.code).join(result)
-
-        rule = Chain(
-            ConstantFold(),
-            DeadCodeElimination(),
-            CommonSubexpressionElimination(),
-        )
-        result = Fixpoint(Walk(rule)).rewrite(method.code).join(result)
+        result = analyses.changed(Walk(Simplify2PiConst()).rewrite(method.code)).join(result)
+        result = analyses.changed(Walk(FindAndSimplifyUGates()).rewrite(method.code)).join(result)
+
+        result = analyses.cleanup(method, "MergeConsecutiveU cleanup").join(result)
         return result
     
     
 @dataclass
-class UniteU3(RewriteRule):
-    def rewrite_Statement(self, node: ir.Statement) -> RewriteResult:
-        if not isinstance(node, uop.UGate):
+class FuseConsecutiveU(RewriteRule):
+    """
+    One forward sweep per block: keeps the pending run of U gates of each qubit
+    and closes the run when another statement touches the qubit.
+    All the runs of a block are then fused by a single su2.fuse_runs call.
+    Angles are read from the "const" hints, so WrapConst must have run before.
+    """
+    atol: float = su2.DEFAULT_ATOL
+
+    def rewrite_Block(self, node: ir.Block) -> RewriteResult:
+        pending: dict[ir.SSAValue, list[uop.UGate]] = {}
+        runs: list[list[uop.UGate]] = []
+
+        stmt = node.first_stmt
+        while stmt is not None:
+            if isinstance(stmt, uop.UGate):
+                pending.setdefault(stmt.qarg, []).append(stmt)
+            else:
+                closed = [arg for arg in stmt.args if arg in pending]
+                # the parallel and global gates have their qubits in IList arguments, resolved by qubit
+                # (gates on single qubits close their runs through their own arguments above)
+                touched = () if stmt.has_trait(ir.Pure) else peephole.touched(stmt)
+                if touched is None or stmt.regions or touched and (touched[1]
+                        or any(isinstance(arg.owner, ilist.New) for arg in stmt.args)):
+                    for qarg in pending:
+                        q = peephole.qubit(qarg)
+                        if touched is None or stmt.regions or q is None or peephole.is_touched(q, touched):
+                            closed.append(qarg)
+                for qarg in closed:
+                    run = pending.pop(qarg, None)
+                    if run is not None and len(run) > 1:
+                        runs.append(run)
+            stmt = stmt.next_stmt
+        runs.extend(run for run in pending.values() if len(run) > 1)
+
+        if not runs:
             return RewriteResult()
 
-        # scan for the very next U on the same qubit
-        in_q = node.args[0]
-        scan = node.next_stmt
-        partner = None
-        while scan:
-            if in_q in scan.args:
-                if isinstance(scan, uop.UGate):
-                    partner = scan
-                break
-            scan = scan.next_stmt
-        if partner is None:
+        # the global phase of a lone U is unobservable, it is dropped
+        fused, _ = su2.fuse_runs([
+            [(gate.theta.hints["const"].data,
+              gate.phi.  hints["const"].data,
+              gate.lam.  hints["const"].data) for gate in run]
+            for run in runs
+        ], atol=self.atol)
+
+        pool = ConstantPool(node)
+        for run, run_angles in zip(runs, fused):
+            self.replace_run(run, [float(angle) for angle in run_angles], pool)
+        return RewriteResult(has_done_something=True)
+
+    def rewrite_Region(self, node: ir.Region) -> RewriteResult:
+        result = RewriteResult()
+        for block in node.blocks:
+            result = self.rewrite_Block(block).join(result)
+        return result
+
+    def rewrite_Statement(self, node: ir.Statement) -> RewriteResult:
+        result = RewriteResult()
+        for region in node.regions:
+            result = self.rewrite_Region(region).join(result)
+        return result
+
+    def replace_run(self, run: list[uop.UGate], angles: list[float], pool: ConstantPool):
+        # the pooled constants are at the top of the block, so they dominate the gate
+        first = run[0]
+        first.replace_by(uop.UGate(first.qarg, *pool.u_angles(*angles)))
+        for gate in run[1:]:
+            gate.delete()
+
+
+
+@dataclass
+class PeepholeCancellation(Pass):
+    """
+    Cancels inverse pairs, fuses phase gates through the diagonal gates between
+    them and turns H·CX·H into CZ, with the indexed engine of peephole.py:
+    one sweep per block, rewritten gates are matched again from a worklist.
+    """
+    window: int = 8     # gates looked back through on each qubit
+    analyses: Analyses | None = None    # shared analysis results, if run by a PassManager
+
+    def unsafe_run(self, method: ir.Method):
+        analyses = self.analyses or Analyses(self.dialects)
+        Walk(WrapConst(analyses.const_frame(method))).rewrite(method.code)
+
+        removed = 0
+        for block in method.callable_region.blocks:
+            engine = peephole.Engine(window=self.window)
+            engine.run(block)
+            removed += engine.removed
+        print(f"PeepholeCancellation: {removed} gates removed")
+
+        result = analyses.changed(RewriteResult(has_done_something=removed > 0))
+        return analyses.cleanup(method, "PeepholeCancellation cleanup").join(result)
+
+
+# the uop gates that are diagonal in the computational basis, they commute with each other
+DIAGONAL_GATES = (uop.CZ, uop.RZ, uop.U1, uop.Z, uop.S, uop.Sdag, uop.T, uop.Tdag, uop.Id, uop.CU1, uop.CRZ, uop.RZZ)
+
+@dataclass
+class _Element:
+    # one gate of a block, parallel gates contribute one per qubit (pair)
+    kind: str               # "u", "rz", "cz", or "other": the statement is moved as it is
+    stmt: ir.Statement      # the statement it comes from
+    qargs: tuple = ()       # qubit SSA values
+    angles: tuple = ()      # angle SSA values
+
+@dataclass
+class ScheduleParallel(Pass):
+    """
+    Parallelisation by moments: the U, RZ and CZ gates of each block, single or
+    parallel, are rescheduled with schedule.schedule, which lets diagonal gates
+    (CZ, phase rotations) commute, and each moment becomes one parallel statement.
+    Gates are re-emitted before the block terminator; blocks with control flow or
+    gates on qubits not known at compile time are left alone.
+    """
+    atol: float = su2.DEFAULT_ATOL      # a U gate with |theta| below this is diagonal
+    analyses: Analyses | None = None    # shared analysis results, if run by a PassManager
+
+    def unsafe_run(self, method: ir.Method):
+        analyses = self.analyses or Analyses(self.dialects)
+        Walk(WrapConst(analyses.const_frame(method))).rewrite(method.code)
+
+        result = RewriteResult()
+        for block in method.callable_region.blocks:
+            with tracing.span("ScheduleParallel block"):
+                result = analyses.changed(self.schedule_block(block)).join(result)
+        return analyses.cleanup(method, "ScheduleParallel cleanup").join(result)
+
+    def schedule_block(self, block: ir.Block) -> RewriteResult:
+        self._sizes: dict[ir.SSAValue, int] = {}    # qreg → number of qubits
+        elements: list[_Element] = []
+        gates: list[schedule.Gate] = []
+        terminator = None
+
+        for stmt in block.stmts:
+            if isinstance(stmt, core.QRegNew):
+                self._sizes[stmt.result] = constant(stmt.n_qubits)
+            elif stmt.has_trait(ir.IsTerminator):
+                terminator = stmt
+            elif stmt.regions:
+                return RewriteResult()
+            elif isinstance(stmt, (uop.UGate, uop.RZ, uop.CZ, parallel.UGate, parallel.RZ, parallel.CZ)):
+                split = self.split(stmt)
+                if split is None:
+                    return RewriteResult()
+                for element, gate in split:
+                    elements.append(element)
+                    gates.append(gate)
+            elif stmt.dialect is uop.dialect or isinstance(stmt, (glob.UGate, core.Measure, core.Reset)):
+                qubits = self.touched(stmt)
+                if qubits is None:
+                    return RewriteResult()
+                elements.append(_Element("other", stmt))
+                gates.append(schedule.Gate(None, tuple(qubits), isinstance(stmt, DIAGONAL_GATES)))
+            elif not (stmt.has_trait(ir.Pure) or isinstance(stmt, core.CRegNew)):
+                return RewriteResult()
+
+        if len(elements) < 2:
             return RewriteResult()
 
-        # pull out the old angles
-        θ1,φ1,λ1 = (node.theta.hints["const"].data,
-                    node.phi.  hints["const"].data,
-                    node.lam.  hints["const"].data)
-        θ2,φ2,λ2 = (partner.theta.hints["const"].data,
-                    partner.phi.  hints["const"].data,
-                    partner.lam.  hints["const"].data)
-
-        # compute the fused triple
-        newθ, newφ, newλ = computeProductMatrix(θ1,φ1,λ1, θ2,φ2,λ2)
-
-        # — now do one atomic replacement —
-        # 1) build the new Constant stmts
-        cθ = pyDialect.Constant(newθ.real)
-        cφ = pyDialect.Constant(newφ)
-        cλ = pyDialect.Constant(newλ)
-        # 2) insert them BEFORE the old node so they dominate it
-        cθ.insert_before(node)
-        cφ.insert_before(node)
-        cλ.insert_before(node)
-        # 3) build your merged UGate
-        merged = uop.UGate(in_q, cθ.result, cφ.result, cλ.result)
-        # 4) splice it in, nuking the old node
-        node.replace_by(merged)
-        # 5) delete the partner
-        partner.delete()
-
-        return RewriteResult(has_done_something=True)
\ No newline at end of file
+        # every gate is re-emitted, in the order of the moments: the values they use
+        # are all defined by the statements left in place
+        moments = schedule.schedule(gates)
+        kept = set()
+        for moment in moments:
+            for stmt in self.emit([elements[i] for i in moment]):
+                if stmt.parent_block is block:
+                    stmt.detach()
+                    kept.add(stmt)
+                if terminator is None:
+                    block.stmts.append(stmt)
+                else:
+                    stmt.insert_before(terminator)
+        for stmt in {element.stmt for element in elements} - kept:
+            stmt.delete()
+        return RewriteResult(has_done_something=True)
+
+    def qubit(self, ssa: ir.SSAValue):
+        # (qreg, index) of a qubit, None if not known at compile time
+        stmt = ssa.owner
+        if isinstance(stmt, core.QRegGet) and self._sizes.get(stmt.reg) is not None:
+            idx = constant(stmt.idx)
+            if isinstance(idx, int):
+                return (stmt.reg, idx)
+        return None
+
+    def register(self, ssa: ir.SSAValue):
+        # the qubits of a whole qreg, None if it is not a qreg of known size
+        if self._sizes.get(ssa) is None:
+            return None
+        return [(ssa, i) for i in range(self._sizes[ssa])]
+
+    @staticmethod
+    def values(ssa: ir.SSAValue):
+        stmt = ssa.owner
+        return stmt.values if isinstance(stmt, ilist.New) else None
+
+    def split(self, stmt: ir.Statement):
+        """
+        @returns an (_Element, schedule.Gate) per U, RZ or CZ of stmt, None if a qubit is unknown
+        """
+        if isinstance(stmt, (uop.CZ, parallel.CZ)):
+            if isinstance(stmt, uop.CZ):
+                pairs = [(stmt.ctrl, stmt.qarg)]
+            else:
+                ctrls, qargs = self.values(stmt.ctrls), self.values(stmt.qargs)
+                if ctrls is None or qargs is None:
+                    return None
+                pairs = list(zip(ctrls, qargs))
+            kind, angles, diagonal = "cz", (), True
+        else:
+            if isinstance(stmt, (uop.UGate, uop.RZ)):
+                qargs = [stmt.qarg]
+            else:
+                qargs = self.values(stmt.qargs)
+                if qargs is None:
+                    return None
+            pairs = [(q,) for q in qargs]
+            if isinstance(stmt, (uop.RZ, parallel.RZ)):
+                kind, angles, diagonal = "rz", (stmt.theta,), True
+            else:
+                theta = constant(stmt.theta)
+                kind, angles = "u", (stmt.theta, stmt.phi, stmt.lam)
+                diagonal = theta is not None and abs(theta) < self.atol
+
+        # gates with the same constant angles share a moment, whatever the SSA holding them
+        key = (kind,) + tuple(ssa if constant(ssa) is None else constant(ssa) for ssa in angles)
+        split = []
+        for pair in pairs:
+            qubits = tuple(map(self.qubit, pair))
+            if None in qubits:
+                return None
+            split.append((_Element(kind, stmt, pair, angles), schedule.Gate(key, qubits, diagonal)))
+        return split
+
+    def touched(self, stmt: ir.Statement):
+        """
+        @returns the qubits (and the classical state) stmt acts on, None if one is unknown
+        """
+        if isinstance(stmt, glob.UGate):
+            regs = self.values(stmt.registers)
+            if regs is None:
+                return None
+            qubits = [self.register(r) for r in regs]
+            return None if None in qubits else [q for qs in qubits for q in qs]
+
+        qubits = []
+        for arg in stmt.args:
+            if isinstance(arg.owner, core.QRegNew):
+                qubits += self.register(arg) or [None]
+            elif isinstance(arg.owner, core.QRegGet):
+                qubits.append(self.qubit(arg))
+        if None in qubits:
+            return None
+        if isinstance(stmt, (core.Measure, core.Reset)):
+            qubits.append("classical")
+        return qubits
+
+    @staticmethod
+    def emit(moment: list[_Element]) -> list[ir.Statement]:
+        """
+        @returns the statements running the moment: the original statement if it can
+        be kept, else a new single or parallel gate (after the ilist.New of its qubits)
+        """
+        first = moment[0]
+        single = {"u": uop.UGate, "rz": uop.RZ, "cz": uop.CZ}.get(first.kind)
+        if len(moment) == 1:
+            if single is None or isinstance(first.stmt, single):
+                return [first.stmt]
+            return [single(*first.qargs, *first.angles)]
+
+        if first.kind == "cz":
+            ctrls = ilist.New(values=tuple(e.qargs[0] for e in moment))
+            qargs = ilist.New(values=tuple(e.qargs[1] for e in moment))
+            return [ctrls, qargs, parallel.CZ(ctrls=ctrls.result, qargs=qargs.result)]
+        qargs = ilist.New(values=tuple(e.qargs[0] for e in moment))
+        gate = parallel.UGate if first.kind == "u" else parallel.RZ
+        return [qargs, gate(qargs.result, *first.angles)]
+
+
+@dataclass
+class GlobalRotations(Pass):
+    """
+    Substitutes the layers of equal U gates on more than half the qubits with a
+    global rotation (glob.UGate) and the inverse U on the remaining qubits.
+    A layer is a run of U gates, single or parallel, with the same constant
+    angles on distinct qubits and only pure statements in between.
+    The inverse on a qubit whose next gate is a U is fused into it instead.
+    Pulses are estimated as one per addressed qubit and one per global rotation,
+    a layer is substituted if this saves at least min_savings of them.
+    The savings are those of the parallel form: sequential QASM writes a global
+    rotation as one U per qubit, so there the pass adds gates.
+    """
+    min_savings: int = 1
+    analyses: Analyses | None = None    # shared analysis results, if run by a PassManager
+
+    def unsafe_run(self, method: ir.Method):
+        analyses = self.analyses or Analyses(self.dialects)
+        Walk(WrapConst(analyses.const_frame(method))).rewrite(method.code)
+
+        layers = saved = 0
+        for block in method.callable_region.blocks:
+            pool = None
+            candidates = list(self.find_layers(block))
+            layer_of = {stmt: (layer, qubits) for layer, qubits, _ in candidates for stmt in layer}
+            for layer, qubits, registers in candidates:
+                if not layer:
+                    continue
+                rest = [(reg, i) for reg, size in registers.items() for i in range(size) if (reg, i) not in qubits]
+                folds = self.next_u(layer[-1], rest)
+                # the inverses fused into a U cost no pulse
+                savings = len(qubits) - 1 - (len(rest) - len(folds))
+                if savings >= self.min_savings:
+                    pool = pool or ConstantPool(block)
+                    self.substitute(layer, rest, registers, folds, pool)
+                    layers += 1
+                    saved += savings
+                    # a U fused with an inverse leaves its layer (the global rotation and the inverse it
+                    # replaces stay adjacent on its qubit, so the layer may still be substituted around it)
+                    for q, gate in folds.items():
+                        if gate in layer_of:
+                            later, later_qubits = layer_of.pop(gate)
+                            later.remove(gate)
+                            later_qubits.discard(q)
+        print(f"GlobalRotations: {layers} layers substituted, ~{saved} pulses saved")
+
+        result = analyses.changed(RewriteResult(has_done_something=layers > 0))
+        return analyses.cleanup(method, "GlobalRotations cleanup").join(result)
+
+    @staticmethod
+    def find_layers(block: ir.Block):
+        """
+        @yields the layers of block as (U statements, {(qreg, index) of their qubits},
+        {qreg: size} of the registers declared before them)
+        """
+        registers: dict[ir.SSAValue, int] = {}
+        layer, qubits, angles = [], set(), None
+
+        def gate_qubits(stmt):
+            qargs = [stmt.qarg] if isinstance(stmt, uop.UGate) else ScheduleParallel.values(stmt.qargs) or [None]
+            found = set()
+            for q in qargs:
+                owner = getattr(q, "owner", None)
+                if not isinstance(owner, core.QRegGet) or owner.reg not in registers \
+                        or not isinstance(constant(owner.idx), int):
+                    return None
+                found.add((owner.reg, constant(owner.idx)))
+            return found if len(found) == len(qargs) else None
+
+        for stmt in block.stmts:
+            if isinstance(stmt, core.QRegNew):
+                size = constant(stmt.n_qubits)
+                if isinstance(size, int):
+                    registers[stmt.result] = size
+                continue
+            if isinstance(stmt, (uop.UGate, parallel.UGate)):
+                stmt_angles = tuple(constant(a) for a in (stmt.theta, stmt.phi, stmt.lam))
+                stmt_qubits = gate_qubits(stmt)
+                if None not in stmt_angles and stmt_qubits is not None:
+                    if stmt_angles == angles and qubits.isdisjoint(stmt_qubits):
+                        layer.append(stmt)
+                        qubits |= stmt_qubits
+                        continue
+                    if layer:
+                        yield layer, qubits, dict(registers)
+                    layer, qubits, angles = [stmt], stmt_qubits, stmt_angles
+                    continue
+            elif stmt.has_trait(ir.Pure):
+                continue
+            if layer:
+                yield layer, qubits, dict(registers)
+            layer, qubits, angles = [], set(), None
+        if layer:
+            yield layer, qubits, dict(registers)
+
+    @staticmethod
+    def next_u(anchor: ir.Statement, qubits: list) -> dict:
+        """
+        @returns {(qreg, index): U statement} for the qubits whose next gate after anchor is a U
+        with constant angles, that an inverse can be fused into
+        """
+        remaining, found = set(qubits), {}
+        stmt = anchor.next_stmt
+        while stmt is not None and remaining:
+            q = peephole.qubit(stmt.qarg) if isinstance(stmt, uop.UGate) else None
+            if q in remaining and None not in (constant(a) for a in (stmt.theta, stmt.phi, stmt.lam)):
+                found[q] = stmt
+                remaining.discard(q)
+            elif not stmt.has_trait(ir.Pure):
+                touched = peephole.touched(stmt)
+                if touched is None or stmt.regions:
+                    break
+                remaining = {q for q in remaining if not peephole.is_touched(q, touched)}
+            stmt = stmt.next_stmt
+        return found
+
+    @staticmethod
+    def substitute(layer: list[ir.Statement], rest: list, registers: dict[ir.SSAValue, int], folds: dict,
+                   pool: ConstantPool):
+        # the new statements go before the last gate of the layer, where every value it uses is defined
+        # (the constants come from the pool, at the top of the block)
+        anchor = layer[-1]
+        def insert(stmt):
+            stmt.insert_before(anchor)
+            return stmt
+
+        theta, phi, lam = (constant(a) for a in (anchor.theta, anchor.phi, anchor.lam))
+        regs = insert(ilist.New(values=tuple(registers)))
+        insert(glob.UGate(regs.result, *pool.u_angles(theta, phi, lam)))
+
+        # U(theta, phi, lam)^-1 = U(-theta, -lam, -phi)
+        inverse = (-theta, -lam, -phi)
+        if folds:
+            gates = list(folds.values())
+            fused, _ = su2.fuse([inverse] * len(gates), [[constant(a) for a in (u.theta, u.phi, u.lam)] for u in gates])
+            for gate, gate_angles in zip(gates, fused):
+                gate.replace_by(uop.UGate(gate.qarg, *pool.u_angles(*gate_angles)))
+
+        rest = [insert(core.QRegGet(reg, pool.get(i))).result for reg, i in rest if (reg, i) not in folds]
+        if rest:
+            if len(rest) == 1:
+                insert(uop.UGate(rest[0], *pool.u_angles(*inverse)))
+            else:
+                qargs = insert(ilist.New(values=tuple(rest)))
+                insert(parallel.UGate(qargs.result, *pool.u_angles(*inverse)))
+        for stmt in layer:
+            stmt.delete()
+
+
+@dataclass
+class _TwoQubitBlock:
+    qubits: tuple                           # the two (qreg, index)
+    qargs: dict                             # (qreg, index) → a qubit SSA value of it
+    stmts: list = field(default_factory=list)
+    cz: int = 0
+
+@dataclass
+class ResynthesizeTwoQubitBlocks(Pass):
+    """
+    Collects the maximal blocks of U and CZ gates acting on a single qubit pair
+    and re-synthesizes each with the minimum number of CZs (see su4), when that
+    is fewer than the block has. Blocks with as many CZs are kept as they are:
+    their U gates are left to MergeConsecutiveU, which can also fuse them with
+    the gates around the block. The new gates are inserted at the last gate of the block.
+    """
+    atol: float = su2.DEFAULT_ATOL
+    analyses: Analyses | None = None    # shared analysis results, if run by a PassManager
+
+    def unsafe_run(self, method: ir.Method):
+        analyses = self.analyses or Analyses(self.dialects)
+        result = analyses.cse(method, "ResynthesizeTwoQubitBlocks CSE")
+        Walk(WrapConst(analyses.const_frame(method))).rewrite(method.code)
+
+        replaced = saved = 0
+        for block in method.callable_region.blocks:
+            pool = None
+            for two_qubit_block in self.find_blocks(block):
+                gates = self.gates(two_qubit_block)
+                unitary = su4.block_unitary(gates)
+                if su4.cz_count(unitary) >= two_qubit_block.cz:
+                    continue
+                new = su4.synthesize(unitary, atol=self.atol)
+                new_cz = sum(1 for gate in new if gate[0] == "cz")
+                pool = pool or ConstantPool(block)
+                self.replace(two_qubit_block, new, pool)
+                replaced += 1
+                saved += two_qubit_block.cz - new_cz
+        print(f"ResynthesizeTwoQubitBlocks: {replaced} blocks re-synthesized, {saved} CZs saved")
+
+        result = analyses.changed(RewriteResult(has_done_something=replaced > 0)).join(result)
+        return analyses.cleanup(method, "ResynthesizeTwoQubitBlocks cleanup").join(result)
+
+    @staticmethod
+    def qubit(ssa: ir.SSAValue):
+        owner = ssa.owner
+        if isinstance(owner, core.QRegGet):
+            idx = constant(owner.idx)
+            if isinstance(idx, int):
+                return (owner.reg, idx)
+        return None
+
+    @classmethod
+    def find_blocks(cls, block: ir.Block) -> list[_TwoQubitBlock]:
+        """
+        One forward sweep: U gates wait on their qubit until a CZ pulls them into a block,
+        a block stays open until another statement touches one of its qubits.
+        The statements of a block are in a valid order (only U gates on distinct qubits are swapped)
+        """
+        blocks: list[_TwoQubitBlock] = []
+        open_blocks: dict = {}      # qubit → its open block
+        pending: dict = {}          # qubit → U gates not in a block yet
+
+        def close(q):
+            pending.pop(q, None)
+            current = open_blocks.get(q)
+            if current is not None:
+                for other in current.qubits:
+                    open_blocks.pop(other, None)
+
+        for stmt in block.stmts:
+            if isinstance(stmt, uop.UGate):
+                q = cls.qubit(stmt.qarg)
+                if q is not None and None not in (constant(a) for a in (stmt.theta, stmt.phi, stmt.lam)):
+                    if q in open_blocks:
+                        open_blocks[q].stmts.append(stmt)
+                    else:
+                        pending.setdefault(q, []).append(stmt)
+                    continue
+            elif isinstance(stmt, uop.CZ):
+                a, b = cls.qubit(stmt.ctrl), cls.qubit(stmt.qarg)
+                if a is not None and b is not None and a != b:
+                    current = open_blocks.get(a)
+                    if current is None or current is not open_blocks.get(b):
+                        run = pending.pop(a, []) + pending.pop(b, [])
+                        close(a)
+                        close(b)
+                        current = _TwoQubitBlock((a, b), {a: stmt.ctrl, b: stmt.qarg}, run)
+                        blocks.append(current)
+                        open_blocks[a] = open_blocks[b] = current
+                    current.stmts.append(stmt)
+                    current.cz += 1
+                    continue
+            elif stmt.has_trait(ir.Pure):
+                continue
+
+            # also the parallel and global gates, whose qubits are in IList arguments
+            touched = peephole.touched(stmt)
+            for q in list(open_blocks) + list(pending):
+                if touched is None or stmt.regions or peephole.is_touched(q, touched):
+                    close(q)
+        return blocks
+
+    def gates(self, two_qubit_block: _TwoQubitBlock) -> list[tuple]:
+        index = {q: i for i, q in enumerate(two_qubit_block.qubits)}
+        gates = []
+        for stmt in two_qubit_block.stmts:
+            if isinstance(stmt, uop.CZ):
+                gates.append(("cz",))
+            else:
+                gates.append(("u", index[self.qubit(stmt.qarg)],
+                              tuple(constant(a) for a in (stmt.theta, stmt.phi, stmt.lam))))
+        return gates
+
+    @staticmethod
+    def replace(two_qubit_block: _TwoQubitBlock, gates: list[tuple], pool: ConstantPool):
+        anchor = two_qubit_block.stmts[-1]
+        qargs = [two_qubit_block.qargs[q] for q in two_qubit_block.qubits]
+        for gate in gates:
+            if gate[0] == "cz":
+                uop.CZ(qargs[0], qargs[1]).insert_before(anchor)
+                continue
+            uop.UGate(qargs[gate[1]], *pool.u_angles(*gate[2])).insert_before(anchor)
+        for stmt in two_qubit_block.stmts:
+            stmt.delete()
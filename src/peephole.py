@@ -0,0 +1,287 @@
+"""
+Indexed peephole engine cancelling gates of a block.
+
+The engine keeps, per qubit, the list of the gates still alive on it (its
+index) and matches each gate against the most recent ones: a gate looks back
+on its qubits through at most `window` gates it commutes with, so a match
+costs constant time per gate. Rules:
+
+- inverse pairs cancel (CZ·CZ, CX·CX, H·H, ..., U·U⁻¹)
+- diagonal single-qubit gates fuse into one phase U(0, 0, λ), through the
+  diagonal gates (CZ, phase rotations) between them, and vanish if λ ≡ 0
+- H·CX·H on the target becomes a CZ
+
+A rewritten gate goes on a worklist and is matched again against the gates
+before it, so cancellations cascade (A·B·B⁻¹·A⁻¹) without re-walking the block.
+"""
+import math
+
+from kirin import ir
+from kirin.decl import fields
+from kirin.dialects import ilist
+from bloqade.qasm2.dialects import core, uop
+from bloqade.qasm2.types import QubitType
+
+import su2
+from angles import ConstantPool
+from metrics import constant
+
+SELF_INVERSE = (uop.H, uop.X, uop.Y, uop.Z, uop.CX, uop.CY, uop.CZ, uop.Swap, uop.CCX, uop.CH, uop.CSwap, uop.Id)
+INVERSE_PAIRS = {uop.S: uop.Sdag, uop.Sdag: uop.S, uop.T: uop.Tdag, uop.Tdag: uop.T, uop.SX: uop.SXdag, uop.SXdag: uop.SX}
+# gates whose qubits can be exchanged (the controls of CCX)
+SYMMETRIC = {uop.CZ: None, uop.Swap: None, uop.CCX: 2}
+
+FIXED_PHASES = {uop.Z: math.pi, uop.S: math.pi / 2, uop.Sdag: -math.pi / 2, uop.T: math.pi / 4, uop.Tdag: -math.pi / 4}
+DIAGONAL_TWO_QUBIT = (uop.CZ, uop.CU1, uop.CRZ, uop.RZZ)
+
+
+def qubit(ssa: ir.SSAValue):
+    """
+    @returns (qreg, index) of a qubit, None if not known at compile time
+    """
+    owner = ssa.owner
+    if isinstance(owner, core.QRegGet):
+        idx = constant(owner.idx)
+        if isinstance(idx, int):
+            return (owner.reg, idx)
+    return None
+
+_QUBIT_FIELDS = {}  # uop statement class → names of its qubit arguments
+
+def qubit_args(stmt: ir.Statement) -> list[ir.SSAValue]:
+    """
+    @returns the arguments of a uop gate declared as qubits, in order (e.g. ctrl, qarg)
+    """
+    names = _QUBIT_FIELDS.get(type(stmt))
+    if names is None:
+        names = _QUBIT_FIELDS[type(stmt)] = [name for name, field in fields(stmt).args.items()
+                                              if field.type.is_subseteq(QubitType)]
+    return [getattr(stmt, name) for name in names]
+
+def touched(stmt: ir.Statement):
+    """
+    @returns ({(qreg, index)}, {qreg}): the qubits and the whole registers stmt acts on, also through
+    its IList arguments (parallel and global gates), None if it may act on qubits not known at compile time
+    """
+    qubits, registers = set(), set()
+    for arg in stmt.args:
+        values = arg.owner.values if isinstance(arg.owner, ilist.New) else (arg,)
+        for value in values:
+            owner = value.owner
+            if isinstance(owner, core.QRegGet):
+                q = qubit(value)
+                if q is None:
+                    return None
+                qubits.add(q)
+            elif isinstance(owner, core.QRegNew):
+                registers.add(value)
+            elif isinstance(value, ir.BlockArgument):
+                return None
+    return qubits, registers
+
+def is_touched(q, touched_qubits) -> bool:
+    """
+    @param touched_qubits: the result of touched(), not None
+    """
+    qubits, registers = touched_qubits
+    return q in qubits or q[0] in registers
+
+def phase(stmt: ir.Statement):
+    """
+    @returns λ if stmt is diag(1, exp(iλ)) up to a global phase, else None
+    """
+    if type(stmt) in FIXED_PHASES:
+        return FIXED_PHASES[type(stmt)]
+    if isinstance(stmt, (uop.RZ, uop.U1)):
+        return constant(stmt.theta if isinstance(stmt, uop.RZ) else stmt.lam)
+    if isinstance(stmt, uop.UGate):
+        theta, phi, lam = (constant(a) for a in (stmt.theta, stmt.phi, stmt.lam))
+        if None not in (theta, phi, lam) and abs(theta) < su2.DEFAULT_ATOL:
+            return phi + lam
+    return None
+
+def is_diagonal(stmt: ir.Statement) -> bool:
+    return isinstance(stmt, DIAGONAL_TWO_QUBIT) or phase(stmt) is not None
+
+def _wraps_to_zero(angle: float, atol: float) -> bool:
+    return abs(math.remainder(angle, 2 * math.pi)) < atol
+
+
+class Engine:
+    def __init__(self, window = 8, atol = 1e-10):
+        self.window = window
+        self.atol = atol
+        self.index: dict = {}       # qubit → alive gates on it, in program order
+        self.qubits: dict = {}      # gate → its qubits
+        self.removed = 0            # gates deleted
+        self.pool = None            # the constants of the new gates, see run()
+
+    # -- index --------------------------------------------------------------
+
+    def fence(self, qubits = None):
+        """
+        Forgets the gates on qubits (all if None): later gates are not matched across the fence
+        """
+        for q in list(self.index) if qubits is None else qubits:
+            for gate in self.index.pop(q, ()):
+                self.qubits.pop(gate, None)
+
+    def add(self, stmt: ir.Statement, qubits: tuple):
+        self.qubits[stmt] = qubits
+        for q in qubits:
+            self.index.setdefault(q, []).append(stmt)
+
+    @staticmethod
+    def _position(gates: list, stmt) -> int:
+        # gates are matched near the end of the index: search from there
+        for i in range(len(gates) - 1, -1, -1):
+            if gates[i] is stmt:
+                return i
+        raise ValueError(stmt)
+
+    def _unindex(self, stmt):
+        for q in self.qubits.pop(stmt):
+            gates = self.index[q]
+            del gates[self._position(gates, stmt)]
+
+    def delete(self, stmt):
+        self._unindex(stmt)
+        stmt.delete()
+        self.removed += 1
+
+    def replace(self, old, new) -> ir.Statement:
+        qubits = self.qubits[old]
+        for q in qubits:
+            gates = self.index[q]
+            gates[self._position(gates, old)] = new
+        self.qubits[new] = self.qubits.pop(old)
+        old.replace_by(new)
+        return new
+
+    def previous(self, stmt, q, commuting = True):
+        """
+        @yields the gates before stmt on qubit q, most recent first, while they commute
+        with stmt (only the first one if not commuting), at most window of them
+        """
+        gates = self.index[q]
+        start = self._position(gates, stmt)
+        for i in range(start - 1, max(start - 1 - self.window, -1), -1):
+            yield gates[i]
+            if not (commuting and is_diagonal(stmt) and is_diagonal(gates[i])):
+                return
+
+    def reachable(self, stmt, earlier) -> bool:
+        # earlier is found looking back from stmt on all the qubits of stmt
+        return all(any(gate is earlier for gate in self.previous(stmt, q)) for q in self.qubits[stmt])
+
+    # -- rules --------------------------------------------------------------
+
+    def run(self, block: ir.Block):
+        """
+        Matches the gates of block in program order, and the rewritten ones again
+        """
+        self.pool = ConstantPool(block)
+        for stmt in list(block.stmts):
+            if stmt.parent_block is not block:
+                continue    # deleted by a rule
+            if stmt.dialect is uop.dialect and not isinstance(stmt, uop.Barrier):
+                # a qubit not known at compile time (e.g. a block argument) may be any of them
+                qubits = tuple(qubit(arg) for arg in qubit_args(stmt))
+                if None in qubits or len(qubits) != len(set(qubits)):
+                    self.fence()
+                    continue
+                self.add(stmt, qubits)
+                worklist = [stmt]
+                while worklist:
+                    gate = worklist.pop()
+                    if gate in self.qubits:
+                        worklist += self.match(gate)
+            elif stmt.has_trait(ir.Pure) or isinstance(stmt, (core.CRegNew, core.QRegNew)):
+                continue
+            elif isinstance(stmt, uop.Barrier):
+                qubits = [qubit(arg) for arg in stmt.qargs]
+                self.fence(None if None in qubits else qubits)
+            else:
+                # also the parallel and global gates, whose qubits are in IList arguments
+                stmt_qubits = touched(stmt)
+                if stmt_qubits is None or stmt.regions:
+                    self.fence()
+                else:
+                    self.fence([q for q in self.index if is_touched(q, stmt_qubits)])
+
+    def match(self, stmt) -> list:
+        """
+        Applies the first rule matching stmt against the gates before it
+        @returns the gates to match again
+        """
+        for rule in (self.cancel_inverse, self.fuse_phases, self.h_cx_h):
+            again = rule(stmt)
+            if again is not None:
+                return again
+        return []
+
+    def cancel_inverse(self, stmt):
+        q = self.qubits[stmt][0]
+        for earlier in self.previous(stmt, q):
+            if self.inverse(earlier, stmt) and self.reachable(stmt, earlier):
+                self.delete(earlier)
+                self.delete(stmt)
+                return []
+        return None
+
+    def inverse(self, a, b) -> bool:
+        qa, qb = self.qubits[a], self.qubits[b]
+        if type(a) in SYMMETRIC:
+            # compare the exchangeable qubits as a set
+            n = SYMMETRIC[type(a)] or len(qa)
+            same_qubits = set(qa[:n]) == set(qb[:n]) and qa[n:] == qb[n:]
+        else:
+            same_qubits = qa == qb
+        if not same_qubits:
+            return False
+        if isinstance(a, SELF_INVERSE):
+            return type(a) is type(b)
+        if type(a) in INVERSE_PAIRS:
+            return type(b) is INVERSE_PAIRS[type(a)]
+        if isinstance(a, uop.UGate) and isinstance(b, uop.UGate):
+            angles = [tuple(constant(x) for x in (g.theta, g.phi, g.lam)) for g in (a, b)]
+            if None in angles[0] or None in angles[1]:
+                return False
+            fused, _ = su2.fuse(angles[0], angles[1], atol=self.atol)
+            return all(abs(angle) < self.atol for angle in fused)
+        return False
+
+    def fuse_phases(self, stmt):
+        lam = phase(stmt)
+        if lam is None:
+            return None
+        q = self.qubits[stmt][0]
+        for earlier in self.previous(stmt, q):
+            earlier_lam = phase(earlier)
+            if earlier_lam is None or self.qubits[earlier] != (q,):
+                continue
+            total = earlier_lam + lam
+            self.delete(stmt)
+            if _wraps_to_zero(total, self.atol):
+                self.delete(earlier)
+                return []
+            return [self.replace(earlier, self.phase_gate(earlier, math.remainder(total, 2 * math.pi)))]
+        return None
+
+    def phase_gate(self, anchor: ir.Statement, lam: float) -> uop.UGate:
+        qarg, = qubit_args(anchor)
+        return uop.UGate(qarg, *self.pool.u_angles(0.0, 0.0, lam))
+
+    def h_cx_h(self, stmt):
+        if not isinstance(stmt, uop.H):
+            return None
+        target = self.qubits[stmt][0]
+        cx = next(self.previous(stmt, target, commuting=False), None)
+        if not isinstance(cx, uop.CX) or self.qubits[cx][1] != target:
+            return None
+        h = next(self.previous(cx, target, commuting=False), None)
+        if not isinstance(h, uop.H):
+            return None
+        self.delete(h)
+        self.delete(stmt)
+        return [self.replace(cx, uop.CZ(cx.ctrl, cx.qarg))]
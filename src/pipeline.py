@@ -0,0 +1,98 @@
+"""
+Declarative pass pipelines.
+
+A pipeline is a list of steps, each a name from STEPS with optional keyword
+options for the pass, written either as text ("rydberg,merge:atol=1e-10,parallelise")
+or as JSON ({"pipeline": ["rydberg", {"step": "merge", "atol": 1e-10}, "parallelise"]}
+or just the list). The PassManager runs them on a method sharing one
+passes.Analyses: constant propagation is reused and the cleanup fixpoint is
+skipped until a step changes the method.
+"""
+import json
+
+from kirin import ir
+from kirin.rewrite.abc import RewriteResult
+
+import passes
+import tracing
+
+# step name → runner(method, analyses, **options); the passes not written against
+# passes.Analyses report their changes to it through analyses.changed
+STEPS = {
+    "rydberg": lambda method, analyses: analyses.changed(passes.RydbergRewrite(method)),
+    "kak": lambda method, analyses, **options: passes.ResynthesizeTwoQubitBlocks(method.dialects, analyses=analyses, **options)(method),
+    "remove2pi": lambda method, analyses: passes.Remove2PiGates(method.dialects, analyses=analyses)(method),
+    "peephole": lambda method, analyses, **options: passes.PeepholeCancellation(method.dialects, analyses=analyses, **options)(method),
+    "merge": lambda method, analyses, **options: passes.MergeConsecutiveU(method.dialects, analyses=analyses, **options)(method),
+    "parallelise": lambda method, analyses: analyses.changed(passes.NativeParallelisationPass(method)),
+    "schedule": lambda method, analyses, **options: passes.ScheduleParallel(method.dialects, analyses=analyses, **options)(method),
+    "global": lambda method, analyses, **options: passes.GlobalRotations(method.dialects, analyses=analyses, **options)(method),
+    "cleanup": lambda method, analyses: analyses.cleanup(method),
+}
+
+
+def _option_value(text: str):
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        return text
+
+
+class PassManager:
+    def __init__(self, steps):
+        """
+        @param steps: step names or (name, options) pairs
+        """
+        self.steps: list[tuple[str, dict]] = []
+        for step in steps:
+            name, options = (step, {}) if isinstance(step, str) else step
+            if name not in STEPS:
+                raise ValueError(f"unknown pipeline step {name!r} (known: {', '.join(STEPS)})")
+            self.steps.append((name, dict(options)))
+
+    @classmethod
+    def parse(cls, text: str) -> "PassManager":
+        """
+        @param text: comma separated steps, options as name:key=value:key=value
+        """
+        steps = []
+        for item in filter(None, (part.strip() for part in text.split(","))):
+            name, *options = item.split(":")
+            steps.append((name, {k: _option_value(v) for k, v in (option.split("=", 1) for option in options)}))
+        return cls(steps)
+
+    @classmethod
+    def load(cls, path) -> "PassManager":
+        """
+        Reads a JSON pipeline: a list of steps, or an object with the list under "pipeline".
+        A step is a name or an object with the name under "step" and the options
+        """
+        with open(path) as f:
+            spec = json.load(f)
+        if isinstance(spec, dict):
+            spec = spec["pipeline"]
+        return cls((step, {}) if isinstance(step, str) else (step["step"], {k: v for k, v in step.items() if k != "step"})
+                   for step in spec)
+
+    def spec(self) -> list:
+        """
+        @returns the JSON form of the pipeline (e.g. for cache keys)
+        """
+        return [name if not options else {"step": name, **options} for name, options in self.steps]
+
+    def __str__(self):
+        return ",".join(name + "".join(f":{k}={json.dumps(v)}" for k, v in options.items()) for name, options in self.steps)
+
+    def run(self, method: ir.Method, after_step = None) -> RewriteResult:
+        """
+        Runs the steps in-place on method
+        @param after_step: optional callback(step name, method) called after each step
+        """
+        analyses = passes.Analyses(method.dialects)
+        result = RewriteResult()
+        for name, options in self.steps:
+            with tracing.span(name, method):
+                result = STEPS[name](method, analyses, **options).join(result)
+            if after_step is not None:
+                after_step(name, method)
+        return result
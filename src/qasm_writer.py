@@ -0,0 +1,211 @@
+"""
+Streaming OpenQASM 2 writer for lowered Kirin methods.
+
+Walks the statements and writes each QASM statement to a text file as soon
+as it is known, instead of building bloqade's AST and the whole string
+(QASM2.emit_str) first. The text is the one emit_str prints: registers are
+named by the same id table, numbers are printed with str(), parallel and
+global gates are expanded as ParallelToUOp / GlobalToParallel expand them
+(single-qubit gates in reverse order, CZs in order), or kept as parallel
+statements with parallel=True.
+Methods with control flow or custom gates raise UnsupportedStatement, the
+write_* helpers then fall back to emit_str.
+"""
+import io
+
+from kirin import idtable, ir
+from kirin.analysis import const
+from kirin.dialects import ilist
+from bloqade.qasm2.dialects import core, uop, parallel, glob
+from bloqade.qasm2.emit import QASM2 as QASM2Target
+
+from ir_to_qiskit import UnsupportedStatement
+from metrics import constant
+
+# uop statement → names of its angle arguments, in the order they are printed
+# (the statements without an entry in NAMED_GATES print as "name (params) qargs;")
+PARAMS = {
+    uop.Id: (), uop.H: (), uop.X: (), uop.Y: (), uop.Z: (), uop.S: (), uop.Sdag: (),
+    uop.SX: (), uop.SXdag: (), uop.T: (), uop.Tdag: (),
+    uop.RX: ("theta",), uop.RY: ("theta",), uop.RZ: ("theta",),
+    uop.U1: ("lam",), uop.U2: ("phi", "lam"),
+    uop.CZ: (), uop.CY: (), uop.CH: (), uop.CSX: (), uop.Swap: (),
+    uop.CRX: ("lam",), uop.CRY: ("lam",), uop.CRZ: ("lam",), uop.CU1: ("lam",),
+    uop.CU3: ("theta", "phi", "lam"), uop.CU: ("theta", "phi", "lam", "gamma"),
+    uop.RXX: ("theta",), uop.RZZ: ("theta",),
+    uop.CCX: (), uop.CSwap: (),
+}
+
+# statements that only compute values read by the gates
+VALUE_STMTS = (core.QRegGet, core.CRegGet, ilist.New)
+
+
+def _header(parallel_form: bool) -> str:
+    if not parallel_form:
+        return "OPENQASM 2.0;"
+    # the dialects of the target the parallel emitter runs with
+    names = (dialect.name for dialect in QASM2Target(allow_parallel=True).main_target.data)
+    return "KIRIN {" + ",".join(sorted(names)) + "};"
+
+
+class _Writer:
+    def __init__(self, method: ir.Method, out, parallel_form: bool):
+        self.method = method
+        self.out = out
+        self.parallel_form = parallel_form
+        self.frame = None       # constant propagation, only run if a value is not a literal
+        self.names = idtable.IdTable[ir.SSAValue](prefix="", prefix_if_none="var_")
+        self.sizes: dict[ir.SSAValue, int] = {}
+
+    def value(self, ssa: ir.SSAValue):
+        value = constant(ssa)
+        if value is None:
+            if self.frame is None:
+                self.frame, _ = const.Propagate(self.method.dialects).run_analysis(self.method)
+            result = self.frame.entries.get(ssa)
+            if not isinstance(result, const.Value):
+                raise UnsupportedStatement(f"non-constant value {ssa}")
+            value = result.data
+        return value
+
+    def number(self, ssa: ir.SSAValue) -> str:
+        value = self.value(ssa)
+        if not isinstance(value, (int, float)):
+            raise UnsupportedStatement(f"non-numeric value {ssa}")
+        return str(value)
+
+    def register(self, ssa: ir.SSAValue) -> str:
+        if ssa not in self.sizes:
+            raise UnsupportedStatement(f"unknown register {ssa}")
+        return self.names[ssa]
+
+    def bit(self, ssa: ir.SSAValue) -> str:
+        # a (qu)bit or a whole register
+        stmt = ssa.owner
+        if isinstance(stmt, (core.QRegGet, core.CRegGet)):
+            idx = self.value(stmt.idx)
+            if not isinstance(idx, int):
+                raise UnsupportedStatement(f"non-integer index {ssa}")
+            return f"{self.register(stmt.reg)}[{idx}]"
+        if isinstance(stmt, (core.QRegNew, core.CRegNew)):
+            return self.register(ssa)
+        raise UnsupportedStatement(f"cannot resolve the (qu)bit {ssa}")
+
+    def bits(self, ssa: ir.SSAValue) -> list[str]:
+        # an IList of qubits
+        stmt = ssa.owner
+        if isinstance(stmt, ilist.New):
+            return [self.bit(value) for value in stmt.values]
+        raise UnsupportedStatement(f"cannot resolve the qubit list {ssa}")
+
+    def registers(self, ssa: ir.SSAValue) -> list[str]:
+        # the qubits of an IList of registers
+        stmt = ssa.owner
+        if isinstance(stmt, ilist.New):
+            return [f"{self.register(reg)}[{i}]" for reg in stmt.values for i in range(self.sizes[reg])]
+        raise UnsupportedStatement(f"cannot resolve the register list {ssa}")
+
+    def run(self):
+        write = self.out.write
+        write(_header(self.parallel_form) + "\n")
+        write('include "qelib1.inc";\n')
+        for block in self.method.callable_region.blocks:
+            for stmt in block.stmts:
+                self.write(stmt)
+
+    def write(self, stmt: ir.Statement):
+        write = self.out.write
+
+        if isinstance(stmt, (core.QRegNew, core.CRegNew)):
+            size = self.value(stmt.args[0])
+            self.sizes[stmt.result] = size
+            keyword = "qreg" if isinstance(stmt, core.QRegNew) else "creg"
+            write(f"{keyword} {self.names[stmt.result]}[{size}];\n")
+        elif isinstance(stmt, uop.UGate):
+            write(self.u_gate(stmt, self.bit(stmt.qarg)))
+        elif isinstance(stmt, uop.CX):
+            write(f"CX {self.bit(stmt.ctrl)}, {self.bit(stmt.qarg)};\n")
+        elif type(stmt) in PARAMS:
+            params = PARAMS[type(stmt)]
+            # the qubit arguments are declared before the angles
+            qargs = ", ".join(self.bit(q) for q in stmt.args[:len(stmt.args) - len(params)])
+            if params:
+                angles = ", ".join(self.number(getattr(stmt, p)) for p in params)
+                write(f"{stmt.name} ({angles}) {qargs};\n")
+            else:
+                write(f"{stmt.name} {qargs};\n")
+        elif isinstance(stmt, uop.Barrier):
+            write(f"barrier {', '.join(self.bit(q) for q in stmt.qargs)};\n")
+        elif isinstance(stmt, core.Measure):
+            write(f"measure {self.bit(stmt.qarg)} -> {self.bit(stmt.carg)};\n")
+        elif isinstance(stmt, core.Reset):
+            write(f"reset {self.bit(stmt.qarg)};\n")
+        elif isinstance(stmt, (parallel.UGate, glob.UGate)):
+            qubits = self.bits(stmt.qargs) if isinstance(stmt, parallel.UGate) else self.registers(stmt.registers)
+            if self.parallel_form:
+                write(f"parallel.U({self.angles(stmt)}) {self.parallel_qargs(qubits)}\n")
+            else:
+                for q in reversed(qubits):
+                    write(self.u_gate(stmt, q))
+        elif isinstance(stmt, parallel.RZ):
+            qubits = self.bits(stmt.qargs)
+            if self.parallel_form:
+                write(f"parallel.RZ({self.number(stmt.theta)}) {self.parallel_qargs(qubits)}\n")
+            else:
+                for q in reversed(qubits):
+                    write(f"rz ({self.number(stmt.theta)}) {q};\n")
+        elif isinstance(stmt, parallel.CZ):
+            pairs = [f"{ctrl}, {qarg}" for ctrl, qarg in zip(self.bits(stmt.ctrls), self.bits(stmt.qargs))]
+            if self.parallel_form:
+                write(f"parallel.CZ {self.parallel_qargs(pairs)}\n")
+            else:
+                for pair in pairs:
+                    write(f"cz {pair};\n")
+        elif isinstance(stmt, VALUE_STMTS) or not stmt.regions and stmt.has_trait(ir.Pure):
+            pass
+        elif stmt.has_trait(ir.IsTerminator):
+            pass
+        else:
+            raise UnsupportedStatement(f"{stmt.name} is not supported")
+
+    def angles(self, stmt: ir.Statement) -> str:
+        return f"{self.number(stmt.theta)}, {self.number(stmt.phi)}, {self.number(stmt.lam)}"
+
+    def u_gate(self, stmt: ir.Statement, qarg: str) -> str:
+        return f"U({self.angles(stmt)}) {qarg};\n"
+
+    @staticmethod
+    def parallel_qargs(qargs: list[str]) -> str:
+        return "{" + "".join(f"\n  {q};" for q in qargs) + "\n}"
+
+
+def write_qasm(method: ir.Method, out, parallel = False):
+    """
+    Writes the OpenQASM 2 text of method to the text file out, statement by statement
+    @param parallel: keep the parallel gates (bloqade's extended QASM) instead of expanding them
+    @raises UnsupportedStatement for methods using statements the writer does not handle
+    (what was written before is left in out)
+    """
+    _Writer(method, out, parallel).run()
+
+def emit_str(method: ir.Method, parallel = False) -> str:
+    """
+    @returns the text QASM2(allow_parallel=parallel).emit_str(method) returns
+    """
+    out = io.StringIO()
+    try:
+        write_qasm(method, out, parallel)
+    except UnsupportedStatement:
+        return QASM2Target(allow_parallel=parallel).emit_str(method)
+    return out.getvalue()
+
+def write_file(method: ir.Method, path, parallel = False):
+    """
+    Writes the OpenQASM 2 text of method to path, as emit_str would
+    """
+    try:
+        with open(path, "w") as out:
+            write_qasm(method, out, parallel)
+    except UnsupportedStatement:
+        with open(path, "w") as out:
+            out.write(QASM2Target(allow_parallel=parallel).emit_str(method))
@@ -0,0 +1,97 @@
+"""
+Commutation-aware list scheduling of gates into parallel moments.
+
+A gate is described by the class it can be grouped with (e.g. U gates with the
+same angles, all CZs), the qubits it acts on and whether it is diagonal.
+Diagonal gates (CZ, phase rotations) commute with each other, so between two
+non-diagonal gates of a qubit they may run in any order. Each moment runs
+gates of a single class on disjoint qubits; the scheduler picks, among the gates
+whose predecessors have all run, the class of the gate farthest from the end
+of the circuit (the most critical one) and runs as many of its ready gates as
+the qubits allow.
+"""
+from collections import defaultdict
+from dataclasses import dataclass
+
+
+@dataclass
+class Gate:
+    key: object             # gates with equal keys can share a moment; None: always alone
+    qubits: tuple           # hashable qubit (or classical resource) identifiers
+    diagonal: bool = False  # commutes with the other diagonal gates on its qubits
+
+
+def dependencies(gates: list[Gate]) -> list[set[int]]:
+    """
+    @returns for each gate (in program order) the indices of the gates that must run before it
+    """
+    last_other: dict = {}                   # qubit → index of its last non-diagonal gate
+    diagonal_since = defaultdict(list)      # qubit → diagonal gates after it
+    preds = []
+    for index, gate in enumerate(gates):
+        before = set()
+        for q in gate.qubits:
+            if q in last_other:
+                before.add(last_other[q])
+            if gate.diagonal:
+                diagonal_since[q].append(index)
+            else:
+                before.update(diagonal_since.pop(q, ()))
+                last_other[q] = index
+        preds.append(before)
+    return preds
+
+def heights(preds: list[set[int]]) -> list[int]:
+    """
+    @returns for each gate the number of gates on the longest dependency path starting from it
+    """
+    height = [1] * len(preds)
+    # program order is a topological order
+    for index in reversed(range(len(preds))):
+        for p in preds[index]:
+            height[p] = max(height[p], height[index] + 1)
+    return height
+
+def schedule(gates: list[Gate]) -> list[list[int]]:
+    """
+    @returns the moments, lists of gate indices, in execution order
+    """
+    preds = dependencies(gates)
+    height = heights(preds)
+    succs = [[] for _ in gates]
+    waiting = [len(p) for p in preds]
+    for index, before in enumerate(preds):
+        for p in before:
+            succs[p].append(index)
+
+    ready = defaultdict(set)    # key → ready gates (gates with key None under their own index)
+    def make_ready(index):
+        key = gates[index].key
+        ready[("alone", index) if key is None else key].add(index)
+
+    for index, count in enumerate(waiting):
+        if count == 0:
+            make_ready(index)
+
+    moments = []
+    while ready:
+        key = max(ready, key=lambda k: (max(height[i] for i in ready[k]), len(ready[k])))
+        candidates = sorted(ready[key], key=lambda i: (-height[i], i))
+
+        moment, busy = [], set()
+        for index in candidates:
+            if busy.isdisjoint(gates[index].qubits):
+                moment.append(index)
+                busy.update(gates[index].qubits)
+        ready[key].difference_update(moment)
+        if not ready[key]:
+            del ready[key]
+
+        moment.sort()
+        moments.append(moment)
+        for index in moment:
+            for s in succs[index]:
+                waiting[s] -= 1
+                if waiting[s] == 0:
+                    make_ready(s)
+    return moments
@@ -0,0 +1,135 @@
+"""
+Cost model choosing how to simulate a circuit within a memory ceiling.
+
+  stabilizer:           Clifford circuits, polynomial time and memory
+  statevector:          dense, 16 * 2**n bytes and about gates * 2**n operations
+  matrix_product_state: a tensor per qubit, whose bond dimensions bound the
+                        entanglement across each cut of the qubit line
+
+The bond dimension across the cut between qubits i and i+1 is bounded by the
+Schmidt rank the gates crossing it can build (2 for each controlled or
+diagonal two-qubit gate, 4 for the others) and by 2**min(i+1, n-i-1), so wide
+shallow circuits with local entangling gates (grids, ladders) stay small as
+an MPS while their statevector does not fit in memory. The method names are
+the ones of Aer's AerSimulator(method=...).
+"""
+import os
+from dataclasses import dataclass
+
+from qiskit import QuantumCircuit
+
+STABILIZER = "stabilizer"
+STATEVECTOR = "statevector"
+MPS = "matrix_product_state"
+
+memoryLimit = None     # bytes a simulation may use, None: half the physical memory
+
+CLIFFORD_GATES = {"id", "x", "y", "z", "h", "s", "sdg", "sx", "sxdg", "cx", "cy", "cz", "swap", "ecr", "dcx"}
+# two-qubit gates of Schmidt rank 2
+RANK_2_GATES = {"cx", "cy", "cz", "ch", "cp", "crx", "cry", "crz", "csx", "cu", "cu1", "cu3", "rxx", "ryy", "rzz", "rzx"}
+# instructions that do not change the state
+IGNORED = {"barrier", "measure", "delay"}
+
+BYTES_PER_AMPLITUDE = 16    # complex128
+
+
+def memory_limit() -> int:
+    """
+    @returns memoryLimit, or half the physical memory if it is None
+    """
+    if memoryLimit is not None:
+        return memoryLimit
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // 2
+    except (ValueError, OSError, AttributeError):
+        return 4 * 2**30
+
+
+@dataclass
+class Cost:
+    qubits: int
+    gates: int
+    two_qubit: int              # gates on two qubits or more
+    clifford: bool
+    bonds: list                 # bond dimension bound of each of the qubits - 1 cuts
+    mps_ops: float              # operations of the MPS simulation, roughly
+
+    @property
+    def dense_bytes(self) -> int:
+        return BYTES_PER_AMPLITUDE * 2**self.qubits
+
+    @property
+    def dense_ops(self) -> float:
+        return max(self.gates, 1) * 2.0**self.qubits
+
+    @property
+    def mps_bytes(self) -> int:
+        edges = [1] + self.bonds + [1]
+        return BYTES_PER_AMPLITUDE * sum(2 * left * right for left, right in zip(edges, edges[1:]))
+
+def estimate(circuit: QuantumCircuit) -> Cost:
+    """
+    @returns the size and entangling structure of circuit, as used by choose
+    """
+    n = circuit.num_qubits
+    # log2 of the bond dimension bound, capped by the dimension of the smaller side
+    cap = [min(i + 1, n - i - 1) for i in range(n - 1)]
+    log_bonds = [0] * (n - 1)
+    gates, two_qubit, clifford = 0, 0, True
+    ops = 0.0
+    for instruction in circuit.data:
+        name = instruction.operation.name
+        if name in IGNORED:
+            continue
+        gates += 1
+        clifford = clifford and name in CLIFFORD_GATES
+        qubits = [circuit.find_bit(q).index for q in instruction.qubits]
+        low, high = min(qubits), max(qubits)
+        if high == low:
+            chi = 2**max(log_bonds[max(low - 1, 0):low + 1] or [0])
+            ops += 2 * chi**2
+            continue
+        two_qubit += 1
+        growth = 1 if name in RANK_2_GATES else 2
+        for cut in range(low, high):
+            log_bonds[cut] = min(log_bonds[cut] + growth, cap[cut])
+        chi = 2**max(log_bonds[low:high])
+        # non-adjacent gates are applied through swaps along the line
+        ops += (high - low) * chi**3
+    return Cost(n, gates, two_qubit, clifford, [2**b for b in log_bonds], ops)
+
+
+@dataclass
+class Choice:
+    method: str
+    cost: Cost
+    memory_bytes: int
+
+    def __str__(self):
+        return (f"{self.method} ({self.cost.qubits} qubits, {self.cost.gates} gates, "
+                f"max bond {max(self.cost.bonds, default=1)}, ~{self.memory_bytes / 2**20:.1f} MiB)")
+
+def choose(circuit: QuantumCircuit, limit: int = None, copies: int = 1, methods = (STABILIZER, STATEVECTOR, MPS)) -> Choice:
+    """
+    Picks, among methods, the one simulating circuit in the fewest operations within limit bytes
+    @param limit: default memory_limit()
+    @param copies: the number of states held at the same time
+    @raises MemoryError if no method fits
+    """
+    limit = memory_limit() if limit is None else limit
+    cost = estimate(circuit)
+    if cost.clifford and STABILIZER in methods:
+        return Choice(STABILIZER, cost, copies * 2 * cost.qubits**2)
+
+    candidates = []
+    if STATEVECTOR in methods and copies * cost.dense_bytes <= limit:
+        candidates.append((cost.dense_ops, STATEVECTOR, copies * cost.dense_bytes))
+    if MPS in methods and copies * cost.mps_bytes <= limit:
+        candidates.append((cost.mps_ops, MPS, copies * cost.mps_bytes))
+    if not candidates:
+        raise MemoryError(f"simulating {cost.qubits} qubits needs {copies * cost.dense_bytes} bytes as a statevector "
+                          f"and about {copies * cost.mps_bytes} as an MPS, over the limit of {limit} bytes "
+                          f"(methods: {', '.join(methods)})")
+    # on a tie the dense simulation, which has no truncation
+    ops, method, memory = min(candidates, key=lambda c: (c[0], c[1] != STATEVECTOR))
+    return Choice(method, cost, memory)
@@ -0,0 +1,95 @@
+"""
+NumPy kernel for fusing single-qubit U(theta, phi, lam) gates.
+
+Angles are handled in batches: a (..., 3) array of (theta, phi, lam) triples
+is turned into (..., 2, 2) matrices, multiplied, and decomposed back into
+real ZYZ angles plus the global phase that U(theta, phi, lam) drops.
+"""
+import numpy as np
+
+DEFAULT_ATOL = 1e-12    # below this an entry of the matrix is treated as zero
+
+def u3_matrices(angles) -> np.ndarray:
+    """
+    @param angles: array-like of shape (..., 3) with (theta, phi, lam) triples
+    @returns the (..., 2, 2) complex matrices of U(theta, phi, lam)
+    """
+    angles = np.asarray(angles, dtype=np.float64)
+    theta, phi, lam = angles[..., 0], angles[..., 1], angles[..., 2]
+
+    cos = np.cos(theta / 2)
+    sin = np.sin(theta / 2)
+
+    mats = np.empty(angles.shape[:-1] + (2, 2), dtype=np.complex128)
+    mats[..., 0, 0] = cos
+    mats[..., 0, 1] = -np.exp(1j * lam) * sin
+    mats[..., 1, 0] = np.exp(1j * phi) * sin
+    mats[..., 1, 1] = np.exp(1j * (phi + lam)) * cos
+    return mats
+
+def _wrap(angle: np.ndarray) -> np.ndarray:
+    # into (-pi, pi]
+    return np.pi - np.mod(np.pi - angle, 2 * np.pi)
+
+def zyz_angles(mats, atol: float = DEFAULT_ATOL) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Decomposes unitaries as M = exp(i*gamma) * U(theta, phi, lam).
+    theta is in [0, pi], phi and lam in (-pi, pi]; angles closer than atol to 0 are snapped to 0.
+    When theta is 0 (or pi) only phi + lam (or phi - lam) is defined: phi (or lam) is set to 0.
+    @param mats: array-like of shape (..., 2, 2)
+    @returns ((..., 3) real angles, (...) global phase gamma)
+    """
+    mats = np.asarray(mats, dtype=np.complex128)
+    m00, m01 = mats[..., 0, 0], mats[..., 0, 1]
+    m10, m11 = mats[..., 1, 0], mats[..., 1, 1]
+
+    cos = np.abs(m00)
+    sin = np.abs(m10)
+    theta = 2 * np.arctan2(sin, cos)
+
+    has_cos = cos > atol
+    has_sin = sin > atol
+
+    # the global phase is read from m00, or from -m01 when cos(theta/2) vanishes (lam = 0)
+    gamma = np.where(has_cos, np.angle(m00), np.angle(-m01))
+    phi = np.where(has_sin, np.angle(m10) - gamma, 0.0)
+    lam = np.where(has_cos & has_sin, np.angle(-m01) - gamma, 0.0)
+    # sin(theta/2) vanishes: only phi + lam is defined, all of it goes to lam
+    lam = np.where(has_sin, lam, np.angle(m11) - gamma)
+
+    angles = np.stack([theta, _wrap(phi), _wrap(lam)], axis=-1)
+    angles[np.abs(angles) < atol] = 0.0
+    return angles, _wrap(gamma)
+
+def fuse(first, second, atol: float = DEFAULT_ATOL) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Fuses U(first) followed by U(second), element-wise over the batch.
+    @param first, second: array-like of shape (..., 3)
+    @returns ((..., 3) angles of the single equivalent U, (...) global phase)
+    """
+    # `second` acts after `first`: its matrix goes on the left
+    return zyz_angles(u3_matrices(second) @ u3_matrices(first), atol=atol)
+
+def fuse_runs(runs, atol: float = DEFAULT_ATOL) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Fuses many runs of consecutive U gates in one call.
+    Runs are padded with identities and multiplied pairwise, so a batch of runs costs
+    log2(longest run) matrix products instead of one Python call per gate.
+    @param runs: sequence of array-likes of shape (k_i, 3), gates in program order
+    @returns ((len(runs), 3) angles, (len(runs),) global phases)
+    """
+    if len(runs) == 0:
+        return np.empty((0, 3)), np.empty((0,))
+
+    length = max(len(run) for run in runs)
+    padded = np.zeros((len(runs), length, 3))   # U(0, 0, 0) is the identity
+    for i, run in enumerate(runs):
+        padded[i, :len(run)] = run
+    mats = u3_matrices(padded)
+
+    while mats.shape[1] > 1:
+        if mats.shape[1] % 2:
+            mats = np.concatenate([mats, np.broadcast_to(np.eye(2), (len(runs), 1, 2, 2))], axis=1)
+        mats = mats[:, 1::2] @ mats[:, 0::2]
+
+    return zyz_angles(mats[:, 0], atol=atol)
@@ -0,0 +1,67 @@
+"""
+Two-qubit block kernel: 4x4 unitaries of U/CZ sequences and their
+re-synthesis with the minimum number of CZs.
+
+A block is a sequence of ("u", qubit, (theta, phi, lam)) and ("cz",) gates on
+the qubits 0 and 1. Matrices follow Qiskit's little-endian order (qubit 0 is
+the least significant bit), so they can be handed to its KAK (Weyl chamber)
+decomposition, which finds the CZ count (0 to 3) of any two-qubit unitary.
+"""
+from functools import lru_cache
+
+import numpy as np
+
+import su2
+
+CZ = np.diag([1, 1, 1, -1]).astype(np.complex128)
+IDENTITY = np.eye(2, dtype=np.complex128)
+
+
+def block_unitary(gates) -> np.ndarray:
+    """
+    @param gates: ("u", qubit, angles) and ("cz",) tuples, in program order
+    @returns the 4x4 unitary of the block
+    """
+    gates = list(gates)
+    singles = [gate for gate in gates if gate[0] == "u"]
+    mats = iter(su2.u3_matrices([angles for _, _, angles in singles]) if singles else ())
+
+    unitary = np.eye(4, dtype=np.complex128)
+    for gate in gates:
+        if gate[0] == "cz":
+            unitary = CZ @ unitary
+        else:
+            mat = next(mats)
+            # the first factor of the Kronecker product acts on qubit 1
+            unitary = (np.kron(IDENTITY, mat) if gate[1] == 0 else np.kron(mat, IDENTITY)) @ unitary
+    return unitary
+
+@lru_cache(maxsize=1)
+def _decomposer():
+    # imported lazily: building the decomposer is only needed when a block is re-synthesized
+    from qiskit.circuit.library import CZGate
+    from qiskit.synthesis import TwoQubitBasisDecomposer
+    return TwoQubitBasisDecomposer(CZGate(), euler_basis="U")
+
+def cz_count(unitary: np.ndarray) -> int:
+    """
+    @returns the minimum number of CZs implementing the 4x4 unitary
+    """
+    return _decomposer().num_basis_gates(unitary)
+
+def synthesize(unitary: np.ndarray, atol: float = su2.DEFAULT_ATOL) -> list[tuple]:
+    """
+    Re-synthesizes a 4x4 unitary, up to a global phase, with the minimum number of CZs
+    @returns the gates of the block, as taken by block_unitary
+    """
+    circuit = _decomposer()(unitary)
+    gates = []
+    for instruction in circuit.data:
+        if instruction.operation.name == "cz":
+            gates.append(("cz",))
+            continue
+        angles = tuple(float(p) for p in instruction.operation.params)
+        if all(abs(angle) < atol for angle in angles):
+            continue    # identity
+        gates.append(("u", circuit.find_bit(instruction.qubits[0]).index, angles))
+    return gates
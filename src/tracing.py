@@ -0,0 +1,162 @@
+"""
+Optional instrumentation of the compile pipeline.
+
+Code marks its steps with `with tracing.span(name, method):`. Nothing is
+recorded unless a Tracer is active (see active()); then each span records its
+wall and CPU time, the IR statement count of `method` before and after, and,
+if the tracer tracks memory, the peak of the Python heap (tracemalloc) above
+its start. Spans are kept as Chrome trace events (chrome://tracing, Perfetto)
+and can be summarized per name.
+"""
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass
+
+from kirin import ir
+from kirin.rewrite import Fixpoint
+from kirin.rewrite.abc import RewriteResult
+
+_active = None     # the Tracer spans are recorded into, if any
+
+
+def statement_count(method: ir.Method) -> int:
+    return sum(1 for _ in method.callable_region.walk())
+
+
+class Tracer:
+    def __init__(self, memory = False):
+        self.memory = memory
+        self.events: list[dict] = []
+        self._stack: list[dict] = []    # open spans, innermost last
+
+    @contextmanager
+    def span(self, name: str, method: ir.Method = None, **args):
+        frame = {"name": name, "args": dict(args)}
+        if method is not None:
+            frame["args"]["stmts_before"] = statement_count(method)
+        if self.memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            current, peak = tracemalloc.get_traced_memory()
+            if self._stack:
+                # the parent keeps the peak reached so far, the heap peak is restarted for this span
+                self._stack[-1]["peak"] = max(self._stack[-1]["peak"], peak)
+            tracemalloc.reset_peak()
+            frame["start_mem"] = frame["peak"] = current
+        self._stack.append(frame)
+
+        cpu = time.process_time()
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter_ns() - start
+            cpu = time.process_time() - cpu
+            self._stack.pop()
+
+            args = frame["args"]
+            args["cpu_ms"] = cpu * 1e3
+            if method is not None:
+                args["stmts_after"] = statement_count(method)
+            if self.memory:
+                peak = max(frame["peak"], tracemalloc.get_traced_memory()[1])
+                args["peak_bytes"] = peak - frame["start_mem"]
+                if self._stack:
+                    self._stack[-1]["peak"] = max(self._stack[-1]["peak"], peak)
+
+            self.events.append({
+                "name": name,
+                "ph": "X",
+                "ts": start / 1e3,
+                "dur": duration / 1e3,
+                "pid": os.getpid(),
+                "tid": threading.get_native_id(),
+                "args": args,
+            })
+
+    def extend(self, events: list[dict]):
+        """
+        Adds the events recorded by another tracer (e.g. in a worker process)
+        """
+        self.events.extend(events)
+
+    def write_chrome_trace(self, path):
+        with open(path, "w") as out:
+            json.dump({"traceEvents": self.events, "displayTimeUnit": "ms"}, out)
+
+    def summary(self) -> list[dict]:
+        """
+        @returns one row per span name, in order of first appearance: calls, total wall and CPU
+        time (ms), largest peak memory (bytes, None if not tracked), net statement count change
+        """
+        rows: dict[str, dict] = {}
+        for event in sorted(self.events, key=lambda e: e["ts"]):
+            row = rows.setdefault(event["name"], {"name": event["name"], "calls": 0, "wall_ms": 0.0,
+                                                  "cpu_ms": 0.0, "peak_bytes": None, "stmts_delta": 0})
+            args = event["args"]
+            row["calls"] += 1
+            row["wall_ms"] += event["dur"] / 1e3
+            row["cpu_ms"] += args["cpu_ms"]
+            if "peak_bytes" in args:
+                row["peak_bytes"] = max(row["peak_bytes"] or 0, args["peak_bytes"])
+            if "stmts_before" in args:
+                row["stmts_delta"] += args["stmts_after"] - args["stmts_before"]
+        return list(rows.values())
+
+    def print_summary(self):
+        print(f"{'span':<40} {'calls':>6} {'wall':>10} {'cpu':>10} {'peak mem':>10} {'Δ stmts':>8}")
+        for row in self.summary():
+            peak = "-" if row["peak_bytes"] is None else f"{row['peak_bytes'] / 2**20:.1f}MiB"
+            print(f"{row['name']:<40} {row['calls']:>6} {row['wall_ms']:>8.1f}ms {row['cpu_ms']:>8.1f}ms "
+                  f"{peak:>10} {row['stmts_delta']:>8}")
+
+
+@contextmanager
+def active(tracer: Tracer | None):
+    """
+    Records the spans opened in this block into tracer (None: record nothing)
+    """
+    global _active
+    previous, _active = _active, tracer
+    try:
+        yield tracer
+    finally:
+        _active = previous
+
+def span(name: str, method: ir.Method = None, **args):
+    """
+    @returns a context manager timing its block in the active tracer, if any
+    """
+    if _active is None:
+        return nullcontext()
+    return _active.span(name, method, **args)
+
+
+@dataclass
+class TracedFixpoint(Fixpoint):
+    """
+    Fixpoint that opens a span per iteration of the rule
+    """
+    name: str = "fixpoint"
+
+    def rewrite(self, node: ir.IRNode) -> RewriteResult:
+        if _active is None:
+            return super().rewrite(node)
+
+        has_done_something = False
+        for iteration in range(self.max_iter):
+            with span(f"{self.name} iteration", iteration=iteration):
+                result = self.rule.rewrite(node)
+            if result.terminated:
+                return result
+
+            if result.has_done_something:
+                has_done_something = True
+            else:
+                return RewriteResult(has_done_something=has_done_something)
+
+        return RewriteResult(exceeded_max_iter=True)
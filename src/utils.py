@@ -1,17 +1,17 @@
+import re
+from collections.abc import Mapping
+from fnmatch import fnmatchcase
 from pathlib import Path
 from time import sleep
-from typing import Any
-import matplotlib.pyplot as plt
 
 
 from bloqade import qasm2
 from bloqade.qasm2.parse.lowering import QASM2
-from bloqade.qasm2.emit import QASM2 as QASM2Target # the QASM2 target
 from bloqade.qasm2.passes import QASM2Py
-from bloqade.qasm2.emit import QASM2 as QASM2Target # the QASM2 target
 
 from kirin import ir
 from qiskit import QuantumCircuit
+import qasm_writer
 
 def sep_print(msg, sleepTimeSec: int = 0):
     """
@@ -22,7 +22,31 @@ def sep_print(msg, sleepTimeSec: int = 0):
     if sleepTimeSec > 0:
         sleep(sleepTimeSec)
 
-def importQASM(input_dir) -> dict[str, Any]:
+def loadQASM(path) -> ir.Method:
+    """
+    Parses & lowers a single .qasm file
+    @returns the lowered method, in Bloqade's extended dialect group
+    """
+    path = Path(path)
+    return loadQASMString(path.read_text(), path.stem)
+
+def loadQASMString(source: str, name: str) -> ir.Method:
+    """
+    Parses & lowers OpenQASM2 source text into a method called name (see loadQASM)
+    """
+    prog = QASM2(qasm2.main).loads(source, name)
+
+    """
+    reinterpret into Bloqade's parallelization-friendly intermediate representation. 
+    Similar behaviour could have been obtained by just using qasm2.extended above
+    """
+    QASM2Py(prog.dialects)(prog)
+    return prog.similar(qasm2.extended)
+
+def listQASM(input_dir) -> list[Path]:
+    """
+    @returns the sorted .qasm files in input_dir (relative to the launch directory)
+    """
     # path to root is launched from
     exec_root = Path.cwd()  
 
@@ -33,28 +57,91 @@ def importQASM(input_dir) -> dict[str, Any]:
     print(qasm_dir)
     if not qasm_file_paths:
         raise FileNotFoundError(f"No .qasm files found in {qasm_dir}")
+    return qasm_file_paths
+
+def selectNames(names, patterns, regex = False) -> list[str]:
+    """
+    @param patterns: glob patterns (or regular expressions if regex) matched against the names
+    @returns the names matching at least one pattern, all of them if patterns is empty
+    """
+    if not patterns:
+        return list(names)
+    if regex:
+        compiled = [re.compile(p) for p in patterns]
+        return [n for n in names if any(c.search(n) for c in compiled)]
+    return [n for n in names if any(fnmatchcase(n, p) for p in patterns)]
+
+class ProgramCatalog(Mapping):
+    """
+    Lazy name → lowered method mapping over a set of .qasm files.
+    A circuit is parsed & lowered on first access and then kept;
+    stream() instead lowers them one at a time without keeping them.
+    """
+    def __init__(self, paths):
+        self._paths = {Path(path).stem: Path(path) for path in paths}
+        self._programs: dict[str, ir.Method] = {}
 
-    # parse & lower each one
-    programs = {}
-    for path in qasm_file_paths:
-        prog = QASM2(qasm2.main).loadfile(file=path)
+    def __getitem__(self, name) -> ir.Method:
+        if name not in self._programs:
+            self._programs[name] = self.load(name)
+        return self._programs[name]
 
+    def __iter__(self):
+        return iter(self._paths)
+
+    def __len__(self):
+        return len(self._paths)
+
+    def path(self, name) -> Path:
+        return self._paths[name]
+
+    def load(self, name) -> ir.Method:
         """
-        reinterpret into Bloqade's parallelization-friendly intermediate representation. 
-        Similar behaviour could have been obtained by just using qasm2.extended above
+        Parses & lowers name, without caching it
         """
-        QASM2Py(prog.dialects)(prog)
-        prog = prog.similar(qasm2.extended)
-
-        programs[Path(path).stem] = prog
+        path = self._paths[name]
+        prog = loadQASM(path)
         print(f"→ {path} parsed & lowered: {prog}")
+        return prog
+
+    def select(self, patterns, regex = False) -> "ProgramCatalog":
+        """
+        @returns a catalog restricted to the names matching patterns (see selectNames)
+        """
+        names = selectNames(self._paths, patterns, regex)
+        catalog = ProgramCatalog(self._paths[n] for n in names)
+        catalog._programs = {n: self._programs[n] for n in names if n in self._programs}
+        return catalog
+
+    def stream(self):
+        """
+        Yields (name, method) pairs, lowering each circuit only when it is reached
+        """
+        for name in self._paths:
+            yield name, self._programs[name] if name in self._programs else self.load(name)
 
-    return programs
+def importQASM(input_dir, select = None, regex = False) -> ProgramCatalog:
+    """
+    Catalogs the .qasm files in input_dir, nothing is parsed until it is accessed
+    @param select: optional glob patterns (regular expressions if regex) on the file stems
+    """
+    catalog = ProgramCatalog(listQASM(input_dir))
+    if select:
+        catalog = catalog.select(select, regex)
+    return catalog
 
 # helper to go from Method → Qiskit
 def circuit_to_qiskit(method: ir.Method) -> QuantumCircuit:
+    """
+    Converts through OpenQASM2 text (see qasm_writer): emitting and parsing it
+    takes about 0.6x the time of the direct converter of ir_to_qiskit on the
+    compiled circuits (see bench_to_qiskit)
+    """
+    return circuit_to_qiskit_text(method)
+
+def circuit_to_qiskit_text(method: ir.Method) -> QuantumCircuit:
     # emit OpenQASM2 text
-    qasm = QASM2Target(allow_parallel=False).emit_str(method)
+    qasm = qasm_writer.emit_str(method)
     # parse into a Qiskit circuit
     return QuantumCircuit.from_qasm_str(qasm)
 
@@ -65,6 +152,8 @@ def QiskitDrawNotebook(qc):
 
 
 def show_circuit(circ):
+    import matplotlib.pyplot as plt     # imported here: only plotting needs it
+
     fig = circ.draw(output='mpl', scale=1.0)
 
 
@@ -1,114 +1,318 @@
-from utils import *
-
-from qiskit import transpile
-
-
-from qiskit.visualization import plot_histogram
-
-from qiskit_aer import Aer
-from qiskit_ibm_runtime import QiskitRuntimeService
-
+from dataclasses import dataclass, field
 
+import numpy as np
 from qiskit import QuantumCircuit
-from qiskit_ibm_runtime import SamplerV2 as Sampler
 from qiskit.quantum_info import Statevector
-import numpy as np
-from qiskit.quantum_info import Statevector, partial_trace, state_fidelity
-
-
-def validateNotExecute(qc1 : QuantumCircuit, qc2 : QuantumCircuit, ancilla = False):
-    sv1 = Statevector.from_instruction(qc1)
-    sv2 = Statevector.from_instruction(qc2)
-    fidelity = 0
 
-    if (ancilla):
-        sv_psi = Statevector(sv1)
-        sv_phi = Statevector(sv2)
+import equivalence
+import simulation
 
-        rho_phi_3 = partial_trace(sv_phi, [3])
+# adaptive sampling (see SampledValidation): the shots grow from DEFAULT_MIN_SHOTS, doubling every round,
+# until the confidence interval of the fidelity is above or below DEFAULT_THRESHOLD, or narrower than
+# 2 * DEFAULT_TOLERANCE, or the shots budget is spent
+DEFAULT_MIN_SHOTS = 2000
+DEFAULT_THRESHOLD = 0.99
+DEFAULT_TOLERANCE = 0.005
+DEFAULT_CONFIDENCE = 0.95
+BOOTSTRAP_SAMPLES = 200
 
-        fidelity = state_fidelity(sv_psi, rho_phi_3)
-    else:
-        overlap = np.vdot(sv1.data, sv2.data)
-        print("⟨sv1|sv2⟩ =", overlap)
-        fidelity = abs(overlap)**2
 
+def validateNotExecute(qc1 : QuantumCircuit, qc2 : QuantumCircuit, ancilla = False):
+    """
+    Fidelity of the states prepared by qc1 and qc2, without sampling (see equivalence.check).
+    With ancilla, the qubits qc2 has in addition to qc1 are traced out.
+    """
+    result = equivalence.check(qc1, qc2, ancilla=ancilla)
+    fidelity = result["fidelity"]
 
-    print("Fidelity =", fidelity)
+    print(f"Fidelity = {fidelity} (method: {result['method']}, {result['seconds']:.3f}s)")
 
     return fidelity
 
 
 
-def validateExecute(qc1, qc2, ancilla=True, shots = 100000, first=True, n=2):
-    backend = Aer.get_backend('qasm_simulator')
-    qc1.measure_all()
-
-
-    tqc1 = transpile(qc1, backend)
-    result = backend.run(tqc1, shots=shots).result()
-    q1_counts = result.get_counts()
-    #print(q1_counts)
-    plot_histogram(q1_counts)
-
-    qc2.measure_all()
-    tqc2 = transpile(qc2, backend)
-    result = backend.run(tqc2, shots=shots).result()
-    q2_parsed = result.get_counts()
-    #print(q2_parsed)
-    #show_circuit(qc1)
-    #plot_histogram(q2_parsed)
-
-
-    q2_counts = {}
-
-    #remove ancilla
+def ancillaQubits(num_qubits, first=True, n=2) -> list[int]:
+    """
+    The ancillas are the last n characters of the outcome bitstrings if first (qubits 0..n-1),
+    otherwise the first n characters (the n highest qubits)
+    """
+    if n <= 0:
+        return []
+    return list(range(n)) if first else list(range(num_qubits - n, num_qubits))
+
+def marginalize(probs, traced) -> np.ndarray:
+    """
+    Sums the outcome probabilities over the traced qubits
+    @param probs: the 2**num_qubits probabilities, little endian as in Qiskit
+    @returns the probabilities of the remaining qubits, in the same order
+    """
+    probs = np.asarray(probs, dtype=np.float64)
+    num_qubits = probs.size.bit_length() - 1
+    if not traced:
+        return probs
+    # axis 0 of the reshaped array is the highest qubit
+    tensor = probs.reshape((2,) * num_qubits)
+    return tensor.sum(axis=tuple(num_qubits - 1 - q for q in traced)).reshape(-1)
+
+def countsToOutcomes(counts, traced = ()) -> dict[int, int]:
+    """
+    @param traced: qubits whose bit is dropped from the outcomes (ancillas)
+    @returns the counts of the measure_all register by outcome, without the traced bits
+    (sparse: wide circuits have far fewer distinct outcomes than 2**num_qubits)
+    """
+    kept = None
+    outcomes = {}
+    for key, value in counts.items():
+        outcome = int(key.split(" ")[0], 2)
+        if traced:
+            if kept is None:
+                kept = [q for q in range(len(key.split(" ")[0])) if q not in traced]
+            outcome = sum(((outcome >> q) & 1) << i for i, q in enumerate(kept))
+        outcomes[outcome] = outcomes.get(outcome, 0) + value
+    return outcomes
+
+def countsToProbabilities(counts, num_qubits) -> np.ndarray:
+    """
+    @returns the outcome frequencies of the measure_all register as a 2**num_qubits array
+    """
+    probs = np.zeros(2**num_qubits)
+    for key, value in counts.items():
+        probs[int(key.split(" ")[0], 2)] += value
+    return probs / probs.sum()
+
+def compareDistributions(p1, p2) -> dict:
+    """
+    @returns a dict with the total variation distance and the Hellinger fidelity of p1 and p2
+    """
+    if p1.shape != p2.shape:
+        raise ValueError(f"cannot compare distributions over {p1.size} and {p2.size} outcomes")
+    return {
+        "tvd": 0.5 * float(np.abs(p1 - p2).sum()),
+        "hellinger": float(min(np.sqrt(p1 * p2).sum() ** 2, 1.0)),
+    }
+
+def _reportDistributions(p1, p2, ancilla, first, n):
     if ancilla:
-        for key, value in q2_parsed.items():
-            # 1) ripulisco la stringa dai blank
-            clean_key = key.replace(" ", "")
-            
-            # 2) trimming: se n<=0 non tolgo nulla,
-            #    altrimenti tolgo primi n o ultimi n in base a first
-            if n <= 0:
-                trimmed = clean_key
-            else:
-                if first==False:
-                    # rimuovo i primi n
-                    trimmed = clean_key[n:]
-                else:
-                    # rimuovo gli ultimi n
-                    trimmed = clean_key[:-n]
-
-            
-            # 4) sommo i conteggi
-            q2_counts[trimmed] = q2_counts.get(trimmed, 0) + value
-    else:
-        q2_counts = q2_parsed
-
-
-    accumulator = 0 
-
-    for key in q1_counts:
-        if key in q2_counts:
-            diff = q1_counts[key] - q2_counts[key]
-            accumulator += abs(diff)
-
-    fidelity = 1 - accumulator / shots
-
-    print("Fidelity =", fidelity)
-
-    return fidelity
-
-
-
-def validate(qc1, qc2, ancilla = False, execute = False, shots = 100000, first=True, n = 2):
-    if execute: return validateExecute (qc1, qc2, ancilla=ancilla, shots = shots, first=first, n = n)
+        p2 = marginalize(p2, ancillaQubits(p2.size.bit_length() - 1, first, n))
+    distance = compareDistributions(p1, p2)
+
+    print(f"TVD = {distance['tvd']}")
+    print("Fidelity =", distance["hellinger"])
+
+    return distance["hellinger"]
+
+
+
+def hellingerInterval(c1, c2, confidence = DEFAULT_CONFIDENCE, rng = None) -> tuple[float, float, float]:
+    """
+    Hellinger fidelity of the distributions sampled with outcome counts c1 and c2, and its
+    confidence interval, by a multinomial bootstrap over the outcomes seen in either.
+    Sampling noise biases the plain estimate low (by about outcomes / shots): the estimate
+    is bias-corrected and the interval is the basic (reflected) bootstrap one
+    @returns (fidelity, low, high), within [0, 1]
+    """
+    rng = np.random.default_rng() if rng is None else rng
+    seen = np.flatnonzero(c1 + c2)
+    n1, n2 = int(c1.sum()), int(c2.sum())
+    p1, p2 = c1[seen] / n1, c2[seen] / n2
+    estimate = np.sqrt(p1 * p2).sum() ** 2
+
+    r1 = rng.multinomial(n1, p1, size=BOOTSTRAP_SAMPLES) / n1
+    r2 = rng.multinomial(n2, p2, size=BOOTSTRAP_SAMPLES) / n2
+    resampled = np.sqrt(r1 * r2).sum(axis=1) ** 2
+    alpha = 1 - confidence
+    low, high = 2 * estimate - np.quantile(resampled, [1 - alpha / 2, alpha / 2])
+    fidelity = 2 * estimate - resampled.mean()
+    return tuple(float(np.clip(x, 0.0, 1.0)) for x in (fidelity, low, high))
+
+
+@dataclass(eq=False)
+class SampledPair:
+    qc1: QuantumCircuit
+    qc2: QuantumCircuit
+    ancilla: bool = True
+    first: bool = True
+    n: int = 2
+    name: str = None            # printed with the result
+    counts1: dict = None        # outcome → count so far (qc2's without its ancillas, see countsToOutcomes)
+    counts2: dict = None
+    methods: tuple = None       # the simulation methods of qc1 and qc2 (see simulation.choose)
+    interval: tuple = None      # (fidelity, low, high) after the last round
+    fidelity: float = None      # set once sampling stopped
+    callbacks: list = field(default_factory=list)   # called with the fidelity once known
+
+    @property
+    def shots(self) -> int:
+        return 0 if self.counts1 is None else sum(self.counts1.values())
+
+    def arrays(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        @returns the counts of qc1 and qc2 over the outcomes seen in either
+        """
+        outcomes = sorted(self.counts1.keys() | self.counts2.keys())
+        return (np.array([self.counts1.get(o, 0) for o in outcomes], dtype=np.float64),
+                np.array([self.counts2.get(o, 0) for o in outcomes], dtype=np.float64))
+
+
+class SampledValidation:
+    """
+    Compares the outcome distributions of many circuit pairs by sampling them on Aer.
+    Every round runs all the pairs still undecided as a single multi-experiment job (one per
+    simulation method, see simulation.choose), with a growing number of shots, so equivalent
+    (or clearly different) circuits stop after a few thousand shots instead of spending the
+    whole budget.
+    """
+    def __init__(self, max_shots = 100000, min_shots = DEFAULT_MIN_SHOTS, threshold = DEFAULT_THRESHOLD,
+                 tolerance = DEFAULT_TOLERANCE, confidence = DEFAULT_CONFIDENCE, seed = None, threads = 0):
+        self.max_shots = max_shots
+        self.min_shots = min(min_shots, max_shots)
+        self.threshold = threshold
+        self.tolerance = tolerance
+        self.confidence = confidence
+        self.seed = seed
+        self.threads = threads      # 0: all cores
+        self.pairs: list[SampledPair] = []
+
+    def add(self, qc1, qc2, ancilla = True, first = True, n = 2, name = None) -> SampledPair:
+        """
+        Queues the comparison of qc1 and qc2 (see validateExecute), decided by run()
+        """
+        pair = SampledPair(qc1, qc2, ancilla, first, n, name)
+        self.pairs.append(pair)
+        return pair
+
+    def decided(self, pair: SampledPair) -> bool:
+        if pair.shots >= self.max_shots:
+            return True
+        _, low, high = pair.interval
+        return high < self.threshold or low >= self.threshold or high - low <= 2 * self.tolerance
+
+    def run(self) -> list[float]:
+        """
+        Samples the queued pairs until each is decided
+        @returns their fidelities, in the order they were added
+        """
+        # imported here: only sampling needs the simulator
+        from qiskit import transpile
+        from qiskit_aer import AerSimulator
+
+        rng = np.random.default_rng(self.seed)
+        pending = [pair for pair in self.pairs if pair.fidelity is None]
+
+        # method → backend and the transpiled circuits it runs, each as (pair, 0 or 1)
+        backends, circuits, owners = {}, {}, {}
+        for pair in pending:
+            pair.methods = tuple(simulation.choose(qc).method for qc in (pair.qc1, pair.qc2))
+            for k, (qc, method) in enumerate(zip((pair.qc1, pair.qc2), pair.methods)):
+                if method not in backends:
+                    backends[method] = AerSimulator(method=method, max_parallel_threads=self.threads,
+                                                    max_parallel_experiments=0)
+                circuits.setdefault(method, []).append(qc.measure_all(inplace=False))
+                owners.setdefault(method, []).append((pair, k))
+        for method, backend in backends.items():
+            circuits[method] = transpile(circuits[method], backend, seed_transpiler=self.seed)
+
+        shots, rounds = self.min_shots, 0
+        while pending:
+            seed = None if self.seed is None else self.seed + rounds
+            for method, backend in backends.items():
+                experiments = [(qc, owner) for qc, owner in zip(circuits[method], owners[method]) if owner[0] in pending]
+                if not experiments:
+                    continue
+                result = backend.run([qc for qc, _ in experiments], shots=shots, seed_simulator=seed).result()
+                for i, (_, (pair, k)) in enumerate(experiments):
+                    traced = ancillaQubits(pair.qc2.num_qubits, pair.first, pair.n) if k == 1 and pair.ancilla else ()
+                    outcomes = countsToOutcomes(result.get_counts(i), traced)
+                    counts = (pair.counts1 if k == 0 else pair.counts2) or {}
+                    for outcome, count in outcomes.items():
+                        counts[outcome] = counts.get(outcome, 0) + count
+                    if k == 0:
+                        pair.counts1 = counts
+                    else:
+                        pair.counts2 = counts
+
+            for pair in pending:
+                pair.interval = hellingerInterval(*pair.arrays(), self.confidence, rng)
+            for pair in [pair for pair in pending if self.decided(pair)]:
+                self.finish(pair)
+                pending.remove(pair)
+            if pending:
+                # the pending pairs were all sampled as many times: double that, within the budget
+                taken = pending[0].shots
+                shots = min(taken, self.max_shots - taken)
+            rounds += 1
+
+        return [pair.fidelity for pair in self.pairs]
+
+    def finish(self, pair: SampledPair):
+        fidelity, low, high = pair.interval
+        c1, c2 = pair.arrays()
+        if pair.name is not None:
+            print(f"{pair.name}:")
+        print(f"TVD = {compareDistributions(c1 / c1.sum(), c2 / c2.sum())['tvd']}")
+        methods = pair.methods[0] if pair.methods[0] == pair.methods[1] else " / ".join(pair.methods)
+        print(f"Fidelity = {fidelity} ({self.confidence:.0%} CI [{low:.6f}, {high:.6f}], {pair.shots} shots, {methods})")
+        pair.fidelity = fidelity
+        for callback in pair.callbacks:
+            callback(fidelity)
+
+
+
+def validateExecute(qc1, qc2, ancilla=True, shots = 100000, first=True, n=2, **sampling):
+    """
+    Samples both circuits on Aer, with adaptively up to `shots` shots (see SampledValidation),
+    and compares the outcome frequencies (see validateExact, which computes them exactly)
+    @param sampling: the other options of SampledValidation
+    @returns the Hellinger fidelity of the two distributions
+    """
+    validation = SampledValidation(max_shots=shots, **sampling)
+    validation.add(qc1, qc2, ancilla=ancilla, first=first, n=n)
+    return validation.run()[0]
+
+
+
+def validateExact(qc1, qc2, ancilla=True, first=True, n=2, shots = 100000, **sampling):
+    """
+    Same comparison as validateExecute, on the exact outcome probabilities of the final states.
+    If the two dense distributions do not fit in simulation.memory_limit(), the fidelity of the
+    states is returned instead (validateNotExecute, a lower bound of the fidelity of the
+    distributions, which a few thousand shots cannot estimate over that many outcomes);
+    with ancillas the distributions are sampled (validateExecute, up to shots shots)
+    @returns the Hellinger fidelity of the two distributions
+    """
+    num_qubits = max(qc1.num_qubits, qc2.num_qubits)
+    # two statevectors and their probabilities
+    needed = 2 * (simulation.BYTES_PER_AMPLITUDE + 8) * 2**num_qubits
+    if needed > simulation.memory_limit():
+        if not ancilla:
+            print(f"Exact outcome probabilities of {num_qubits} qubits need {needed} bytes, over the memory limit: "
+                  "comparing the states")
+            return validateNotExecute(qc1, qc2)
+        print(f"Exact outcome probabilities of {num_qubits} qubits need {needed} bytes, over the memory limit: sampling them")
+        return validateExecute(qc1, qc2, ancilla=ancilla, shots=shots, first=first, n=n, **sampling)
+
+    print("Exact outcome probabilities (method: statevector)")
+    p1 = Statevector(qc1.remove_final_measurements(inplace=False)).probabilities()
+    p2 = Statevector(qc2.remove_final_measurements(inplace=False)).probabilities()
+
+    return _reportDistributions(p1, p2, ancilla, first, n)
+
+
+
+def validate(qc1, qc2, ancilla = False, execute = False, shots = 100000, first=True, n = 2, exact = False, **sampling):
+    """
+    execute compares the measurement outcome distributions, sampled for up to `shots` shots
+    (sampling: the options of SampledValidation) or, if exact, computed exactly; otherwise the final states are compared
+    """
+    if execute and exact: return validateExact (qc1, qc2, ancilla=ancilla, first=first, n = n, shots = shots, **sampling)
+    if execute: return validateExecute (qc1, qc2, ancilla=ancilla, shots = shots, first=first, n = n, **sampling)
     else : return validateNotExecute (qc1, qc2, ancilla=ancilla)
 
 
 
 if __name__ == "__main__":
+    from utils import importQASM, circuit_to_qiskit
+
     programs = importQASM("../inputs")
 
     qc1 = circuit_to_qiskit(programs.get("qft2"))
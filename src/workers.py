@@ -0,0 +1,84 @@
+"""
+Process pool that survives the death of a worker process.
+
+A worker that dies (out of memory, a crash in native code, ...) breaks a
+ProcessPoolExecutor: every task still in it fails with BrokenProcessPool, not
+only the one that killed it. WorkerPool then starts a fresh pool and reruns
+those tasks one at a time, so that a second crash is pinned on the task that
+caused it, which is reported as failed. The others run in parallel again once
+the suspects are cleared.
+"""
+import traceback
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+
+class WorkerPool:
+    def __init__(self, max_workers: int | None = None):
+        self.max_workers = max_workers
+        self.pool = ProcessPoolExecutor(max_workers=max_workers)
+        self.running = {}           # future → task (tag, fn, args)
+        self.suspects = deque()     # tasks that were running when the pool broke, rerun one at a time
+        self.queued = deque()       # tasks submitted while a suspect runs alone
+        self.isolated = False       # a suspect runs alone
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.pool.shutdown(cancel_futures=True)
+
+    def submit(self, tag, fn, *args):
+        """
+        Runs fn(*args) in a worker, completed() yields its result with tag
+        """
+        task = (tag, fn, args)
+        if self.isolated or self.suspects:
+            self.queued.append(task)
+        else:
+            self.start(task)
+
+    def start(self, task):
+        _, fn, args = task
+        self.running[self.pool.submit(fn, *args)] = task
+
+    def completed(self):
+        """
+        Waits for the tasks as they complete, including those submitted meanwhile
+        @returns (yields) tag, result and error per task: the result of fn and None, or None
+        and the traceback of the exception it raised (BrokenProcessPool if it killed its worker)
+        """
+        while self.running:
+            done, _ = wait(self.running, return_when=FIRST_COMPLETED)
+            broken = []     # (task, traceback)
+            for future in done:
+                task = self.running.pop(future)
+                try:
+                    result = future.result()
+                except BrokenProcessPool:
+                    broken.append((task, traceback.format_exc()))
+                    continue
+                except Exception:
+                    yield task[0], None, traceback.format_exc()
+                    continue
+                yield task[0], result, None
+
+            if broken:
+                # the tasks still running fail as well
+                broken += [(task, None) for task in self.running.values()]
+                self.running.clear()
+                self.pool.shutdown(cancel_futures=True)
+                self.pool = ProcessPoolExecutor(max_workers=self.max_workers)
+                if self.isolated:
+                    (task, error), = broken
+                    yield task[0], None, error
+                else:
+                    self.suspects.extend(task for task, _ in broken)
+
+            if not self.running:
+                self.isolated = bool(self.suspects)
+                if self.isolated:
+                    self.start(self.suspects.popleft())
+                while self.queued and not self.isolated:
+                    self.start(self.queued.popleft())